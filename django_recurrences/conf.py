@@ -0,0 +1,47 @@
+from __future__ import unicode_literals
+
+from django.conf import settings
+
+
+# Default values for the app settings. Each setting can be overridden in the
+# project settings file by prefixing the key with "RECURRENCES_". For example,
+# RECURRENCES_MAX_MATERIALIZED_OCCURRENCES = 500
+DEFAULTS = {
+    # The maximum number of occurrences that will be written to the
+    # materialized occurrence table for a single recurring object.
+    'MAX_MATERIALIZED_OCCURRENCES': 10000,
+    # The max number of compiled rrule objects to keep in the process wide
+    # cache. A value of 0 disables the cache.
+    'RRULE_CACHE_SIZE': 1000,
+    # If True, timings for the rule expansions are recorded in the in process
+    # stats registry (see django_recurrences.utils.stats).
+    'COLLECT_STATS': False,
+    # The number of days the dates of a recurrence without a count or until
+    # date are listed for when no end date is given. If None, an end date is
+    # required.
+    'OPEN_ENDED_HORIZON_DAYS': 365,
+    # The max number of dates that can be listed for a recurrence. A value of
+    # 0 or None removes the limit.
+    'MAX_OCCURRENCES': 100000,
+    # The max estimated number of candidate dates checked to list the dates of
+    # a recurrence (see django_recurrences.utils.cost). A value of 0 or None
+    # removes the limit.
+    'EXPANSION_BUDGET': 10000000,
+    # The max estimated cost of an expansion that's run on the event loop by
+    # the async API (see django_recurrences.utils.aio). More expensive
+    # expansions are run in the executor. A value of 0 or None runs all the
+    # expansions in the executor.
+    'ASYNC_INLINE_COST': 10000,
+}
+
+
+def get_setting(key):
+    """Gets the app setting for the key. The project settings are checked
+    first and the default value is returned if the setting hasn't been set.
+
+    >>> get_setting('MAX_MATERIALIZED_OCCURRENCES')
+    10000
+
+    :param key: the app setting key without the "RECURRENCES_" prefix.
+    """
+    return getattr(settings, 'RECURRENCES_{0}'.format(key), DEFAULTS[key])
@@ -4,6 +4,20 @@ from dateutil.rrule import YEARLY, MONTHLY, WEEKLY, DAILY, HOURLY, MINUTELY, \
 from django.utils.translation import ugettext_lazy as _
 
 
+class Engine(object):
+    """The engines that can expand the occurrences of a recurrence."""
+    DATEUTIL = 'dateutil'
+    NUMPY = 'numpy'
+    # Only reported by the instrumentation when a value is computed without
+    # expanding the occurrences.
+    ARITHMETIC = 'arithmetic'
+    # Only reported by explain() for the occurrence checks done with the
+    # compiled bit masks.
+    BITSETS = 'bitsets'
+    CHOICES = ((DATEUTIL, _('dateutil')),
+               (NUMPY, _('NumPy')))
+
+
 class Frequency(object):
     ONCE = -1
     YEARLY = YEARLY
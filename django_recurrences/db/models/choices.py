@@ -1,6 +1,9 @@
 from __future__ import unicode_literals
 
+from django.core.exceptions import ValidationError
+from django.utils.translation import ugettext_lazy as _
 from django_recurrences.constants import Day
+from django_recurrences.constants import Month
 
 
 def _base_choices(vals, reverse=False):
@@ -53,3 +56,52 @@ ZERO_TO_59 = _zero_to_num(59)  # Seconds, Minutes
 BY_SET_POS_CHOICES = Day.CHOICES + ((-1, -1),)
 BY_MONTH_DAY_CHOICES = ONE_TO_31 + NEG_31_TO_NEG_1
 BY_YEAR_DAY_CHOICES = ONE_TO_366 + NEG_366_TO_NEG_1
+
+
+def choice_values(choices):
+    """Gets a frozenset of the values of the choices."""
+    return frozenset(choice[0] for choice in choices)
+
+
+class ChoiceSetValidator(object):
+    """Validates that each item in a list is one of the valid values. The
+    valid values are a set so each item is checked in constant time instead
+    of scanning the choices.
+    """
+    message = _("'%(value)s' is not a valid choice.")
+    code = 'invalid_choice'
+
+    def __init__(self, valid_values, message=None, code=None):
+        """
+        :param valid_values: frozenset of the valid values.
+        :param message: the error message if an item isn't valid.
+        :param code: the error code if an item isn't valid.
+        """
+        self.valid_values = valid_values
+
+        if message is not None:
+            self.message = message
+
+        if code is not None:
+            self.code = code
+
+    def __call__(self, value):
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+
+        for item in value:
+            if item not in self.valid_values:
+                raise ValidationError(self.message, code=self.code,
+                                      params={'value': item})
+
+
+# The valid values of each BYxxx rule field
+BY_SET_POS_VALUES = choice_values(BY_SET_POS_CHOICES)
+BY_MONTH_VALUES = choice_values(Month.CHOICES_SHORT)
+BY_MONTH_DAY_VALUES = choice_values(BY_MONTH_DAY_CHOICES)
+BY_YEAR_DAY_VALUES = choice_values(BY_YEAR_DAY_CHOICES)
+BY_WEEK_NO_VALUES = choice_values(ONE_TO_53)
+BY_WEEKDAY_VALUES = choice_values(Day.CHOICES)
+BY_HOUR_VALUES = choice_values(ZERO_TO_59)
+BY_MINUTE_VALUES = choice_values(ZERO_TO_59)
+BY_SECOND_VALUES = choice_values(ZERO_TO_59)
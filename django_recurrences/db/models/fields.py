@@ -0,0 +1,79 @@
+from __future__ import unicode_literals
+
+from django.core.exceptions import ValidationError
+from django_core.db.models.fields import IntegerListField
+from django_core.db.models.fields import ListField
+
+from ...forms.fields import IntegerListChoiceField
+from .choices import ChoiceSetValidator
+from .choices import choice_values
+
+
+class RuleListField(IntegerListField):
+    """Integer list field for the BYxxx rrule fields.
+
+    IntegerListField checks each item in the list by scanning a tuple of the
+    choice values, so validating a long byyearday list is quadratic. This
+    field checks the items against a set of the valid values instead.
+    """
+
+    def __init__(self, valid_values=None, *args, **kwargs):
+        """
+        :param valid_values: frozenset of the valid item values. Defaults to
+            the values of the choices.
+        """
+        super(RuleListField, self).__init__(*args, **kwargs)
+
+        if valid_values is None and self.choices:
+            valid_values = choice_values(self.choices)
+
+        self.valid_values = valid_values
+        self.choice_validator = None
+
+        if valid_values is not None:
+            self.choice_validator = ChoiceSetValidator(
+                valid_values,
+                message=self.error_messages['invalid_choice']
+            )
+            self.validators.append(self.choice_validator)
+
+    def to_python(self, value):
+        if (self.choice_validator is None or not isinstance(value, list) or
+                not value):
+            return super(RuleListField, self).to_python(value)
+
+        try:
+            value = [int(item) for item in value]
+        except (TypeError, ValueError):
+            raise ValidationError(
+                self.error_messages['invalid_integers'],
+                code='invalid_integers',
+                params={'value': value}
+            )
+
+        self.choice_validator(value)
+        return value
+
+    def validate(self, value, model_instance):
+        """Validates the value is set when the field is required. The list
+        items are checked by the choice validator when the validators are run.
+        """
+        if not self.editable:
+            return
+
+        if value is None and not self.null:
+            raise ValidationError(self.error_messages['null'], code='null')
+
+        if not self.blank and value in self.empty_values:
+            raise ValidationError(self.error_messages['blank'], code='blank')
+
+    def formfield(self, **kwargs):
+        defaults = {'form_class': self.get_form_class()}
+
+        if self.choices:
+            defaults['choices_form_class'] = IntegerListChoiceField
+            defaults['coerce'] = int
+
+        defaults.update(kwargs)
+        # ListField.formfield doesn't pass the choices_form_class on
+        return super(ListField, self).formfield(**defaults)
@@ -1,10 +1,227 @@
+import calendar
+from datetime import datetime
+from datetime import time
+
+from django.conf import settings
+from django.db import connections
 from django.db import models
+from django.db import router
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.db.models.query import QuerySet
 from django_recurrences.constants import Frequency
+from django_recurrences.exceptions import RecurrenceError
+from django_recurrences.utils import sql
+from django_recurrences.utils.aio import AsyncRecurrenceManagerMixin
+from django_recurrences.utils.aio import AsyncRecurrenceQuerySetMixin
+
+
+# The max number of objects updated or loaded per query by the bulk methods
+# when a batch size isn't given. This keeps the "IN" lists under the query
+# parameter limits of the databases.
+DEFAULT_BATCH_SIZE = 500
+
+
+class RecurrenceQuerySet(AsyncRecurrenceQuerySetMixin, QuerySet):
+    """QuerySet for recurrence objects."""
+
+    def overlapping(self, start, end):
+        """Narrows the queryset, in the database, to the objects whose
+        recurrence window overlaps the start and end dates. Objects without
+        an end date are open ended so they're always included when they start
+        before the end date.
+
+        :param start: the start of the date range.
+        :param end: the end of the date range.
+        """
+        return self.filter(Q(end_date__gte=start) | Q(end_date__isnull=True),
+                           start_date__lte=end)
+
+    def occurring_between(self, start, end, errors=None):
+        """Gets all the occurrences between the start and end dates
+        (inclusive). Objects are first narrowed in the database and only the
+        remaining objects have their recurrence expanded with get_dates.
+
+        Objects whose dates can't be listed, because the rule is over the
+        expansion budget or has more than RECURRENCES_MAX_OCCURRENCES
+        occurrences in the range, are skipped so one rule doesn't fail the
+        whole query.
+
+        Returns a list of (object, occurrence) tuples ordered by the
+        occurrence date.
+
+        :param start: the start of the date range.
+        :param end: the end of the date range.
+        :param errors: optional list. An (object, exception) tuple is appended
+            for each skipped object.
+        """
+        occurrences = []
+
+        for obj in self.overlapping(start=start, end=end).iterator():
+            try:
+                dates = obj.get_dates(after=start, before=end)
+            except RecurrenceError as e:
+                if errors is not None:
+                    errors.append((obj, e))
+
+                continue
+
+            occurrences.extend((obj, date) for date in dates)
+
+        occurrences.sort(key=lambda occurrence: occurrence[1])
+        return occurrences
+
+    def occurrences_sql(self, start, end):
+        """Gets the (sql, params) for a query that generates the
+        (object_id, start) rows of the occurrences between the start and end
+        dates (inclusive) in the database with a WITH RECURSIVE query. The
+        query can be used as a subquery to join or aggregate the occurrences
+        without loading them.
+
+        Only DAILY, WEEKLY and HOURLY rules without any BYxxx fields and non
+        recurring objects are included. The other objects need to be expanded
+        with rrule (see occurring_between).
+
+        :param start: the start of the date range.
+        :param end: the end of the date range.
+        """
+        return sql.get_occurrences_sql(self, start=start, end=end)
+
+    def count_occurrences_by_day(self, start, end):
+        """Gets a list of (date, count) tuples with the number of
+        occurrences on each day between the start and end dates (inclusive).
+        The simple rules are counted with a single aggregate query in the
+        database (see occurrences_sql) and only the remaining objects are
+        expanded with rrule.
 
+        :param start: the start of the date range.
+        :param end: the end of the date range.
+        """
+        return sql.count_by_day(self, start=start, end=end)
 
-class RecurrenceManager(models.Manager):
+    def bulk_set_recurrence(self, freq, start_date, end_date=None, interval=1,
+                            count=None, batch_size=None, **kwargs):
+        """Sets the same recurrence on all the objects in the queryset. The end
+        date is computed once and the objects are written with UPDATE queries
+        instead of saving each object. See
+        AbstractRecurrenceModelMixin.set_recurrence for the recurrence params.
+
+        For models with materialize_occurrences = True, the occurrences of the
+        updated objects are synced in the same transaction.
+
+        Returns the number of updated rows.
+
+        :param batch_size: if given, the objects are updated in chunks of
+            this many objects instead of with a single UPDATE query.
+        """
+        obj = self.model()
+        obj.set_recurrence(freq=freq, start_date=start_date,
+                           end_date=end_date, interval=interval, count=count,
+                           **kwargs)
+        obj.set_computed_fields()
+        values = obj.get_recurrence_db_values()
+
+        if not self.model.materialize_occurrences:
+            if not batch_size:
+                return self.update(**values)
+
+            return self._update_in_batches(list(self.values_list('pk',
+                                                                 flat=True)),
+                                           values, batch_size)
+
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            pks = list(self.values_list('pk', flat=True))
+            updated = self._update_in_batches(pks, values, batch_size)
+            manager = self.model._default_manager
+            batch_size = batch_size or DEFAULT_BATCH_SIZE
+
+            for i in range(0, len(pks), batch_size):
+                for obj in manager.filter(pk__in=pks[i:i + batch_size]):
+                    obj.sync_occurrences()
+
+        return updated
+
+    def _update_in_batches(self, pks, values, batch_size=None):
+        """Updates the objects with the primary keys in chunks of batch_size
+        objects and returns the number of updated rows.
+        """
+        manager = self.model._default_manager
+        batch_size = batch_size or DEFAULT_BATCH_SIZE
+        updated = 0
+
+        for i in range(0, len(pks), batch_size):
+            updated += manager.filter(pk__in=pks[i:i + batch_size]).update(
+                                                                    **values)
+
+        return updated
+
+
+class RecurrenceManager(AsyncRecurrenceManagerMixin, models.Manager):
     """Object manager for recurrence."""
 
+    def get_queryset(self):
+        return RecurrenceQuerySet(self.model, using=self._db)
+
+    def overlapping(self, start, end):
+        return self.get_queryset().overlapping(start=start, end=end)
+
+    def occurring_between(self, start, end, errors=None):
+        return self.get_queryset().occurring_between(start=start, end=end,
+                                                     errors=errors)
+
+    def occurrences_sql(self, start, end):
+        return self.get_queryset().occurrences_sql(start=start, end=end)
+
+    def count_occurrences_by_day(self, start, end):
+        return self.get_queryset().count_occurrences_by_day(start=start,
+                                                            end=end)
+
+    def bulk_set_recurrence(self, *args, **kwargs):
+        return self.get_queryset().bulk_set_recurrence(*args, **kwargs)
+
+    def bulk_create_recurrences(self, objs, batch_size=None):
+        """Creates the recurring objects with batched INSERT queries. Unlike
+        bulk_create, the end dates are computed for objects that don't have
+        one, along with the other computed fields (see
+        set_computed_fields). Objects with identical recurrence rules only have
+        their end date computed once.
+
+        For models with materialize_occurrences = True, the objects are saved
+        one at a time in a single transaction instead so their occurrences are
+        written. bulk_create doesn't set the primary keys on every database.
+
+        :param objs: list of unsaved recurrence model objects.
+        :param batch_size: the max number of objects created in each query.
+        """
+        end_dates = {}
+
+        for obj in objs:
+            if obj.freq == Frequency.ONCE:
+                # Not a recurring item
+                obj.freq = None
+                obj.end_date = obj.start_date
+
+            if not obj.end_date:
+                recurrence = obj.get_recurrence(frozen=True)
+
+                if recurrence not in end_dates:
+                    end_dates[recurrence] = obj.get_end_date_from_recurrence(
+                                                        recurrence=recurrence)
+
+                obj.end_date = end_dates[recurrence]
+
+            obj.set_computed_fields()
+
+        if not self.model.materialize_occurrences:
+            return self.bulk_create(objs, batch_size=batch_size)
+
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            for obj in objs:
+                obj.save(force_insert=True, using=self.db)
+
+        return objs
+
     def create(self, start_date, end_date=None, freq=Frequency.ONCE, **kwargs):
 
         if freq == Frequency.ONCE:
@@ -17,3 +234,113 @@ class RecurrenceManager(models.Manager):
                                                      end_date=end_date,
                                                      freq=freq,
                                                      **kwargs)
+
+
+class DayMaskQuerySet(RecurrenceQuerySet):
+    """QuerySet for recurrence objects with day mask fields (see
+    AbstractDayMaskModelMixin).
+    """
+
+    def could_occur_on(self, day):
+        """Narrows the queryset, in the database, to the objects that could
+        occur on the day. Objects are excluded when their recurrence window
+        doesn't include the day or their weekday, month or month day filters
+        exclude the day. The remaining objects still need to be expanded to
+        know if they occur on the day.
+
+        :param day: the date to check.
+        """
+        if isinstance(day, datetime):
+            day_start = datetime.combine(day.date(), time.min).replace(
+                                                        tzinfo=day.tzinfo)
+        else:
+            day_start = datetime.combine(day, time.min)
+
+            if settings.USE_TZ:
+                day_start = timezone.make_aware(
+                                    day_start, timezone.get_current_timezone())
+
+        day_end = day_start.replace(hour=23, minute=59, second=59,
+                                    microsecond=999999)
+        month_days = calendar.monthrange(day_start.year, day_start.month)[1]
+
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+
+        def _column(name):
+            return '{0}.{1}'.format(table, connection.ops.quote_name(name))
+
+        def _has_bit(name):
+            return '({0} <> 0)'.format(connection.ops.combine_expression(
+                                                '&', [_column(name), '%s']))
+
+        # A mask of 0 means the rule doesn't filter by the value.
+        where = [
+            '({0} = 0 OR {1})'.format(_column('weekday_mask'),
+                                      _has_bit('weekday_mask')),
+            '({0} = 0 OR {1})'.format(_column('month_mask'),
+                                      _has_bit('month_mask')),
+            '(({0} = 0 AND {1} = 0) OR {2} OR {3})'.format(
+                                            _column('month_day_mask'),
+                                            _column('neg_month_day_mask'),
+                                            _has_bit('month_day_mask'),
+                                            _has_bit('neg_month_day_mask'))
+        ]
+        params = [1 << day_start.weekday(),
+                  1 << (day_start.month - 1),
+                  1 << (day_start.day - 1),
+                  1 << (month_days - day_start.day)]
+
+        single = Q(freq__isnull=True, start_date__gte=day_start,
+                   start_date__lte=day_end)
+        recurring = Q(Q(end_date__gte=day_start) | Q(end_date__isnull=True),
+                      freq__isnull=False, start_date__lte=day_end)
+
+        return self.filter(single | recurring).extra(where=where,
+                                                     params=params)
+
+
+class DayMaskManager(RecurrenceManager):
+    """Object manager for recurrence objects with day mask fields."""
+
+    def get_queryset(self):
+        return DayMaskQuerySet(self.model, using=self._db)
+
+    def could_occur_on(self, day):
+        return self.get_queryset().could_occur_on(day)
+
+
+class OccurrenceManager(models.Manager):
+    """Object manager for materialized occurrences."""
+
+    def for_object(self, obj):
+        """Gets the occurrences for a recurring object.
+
+        :param obj: the recurring object to get the occurrences for.
+        """
+        from django.contrib.contenttypes.models import ContentType
+        content_type = ContentType.objects.get_for_model(obj)
+        return self.filter(content_type=content_type, object_id=obj.id)
+
+    def for_model(self, model):
+        """Gets the occurrences for all objects of a recurring model.
+
+        :param model: the recurring model class or instance.
+        """
+        from django.contrib.contenttypes.models import ContentType
+        content_type = ContentType.objects.get_for_model(model)
+        return self.filter(content_type=content_type)
+
+    def between(self, start, end, model=None):
+        """Gets the occurrences that start between the start and end dates
+        (inclusive). This is a single query that uses the index on the
+        occurrence start.
+
+        :param start: the start of the date range.
+        :param end: the end of the date range.
+        :param model: optional recurring model class to limit the occurrences
+            to.
+        """
+        queryset = self.for_model(model) if model else self.all()
+        return queryset.filter(start__gte=start,
+                               start__lte=end).order_by('start')
@@ -1,20 +1,51 @@
 from __future__ import unicode_literals
 
-from dateutil.rrule import rrule
+from collections import deque
+from itertools import islice
+
 from django.db import models
+from django.db import router
+from django.db import transaction
+from django.utils import timezone
 from django.utils.translation import ugettext as _
-from django_core.db.models.fields import IntegerListField
-from django_recurrences.utils.converters import int_to_weekday
+from django_recurrences.utils.arithmetic import get_last_occurrence
+from django_recurrences.utils.converters import parse_rrule_str
+from django_recurrences.utils.converters import to_rrule_str
+from django_recurrences.utils.formatting import recurrence_to_str
 
+from ...conf import get_setting
 from ...constants import Day
+from ...constants import Engine
 from ...constants import Frequency
 from ...constants import Month
+from ...exceptions import RecurrenceError
+from ...rrule import _get_int
+from ...rrule import _get_rrule_int_list
+from ...rrule import check_occurrences
+from ...rrule import get_list_limit
+from ...rrule import list_dates
+from ...rrule import window_dates
+from ...utils import stats
+from ...utils.aio import AsyncRecurrenceModelMixin
+from ...utils.bitsets import get_day_fields
+from ...utils.bitsets import to_mask
+from ...utils.cost import check_budget
+from .choices import BY_HOUR_VALUES
+from .choices import BY_MINUTE_VALUES
 from .choices import BY_MONTH_DAY_CHOICES
+from .choices import BY_MONTH_DAY_VALUES
+from .choices import BY_MONTH_VALUES
+from .choices import BY_SECOND_VALUES
 from .choices import BY_SET_POS_CHOICES
+from .choices import BY_SET_POS_VALUES
+from .choices import BY_WEEK_NO_VALUES
+from .choices import BY_WEEKDAY_VALUES
 from .choices import BY_YEAR_DAY_CHOICES
+from .choices import BY_YEAR_DAY_VALUES
 from .choices import ONE_TO_31
 from .choices import ONE_TO_53
 from .choices import ZERO_TO_59
+from .fields import RuleListField
 from .help_text import BY_EASTER_HELP_TEXT
 from .help_text import BY_HOUR_HELP_TEXT
 from .help_text import BY_MINUTE_HELP_TEXT
@@ -22,11 +53,13 @@ from .help_text import BY_MONTH_DAY_HELP_TEXT
 from .help_text import BY_SECOND_HELP_TEXT
 from .help_text import BY_WEEK_NUMBER_HELP_TEXT
 from .help_text import BY_YEAR_DAY_HELP_TEXT
+from .managers import DayMaskManager
 from .managers import RecurrenceManager
 
 
-class AbstractRecurrenceModelMixin(models.Model):
-    """A model mixin for recurrence based on rrule.
+class BaseRecurrenceModelMixin(AsyncRecurrenceModelMixin, models.Model):
+    """The base model mixin for recurrence based on rrule. Subclasses define
+    how the recurrence rule values are stored.
 
     For rules see:
 
@@ -37,53 +70,39 @@ class AbstractRecurrenceModelMixin(models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField(blank=True, null=True)
 
-    # Recurrence Rule fields
-    freq = models.PositiveIntegerField(choices=Frequency.CHOICES, blank=True,
-                                       null=True)
-    interval = models.PositiveIntegerField(choices=ONE_TO_31, default=1,
-                                           blank=True, null=True)
-    wkst = models.PositiveIntegerField(verbose_name=_('Week Start Day'),
-                                       choices=Day.CHOICES, blank=True,
-                                       null=True)
-    count = models.PositiveIntegerField(verbose_name=_('Total Occurrences'),
-                                        blank=True, null=True)
-    bysetpos = IntegerListField(verbose_name=_('By Set Position'),
-                                choices=BY_SET_POS_CHOICES, max_length=25,
-                                blank=True, null=True)
-    byyearday = IntegerListField(verbose_name=_('By Year Day'),
-                                 choices=BY_YEAR_DAY_CHOICES, max_length=1500,
-                                 blank=True, null=True,
-                                 help_text=BY_YEAR_DAY_HELP_TEXT)
-    bymonth = IntegerListField(verbose_name=_('By Month'),
-                               choices=Month.CHOICES_SHORT, max_length=25,
-                               blank=True, null=True)
-    bymonthday = IntegerListField(verbose_name=('By Month Day'),
-                                  choices=BY_MONTH_DAY_CHOICES, max_length=200,
-                                  blank=True, null=True,
-                                  help_text=BY_MONTH_DAY_HELP_TEXT)
-    byweekno = IntegerListField(verbose_name=_('By Week Number'),
-                                choices=ONE_TO_53, max_length=200, blank=True,
-                                null=True, help_text=BY_WEEK_NUMBER_HELP_TEXT)
-    byweekday = IntegerListField(verbose_name=_('By Weekday'),
-                                 choices=Day.CHOICES, max_length=25,
-                                 blank=True, null=True)
-    byhour = IntegerListField(verbose_name=_('By Hour'), choices=ZERO_TO_59,
-                              max_length=200, blank=True, null=True,
-                              help_text=BY_HOUR_HELP_TEXT)
-    byminute = IntegerListField(verbose_name=_('By Minute'),
-                                choices=ZERO_TO_59, max_length=200, blank=True,
-                                null=True, help_text=BY_MINUTE_HELP_TEXT)
-    bysecond = IntegerListField(verbose_name=_('By Second'),
-                                choices=ZERO_TO_59, max_length=200, blank=True,
-                                null=True, help_text=BY_SECOND_HELP_TEXT)
-    byeaster = IntegerListField(verbose_name=_('By Easter'), max_length=100,
-                                blank=True, null=True,
-                                help_text=BY_EASTER_HELP_TEXT)
-
     objects = RecurrenceManager()
 
+    # If True, the occurrences for the object are written to the Occurrence
+    # table each time the object is saved so date range lookups can be done
+    # in the database.
+    materialize_occurrences = False
+
+    # Assigning any of these attributes clears the cached recurrence and
+    # rrule.
+    recurrence_attr_names = frozenset([
+        'start_date', 'end_date', 'freq', 'interval', 'wkst', 'count',
+        'bysetpos', 'bymonth', 'bymonthday', 'byyearday', 'byeaster',
+        'byweekno', 'byweekday', 'byhour', 'byminute', 'bysecond', 'rrule'
+    ])
+
     class Meta:
         abstract = True
+        index_together = (('start_date', 'end_date'),)
+
+    def __setattr__(self, name, value):
+        if name in self.recurrence_attr_names:
+            self.__dict__.pop('_cached_recurrence', None)
+            self.__dict__.pop('_cached_rrule', None)
+
+        super(BaseRecurrenceModelMixin, self).__setattr__(name, value)
+
+    def __reduce__(self):
+        # The cached recurrence and rrule aren't pickled
+        reduced = super(BaseRecurrenceModelMixin, self).__reduce__()
+        state = dict(reduced[2])
+        state.pop('_cached_recurrence', None)
+        state.pop('_cached_rrule', None)
+        return reduced[:2] + (state,) + reduced[3:]
 
     @property
     def dtstart(self):
@@ -103,14 +122,97 @@ class AbstractRecurrenceModelMixin(models.Model):
 
     @property
     def recurrence(self):
+        """A new Recurrence object for the recurrence fields of the object.
+        Changing it doesn't change the object.
+        """
         return self.get_recurrence()
 
+    @property
+    def frozen_recurrence(self):
+        """The cached, immutable FrozenRecurrence for the object. It's cached
+        until a recurrence field is assigned.
+        """
+        return self.get_recurrence(frozen=True)
+
     def save(self, *args, **kwargs):
 
         if not self.end_date:
             self.end_date = self.get_end_date_from_recurrence()
 
-        return super(AbstractRecurrenceModelMixin, self).save(*args, **kwargs)
+        self.set_computed_fields()
+
+        if not self.materialize_occurrences:
+            return super(BaseRecurrenceModelMixin, self).save(*args, **kwargs)
+
+        # The object and its occurrences are written together so readers
+        # never see the object without its occurrences
+        with transaction.atomic(using=self._get_write_db(kwargs)):
+            saved = super(BaseRecurrenceModelMixin, self).save(*args,
+                                                               **kwargs)
+            self.sync_occurrences()
+
+        return saved
+
+    def set_computed_fields(self):
+        """Sets the fields that are computed from the recurrence, other than
+        the end date. This is called before the object is written by save()
+        and by the manager methods that write objects without calling save().
+        Sub classes that store values computed from the rule extend this.
+        """
+        pass
+
+    def delete(self, *args, **kwargs):
+        if not self.materialize_occurrences:
+            return super(BaseRecurrenceModelMixin, self).delete(*args,
+                                                                **kwargs)
+
+        with transaction.atomic(using=self._get_write_db(kwargs)):
+            self.get_occurrences().delete()
+            return super(BaseRecurrenceModelMixin, self).delete(*args,
+                                                                **kwargs)
+
+    def _get_write_db(self, kwargs):
+        """Gets the database alias save() and delete() write to."""
+        return kwargs.get('using') or router.db_for_write(self.__class__,
+                                                          instance=self)
+
+    def get_occurrences(self):
+        """Gets the materialized occurrences queryset for this object."""
+        from ...models import Occurrence
+        return Occurrence.objects.for_object(self)
+
+    def sync_occurrences(self):
+        """Rewrites the materialized occurrences for this object so they
+        match the current recurrence rule. The number of occurrences written
+        is capped by the RECURRENCES_MAX_MATERIALIZED_OCCURRENCES setting.
+        The dates are expanded before the old occurrences are deleted and the
+        rewrite is done in a transaction. Raises ExpansionBudgetExceeded when
+        the rule is too expensive to expand, which rolls back the save.
+        """
+        from django.contrib.contenttypes.models import ContentType
+        from ...models import Occurrence
+
+        limit = get_setting('MAX_MATERIALIZED_OCCURRENCES')
+        recurrence = self.get_recurrence(frozen=True)
+
+        if recurrence.is_recurring():
+            check_budget(recurrence, limit=limit)
+
+        # Rules that dateutil can't build fall back to the start date like
+        # get_dates
+        all_dates, exception = self._get_all_dates(recurrence)
+        dates = list(islice(all_dates, limit))
+
+        content_type = ContentType.objects.get_for_model(self)
+        occurrences = [Occurrence(content_type=content_type,
+                                  object_id=self.id,
+                                  start=date,
+                                  ordinal=ordinal)
+                       for ordinal, date in enumerate(dates, start=1)]
+
+        with transaction.atomic(using=router.db_for_write(Occurrence)):
+            self.get_occurrences().delete()
+            Occurrence.objects.bulk_create(occurrences)
 
     def set_recurrence(self, freq, start_date, end_date=None, interval=1,
                        count=None, **kwargs):
@@ -216,8 +318,38 @@ class AbstractRecurrenceModelMixin(models.Model):
             self.end_date = end_date
             self.end_date = self.get_end_date_from_recurrence()
 
-    def get_recurrence(self):
-        """Returns a dict of all the recurrence fields that have a value."""
+        self.clear_recurrence_cache()
+
+    def clear_recurrence_cache(self):
+        """Clears the cached recurrence and rrule. Assigning a recurrence
+        field already does this, but changing a list field value in place,
+        like obj.byweekday.append(0), doesn't.
+        """
+        self.__dict__.pop('_cached_recurrence', None)
+        self.__dict__.pop('_cached_rrule', None)
+
+    def get_recurrence(self, frozen=False):
+        """Returns a recurrence object for all the recurrence fields that have
+        a value.
+
+        :param frozen: if True, an immutable FrozenRecurrence is returned. The
+            frozen recurrence is cached on the object until a recurrence field
+            is assigned.
+        """
+        if frozen:
+            if '_cached_recurrence' not in self.__dict__:
+                self._cached_recurrence = self.get_recurrence().freeze()
+
+            return self._cached_recurrence
+
+        # To avoid naming collisions
+        from ...rrule import Recurrence
+        return Recurrence(**self.get_recurrence_kwargs())
+
+    def get_recurrence_kwargs(self):
+        """Gets the dict of recurrence kwargs for all the recurrence fields
+        that have a value.
+        """
         recurrence = {'dtstart': self.start_date,
                       'until': self.end_date}
 
@@ -226,39 +358,239 @@ class AbstractRecurrenceModelMixin(models.Model):
             if val != None:
                 recurrence[field] = val
 
-        # To avoid naming collisions
-        from ...rrule import Recurrence
-        return Recurrence(**recurrence)
+        return recurrence
 
     def get_rrule(self, recurrence=None):
         """Gets rrule object based on the recurrence values.
 
-        :param recurrence: recurrence object to get rrule for. If None, this
-            will generate the recurrence object based on model values.
+        :param recurrence: recurrence object to get rrule for. If None, the
+            rrule for the model values is returned and cached on the object
+            until a recurrence field is assigned.
         """
-        if not recurrence:
-            recurrence = self.get_recurrence()
+        if (recurrence and
+            recurrence is not self.__dict__.get('_cached_recurrence')):
+            return self._build_rrule(recurrence)
+
+        if '_cached_rrule' not in self.__dict__:
+            self._cached_rrule = self._build_rrule(
+                                        self.get_recurrence(frozen=True))
+
+        return self._cached_rrule
 
-        return rrule(**recurrence.to_dict())
+    def _build_rrule(self, recurrence):
+        """Gets the instrumented rrule for the recurrence."""
+        started = stats.start_timer()
+        rule = recurrence.get_rrule()
+        stats.report(self.__class__, 'get_rrule', recurrence, started,
+                     engine=Engine.DATEUTIL)
+        return rule
 
     def is_recurring(self):
         """Boolean indicating if the object is recurring."""
-        return self.get_recurrence().is_recurring()
+        return self.get_recurrence(frozen=True).is_recurring()
 
-    def get_dates(self):
-        """Gets the dates for the frequency using rrule."""
-        recurrence = self.get_recurrence()
+    def iter_dates(self, after=None, before=None, limit=None):
+        """Lazily iterates the dates for the frequency using rrule. The window
+        is inclusive so dates equal to after or before are included. Raises
+        ExpansionBudgetExceeded when the estimated cost of the expansion is
+        over budget.
 
-        if not recurrence.is_recurring():
-            return [self.start_date]
+        :param after: only include dates on or after this date.
+        :param before: only include dates on or before this date.
+        :param limit: the max number of dates to yield.
+        """
+        check_budget(self.get_recurrence(frozen=True), after=after,
+                     before=before, limit=limit)
+        dates, exception = self._get_all_dates()
+
+        for dt in window_dates(dates, after=after, before=before,
+                               limit=limit):
+            yield dt
+
+    def _get_all_dates(self, recurrence=None):
+        """Gets a (dates, exception) tuple. The dates are the rrule for the
+        recurrence or a list of the start date if the object isn't recurring
+        or the rrule couldn't be built. The exception is the exception that
+        was raised building the rrule or None.
+        """
+        if not recurrence:
+            recurrence = self.get_recurrence(frozen=True)
+
+        if recurrence.is_recurring():
+            try:
+                return self.get_rrule(recurrence=recurrence), None
+            except Exception as e:
+                return [self.start_date], e
+
+        return [self.start_date], None
+
+    def get_dates(self, after=None, before=None, limit=None, engine=None):
+        """Gets the dates for the frequency using rrule. See iter_dates for
+        the params. Open ended rules are only listed until the horizon when
+        before isn't given, the number of dates is capped by the
+        RECURRENCES_MAX_OCCURRENCES setting and rules that are too expensive to
+        expand raise ExpansionBudgetExceeded (see Recurrence.get_dates).
+
+        :param engine: the engine used to expand the occurrences. If
+            Engine.NUMPY, a numpy.datetime64 array is returned instead of a
+            list.
+        """
+        started = stats.start_timer()
+        recurrence = self.get_recurrence(frozen=True)
+        used_engine = Engine.DATEUTIL
+        exception = None
 
         try:
-            return list(self.get_rrule(recurrence=recurrence))
+            before = recurrence.get_window_end(after=after, before=before)
+
+            if engine == Engine.NUMPY:
+                from ...utils import vectorized
+
+                if vectorized.is_supported(recurrence, before=before):
+                    used_engine = Engine.NUMPY
+
+                dates = recurrence.get_dates(after=after, before=before,
+                                             limit=limit, engine=engine)
+            else:
+                check_budget(recurrence, after=after, before=before,
+                             limit=limit)
+                all_dates, exception = self._get_all_dates(recurrence)
+                dates = list_dates(window_dates(all_dates, after=after,
+                                                before=before), limit=limit)
+        except (ImportError, RecurrenceError):
+            raise
         except Exception as e:
-            return [self.start_date]
+            exception = e
+            dates = list(window_dates([self.start_date], after=after,
+                                      before=before, limit=limit))
+
+            if engine == Engine.NUMPY:
+                from ...utils.vectorized import to_dates_array
+                dates = to_dates_array(dates)
+
+        stats.report(self.__class__, 'get_dates', recurrence, started,
+                     occurrences=len(dates), engine=used_engine,
+                     exception=exception)
+        return dates
+
+    def explain(self, after=None, before=None, limit=None, engine=None):
+        """Describes how the dates of the object would be expanded. See
+        django_recurrences.utils.cost.explain.
+        """
+        return self.get_recurrence(frozen=True).explain(after=after,
+                                                        before=before,
+                                                        limit=limit,
+                                                        engine=engine)
+
+    def count_between(self, start, end):
+        """Counts the occurrences between the start and end dates
+        (inclusive) without building a list of the dates.
+
+        :param start: the start of the date range.
+        :param end: the end of the date range.
+        """
+        try:
+            return self.get_recurrence(frozen=True).count_between(start, end)
+        except Exception as e:
+            return len(list(window_dates([self.start_date], after=start,
+                                         before=end)))
+
+    def occurs_at(self, dt):
+        """Boolean indicating if the datetime is an occurrence of the object.
+
+        :param dt: the datetime to check.
+        """
+        try:
+            return self.get_recurrence(frozen=True).occurs_at(dt)
+        except Exception as e:
+            return dt == self.start_date
+
+    def get_next_occurrence(self, after=None, recurrence=None):
+        """Gets the first occurrence on or after a date. Returns None when
+        there aren't any more occurrences.
+
+        :param after: the date to get the next occurrence for. Defaults to now.
+        :param recurrence: recurrence object to get the next occurrence for. If
+            None, this will generate the recurrence object based on model
+            values.
+        """
+        if after is None:
+            after = timezone.now()
+
+        if not recurrence:
+            recurrence = self.get_recurrence(frozen=True)
+
+        if recurrence.is_recurring():
+            try:
+                return self.get_rrule(recurrence=recurrence).after(after,
+                                                                   inc=True)
+            except Exception as e:
+                pass
+
+        return self.start_date if self.start_date >= after else None
+
+    def get_end_date_from_recurrence(self, recurrence=None):
+        """Gets the date of the last occurrence. When possible, the last
+        occurrence is computed arithmetically instead of expanding every
+        occurrence of the rule. Returns None for open ended rules, which don't
+        have a count or until date. Rules that have to be expanded raise
+        ExpansionBudgetExceeded or TooManyOccurrences like get_dates.
+
+        :param recurrence: recurrence object to get the end date for. If None,
+            this will generate the recurrence object based on model values.
+        """
+        if not recurrence:
+            recurrence = self.get_recurrence(frozen=True)
+
+        if not recurrence.is_recurring():
+            return self.start_date
+
+        if recurrence.is_open_ended():
+            # Expanding every occurrence would never finish
+            return None
+
+        started = stats.start_timer()
+        end_date = get_last_occurrence(recurrence)
 
-    def get_end_date_from_recurrence(self):
-        return self.get_dates()[-1]
+        if end_date is not None:
+            stats.report(self.__class__, 'get_end_date', recurrence, started,
+                         engine=Engine.ARITHMETIC)
+            return end_date
+
+        # The remaining rules are expanded, so they're limited like get_dates
+        check_budget(recurrence)
+        list_limit = get_list_limit()
+
+        try:
+            dates = self.get_rrule(recurrence=recurrence)
+
+            if list_limit is not None:
+                dates = islice(dates, list_limit)
+
+            # Only keep the last occurrence in memory
+            dates = deque(enumerate(dates, start=1), maxlen=1)
+        except Exception as e:
+            stats.report(self.__class__, 'get_end_date', recurrence, started,
+                         engine=Engine.DATEUTIL, exception=e)
+            return self.start_date
+
+        stats.report(self.__class__, 'get_end_date', recurrence, started,
+                     engine=Engine.DATEUTIL)
+        num_dates, end_date = dates[-1]
+        check_occurrences(num_dates)
+        return end_date
+
+    def get_recurrence_db_values(self):
+        """Gets a dict of the database field values that store the recurrence
+        keyed by the model field name.
+        """
+        field_names = self.get_recurrence_field_names(
+                                        exclude_fields=['dtstart', 'until'])
+        values = dict((field_name, getattr(self, field_name))
+                      for field_name in field_names)
+        values['start_date'] = self.start_date
+        values['end_date'] = self.end_date
+        return values
 
     def get_recurrence_field_names(self, exclude_fields=None):
         """Gets all the recurrence field names as define by:
@@ -272,94 +604,279 @@ class AbstractRecurrenceModelMixin(models.Model):
             exclude_fields = []
 
         fields = ['dtstart', 'until', 'freq', 'interval', 'wkst', 'count',
-                 'bysetpos', ' bymonth', 'bymonthday', 'byyearday', 'byeaster',
+                 'bysetpos', 'bymonth', 'bymonthday', 'byyearday', 'byeaster',
                  'byweekno', 'byweekday', 'byhour', 'byminute', 'bysecond']
         return [field_name for field_name in fields
                 if field_name not in exclude_fields]
 
     def recurrence_str(self):
+        """Formats the recurrence into a human readable friendly string. See
+        django_recurrences.utils.formatting.recurrence_to_str.
+
+        Examples:
+
+        * 'Every Tuesday and Thursday, Nov 01, 2011 - Nov 10, 2011'
+        * 'Everyday, Nov 01, 2011 - Nov 10, 2011'
+
+        Use render_recurrence_strings to format many objects at once.
         """
-        Formats the Frequency into a human readable friendly string format.
+        return recurrence_to_str(self.get_recurrence(frozen=True))
+
 
-        Freq values:
+class AbstractRecurrenceModelMixin(BaseRecurrenceModelMixin):
+    """A model mixin for recurrence based on rrule that stores each of the
+    recurrence rule values in its own field.
+    """
+    # Recurrence Rule fields
+    freq = models.PositiveIntegerField(choices=Frequency.CHOICES, blank=True,
+                                       null=True)
+    interval = models.PositiveIntegerField(choices=ONE_TO_31, default=1,
+                                           blank=True, null=True)
+    wkst = models.PositiveIntegerField(verbose_name=_('Week Start Day'),
+                                       choices=Day.CHOICES, blank=True,
+                                       null=True)
+    count = models.PositiveIntegerField(verbose_name=_('Total Occurrences'),
+                                        blank=True, null=True)
+    bysetpos = RuleListField(verbose_name=_('By Set Position'),
+                             choices=BY_SET_POS_CHOICES,
+                             valid_values=BY_SET_POS_VALUES, max_length=25,
+                             blank=True, null=True)
+    byyearday = RuleListField(verbose_name=_('By Year Day'),
+                              choices=BY_YEAR_DAY_CHOICES,
+                              valid_values=BY_YEAR_DAY_VALUES, max_length=1500,
+                              blank=True, null=True,
+                              help_text=BY_YEAR_DAY_HELP_TEXT)
+    bymonth = RuleListField(verbose_name=_('By Month'),
+                            choices=Month.CHOICES_SHORT,
+                            valid_values=BY_MONTH_VALUES, max_length=25,
+                            blank=True, null=True)
+    bymonthday = RuleListField(verbose_name=('By Month Day'),
+                               choices=BY_MONTH_DAY_CHOICES,
+                               valid_values=BY_MONTH_DAY_VALUES,
+                               max_length=200, blank=True, null=True,
+                               help_text=BY_MONTH_DAY_HELP_TEXT)
+    byweekno = RuleListField(verbose_name=_('By Week Number'),
+                             choices=ONE_TO_53, valid_values=BY_WEEK_NO_VALUES,
+                             max_length=200, blank=True, null=True,
+                             help_text=BY_WEEK_NUMBER_HELP_TEXT)
+    byweekday = RuleListField(verbose_name=_('By Weekday'),
+                              choices=Day.CHOICES,
+                              valid_values=BY_WEEKDAY_VALUES, max_length=25,
+                              blank=True, null=True)
+    byhour = RuleListField(verbose_name=_('By Hour'), choices=ZERO_TO_59,
+                           valid_values=BY_HOUR_VALUES, max_length=200,
+                           blank=True, null=True, help_text=BY_HOUR_HELP_TEXT)
+    byminute = RuleListField(verbose_name=_('By Minute'), choices=ZERO_TO_59,
+                             valid_values=BY_MINUTE_VALUES, max_length=200,
+                             blank=True, null=True,
+                             help_text=BY_MINUTE_HELP_TEXT)
+    bysecond = RuleListField(verbose_name=_('By Second'), choices=ZERO_TO_59,
+                             valid_values=BY_SECOND_VALUES, max_length=200,
+                             blank=True, null=True,
+                             help_text=BY_SECOND_HELP_TEXT)
+    byeaster = RuleListField(verbose_name=_('By Easter'), max_length=100,
+                             blank=True, null=True,
+                             help_text=BY_EASTER_HELP_TEXT)
+
+    class Meta(BaseRecurrenceModelMixin.Meta):
+        abstract = True
 
-        * 0 = YEARLY
-        * 1 = MONTHLY
-        * 2 = WEEKLY
-        * 3 = DAILY
-        * 4 = HOURLY
-        * 5 = MINUTELY
-        * 6 = SECONDLY
 
-        Format:
+class AbstractNextOccurrenceModelMixin(AbstractRecurrenceModelMixin):
+    """A recurrence model mixin that stores the next occurrence of the object
+    in an indexed column. This allows the objects to be sorted and filtered
+    by their next occurrence in the database, for example:
 
-        * {{ OCCURRENCE }}, {{ START_DATE }} - {{ END_DATE }}
+    >>> MyModel.objects.filter(next_occurrence__range=(now, soon))
 
-        Examples:
+    The next occurrence is set each time the object is saved and moved
+    forward as time passes by the "advance_next_occurrences" management
+    command.
+    """
+    next_occurrence = models.DateTimeField(blank=True, null=True,
+                                           db_index=True)
 
-        * 'Every Tuesday and Thursday, Nov. 1, 2011 - Nov. 10, 2011'
-        * 'Daily, Nov. 1, 2011 - Nov. 10, 2011'
+    class Meta(AbstractRecurrenceModelMixin.Meta):
+        abstract = True
 
+    def set_computed_fields(self):
+        super(AbstractNextOccurrenceModelMixin, self).set_computed_fields()
+        self.next_occurrence = self.get_next_occurrence()
+
+    def get_recurrence_db_values(self):
+        values = super(AbstractNextOccurrenceModelMixin,
+                       self).get_recurrence_db_values()
+        values['next_occurrence'] = self.next_occurrence
+        return values
+
+    def advance_next_occurrence(self, now=None):
+        """Moves the next occurrence forward to the first occurrence on or
+        after now. This doesn't save the object.
+
+        When the rule isn't limited by a count, the rule is rebased to start
+        from the current next occurrence so the occurrences before it don't
+        have to be iterated again.
+
+        :param now: the date to advance the next occurrence to. Defaults to
+            now.
         """
-        def _get_weekday_str(weekdays):
-            """
-            Takes the byweekday iterable of ints and converts to String days.
-
-            Example:
-
-                >>> _get_weekdays([0, 2])
-                u'Sunday and Tuesday'
-                >>> _get_weekdays([0, 1, 2])
-                u'Sunday, Monday and Tuesday'
-            """
-            if isinstance(weekdays, int):
-                days = [int_to_weekday(weekdays)]
-            else:
-                days = [int_to_weekday(day) for day in weekdays]
+        if now is None:
+            now = timezone.now()
+
+        recurrence = self.get_recurrence()
+
+        if not recurrence.is_recurring():
+            self.next_occurrence = self.get_next_occurrence(
+                                                    after=now,
+                                                    recurrence=recurrence)
+            return self.next_occurrence
 
-            weekday_str = u''
+        if self.next_occurrence and not recurrence.count:
+            # The next occurrence is an occurrence of the rule so the rule
+            # produces the same dates after it when it's used as the start.
+            recurrence.dtstart = max(self.next_occurrence, self.start_date)
 
-            for i, d in enumerate(days):
-                weekday_str += d
+        try:
+            # A rebased rule is only used once so it's not cached
+            self.next_occurrence = recurrence.get_rrule(
+                                    use_cache=False).after(now, inc=True)
+        except Exception as e:
+            self.next_occurrence = None
 
-                if i == 0 and len(days) == 1:
-                    weekday_str += u' '
+        return self.next_occurrence
 
-                if i < len(days) - 2:
-                    weekday_str += u', '
-                elif i == len(days) - 2:
-                    weekday_str += _(' and ')
 
-            return weekday_str
+def _packed_rule_property(field_name):
+    """Gets a property for a recurrence rule value that's stored in the
+    packed RRULE string.
+    """
+    get_value = _get_int if field_name in ('freq', 'interval', 'wkst',
+                                           'count') else _get_rrule_int_list
 
-        date_format = '%b %d, %Y'
+    def fget(self):
+        value = parse_rrule_str(self.rrule).get(field_name)
 
-        if self.count:
-            to_from = _('Starting {0} occurring {1} times').format(
-                                        self.start_date.strftime(date_format),
-                                        self.count)
-        elif self.is_recurring:
-            to_from = '{0} - {1}'.format(
-                                        self.start_date.strftime(date_format),
-                                        self.end_date.strftime(date_format))
-        else:
-            to_from = ''
-
-        freq = self.freq
-        if freq == Frequency.YEARLY:
-            frequency = _('Every year')
-        elif freq == Frequency.MONTHLY:
-            frequency = _('Every month')
-        elif freq == Frequency.WEEKLY:
-            weekday_str = _get_weekday_str(self.byweekday) \
-                          if self.byweekday else u'week'
-            frequency = _('Every {0}').format(weekday_str)
-        elif freq == Frequency.DAILY:
-            frequency = _('Everyday')
-        elif freq == Frequency.HOURLY:
-            frequency = _('Every hour')
-
-        if to_from:
-            return '{0}, {1}'.format(frequency, to_from)
-
-        return '{0}'.format(frequency)
+        if isinstance(value, tuple):
+            return list(value)
+
+        if value is None and field_name == 'interval':
+            return 1
+
+        return value
+
+    def fset(self, value):
+        values = dict(parse_rrule_str(self.rrule))
+        values[field_name] = get_value(value)
+        self.rrule = to_rrule_str(values)
+
+    return property(fget, fset)
+
+
+class AbstractPackedRecurrenceModelMixin(BaseRecurrenceModelMixin):
+    """A model mixin for recurrence based on rrule that stores the recurrence
+    rule values in a single RFC 5545 RRULE string field, for example
+    "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE". The start and end dates are still
+    stored in their own fields so they can be queried.
+
+    The rule values are available as properties with the same names as the
+    AbstractRecurrenceModelMixin fields, but they can't be used in queries.
+    Parsed rules are cached by the RRULE string.
+    """
+    rrule = models.TextField(verbose_name=_('Recurrence Rule'), blank=True,
+                             default='')
+
+    freq = _packed_rule_property('freq')
+    interval = _packed_rule_property('interval')
+    wkst = _packed_rule_property('wkst')
+    count = _packed_rule_property('count')
+    bysetpos = _packed_rule_property('bysetpos')
+    byyearday = _packed_rule_property('byyearday')
+    bymonth = _packed_rule_property('bymonth')
+    bymonthday = _packed_rule_property('bymonthday')
+    byweekno = _packed_rule_property('byweekno')
+    byweekday = _packed_rule_property('byweekday')
+    byhour = _packed_rule_property('byhour')
+    byminute = _packed_rule_property('byminute')
+    bysecond = _packed_rule_property('bysecond')
+    byeaster = _packed_rule_property('byeaster')
+
+    class Meta(BaseRecurrenceModelMixin.Meta):
+        abstract = True
+
+    def get_recurrence_kwargs(self):
+        """Gets the dict of recurrence kwargs for the packed RRULE string and
+        the start and end dates.
+        """
+        recurrence = dict(parse_rrule_str(self.rrule))
+
+        if self.start_date is not None:
+            recurrence['dtstart'] = self.start_date
+
+        if self.end_date is not None:
+            recurrence['until'] = self.end_date
+
+        return recurrence
+
+    def get_recurrence_db_values(self):
+        return {'start_date': self.start_date,
+                'end_date': self.end_date,
+                'rrule': self.rrule}
+
+
+class AbstractDayMaskModelMixin(AbstractRecurrenceModelMixin):
+    """A recurrence model mixin that also stores the weekday, month and month
+    day filters of the rule as integer bit masks. The masks include the values
+    rrule implies from the start date, so the objects that can't occur on a
+    day can be excluded in the database:
+
+    >>> MyModel.objects.could_occur_on(date(2013, 1, 1))
+
+    A mask of 0 means the rule doesn't filter by the value.
+    """
+    # Bit n is set for weekday n (0 == Monday)
+    weekday_mask = models.PositiveIntegerField(default=0)
+    # Bit n is set for month n + 1
+    month_mask = models.PositiveIntegerField(default=0)
+    # Bit n is set for month day n + 1
+    month_day_mask = models.PositiveIntegerField(default=0)
+    # Bit n is set for the month day -(n + 1), counted from the end of the
+    # month
+    neg_month_day_mask = models.PositiveIntegerField(default=0)
+
+    objects = DayMaskManager()
+
+    class Meta(AbstractRecurrenceModelMixin.Meta):
+        abstract = True
+
+    def set_computed_fields(self):
+        super(AbstractDayMaskModelMixin, self).set_computed_fields()
+        self.set_day_masks()
+
+    def set_recurrence(self, *args, **kwargs):
+        super(AbstractDayMaskModelMixin, self).set_recurrence(*args, **kwargs)
+        self.set_day_masks()
+
+    def set_day_masks(self):
+        """Sets the day mask fields from the recurrence rule values."""
+        recurrence = self.get_recurrence(frozen=True)
+        bymonth = bymonthday = byweekday = None
+
+        if recurrence.is_recurring():
+            bymonth, bymonthday, byweekday = get_day_fields(recurrence)
+
+        bymonthday = bymonthday or []
+        self.weekday_mask = to_mask(byweekday or [])
+        self.month_mask = to_mask(bymonth or [], offset=-1)
+        self.month_day_mask = to_mask([d for d in bymonthday if d > 0],
+                                      offset=-1)
+        self.neg_month_day_mask = to_mask([-d for d in bymonthday if d < 0],
+                                          offset=-1)
+
+    def get_recurrence_db_values(self):
+        values = super(AbstractDayMaskModelMixin,
+                       self).get_recurrence_db_values()
+        values.update(weekday_mask=self.weekday_mask,
+                      month_mask=self.month_mask,
+                      month_day_mask=self.month_day_mask,
+                      neg_month_day_mask=self.neg_month_day_mask)
+        return values
@@ -0,0 +1,25 @@
+from __future__ import unicode_literals
+
+
+class RecurrenceError(Exception):
+    """Base class for the errors raised when a recurrence can't be expanded.
+    """
+
+
+class HorizonRequired(RecurrenceError):
+    """Raised when the dates of an open ended recurrence are requested without
+    an end date and the RECURRENCES_OPEN_ENDED_HORIZON_DAYS setting is None.
+    """
+
+
+class TooManyOccurrences(RecurrenceError):
+    """Raised when listing the dates of a recurrence would return more than
+    the RECURRENCES_MAX_OCCURRENCES setting.
+    """
+
+
+class ExpansionBudgetExceeded(RecurrenceError):
+    """Raised when the estimated cost of expanding a recurrence is over the
+    RECURRENCES_EXPANSION_BUDGET setting or the budget of the current
+    django_recurrences.utils.cost.expansion_budget block.
+    """
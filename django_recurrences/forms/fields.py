@@ -1,20 +1,57 @@
 from __future__ import unicode_literals
 
+import copy
 from collections import OrderedDict
 
 from django.core.exceptions import ValidationError
 from django.forms.fields import MultiValueField
+from django.forms.fields import TypedMultipleChoiceField
 from django.forms.widgets import CheckboxSelectMultiple
 from django.forms.widgets import Select
 from django_core.forms.widgets import CommaSeparatedListWidget
 from django_core.forms.widgets import Html5DateInput
 
+from ..conf import get_setting
 from ..constants import Day
 from ..constants import Month
 from ..db.models.choices import BY_SET_POS_CHOICES
 from ..db.models.choices import ONE_TO_31
+from ..db.models.choices import choice_values
 from ..forms.choices import FREQUENCY_CHOICES
 from ..forms.widgets import FrequencyWidget
+from ..utils.cache import LRUCache
+from ..utils.cost import estimate_cost
+
+
+# The default order the rrule fields are displayed in the widget.
+DEFAULT_KEY_ORDER = ('dtstart', 'freq', 'interval', 'bymonth', 'byweekday',
+                     'wkst', 'bysetpos', 'byyearday', 'bymonthday', 'byweekno',
+                     'byhour', 'byminute', 'bysecond', 'byeaster', 'count',
+                     'until')
+
+_form_field_cache = None
+
+
+class IntegerListChoiceField(TypedMultipleChoiceField):
+    """Form field for the integer list rrule fields. Each value is checked
+    against a set of the choice values instead of scanning the choices.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('coerce', int)
+        super(IntegerListChoiceField, self).__init__(*args, **kwargs)
+
+    def _set_choices(self, value):
+        super(IntegerListChoiceField, self)._set_choices(value)
+        self.valid_values = choice_values(self._choices)
+
+    choices = property(TypedMultipleChoiceField._get_choices, _set_choices)
+
+    def valid_value(self, value):
+        try:
+            return int(value) in self.valid_values
+        except (TypeError, ValueError):
+            return False
 
 
 class RecurrenceField(MultiValueField):
@@ -23,7 +60,8 @@ class RecurrenceField(MultiValueField):
     """
 
     def __init__(self, key_order=None, field_widgets=None, only=None,
-                 exclude=None, label_overrides=None, *args, **kwargs):
+                 exclude=None, label_overrides=None, single_template=None,
+                 *args, **kwargs):
         """
         :param key_order: list of rrule keys that will define the display
             order.
@@ -32,6 +70,8 @@ class RecurrenceField(MultiValueField):
         :param only: list of rrule field to only include
         :param exclude: list of rrule fields to exclude
         :param labels: dict override on the widget labels.
+        :param single_template: if True, the widget is rendered with a single
+            template pass. See FrequencyWidget.
         """
         self.keyed_fields = get_rrule_form_fields(key_order=key_order,
                                                   field_widgets=field_widgets,
@@ -47,7 +87,8 @@ class RecurrenceField(MultiValueField):
             keyed_widgets[name] = field.widget
 
         widget = FrequencyWidget(keyed_widgets=keyed_widgets,
-                                 label_overrides=label_overrides)
+                                 label_overrides=label_overrides,
+                                 single_template=single_template)
         super(RecurrenceField, self).__init__(fields=fields, widget=widget,
                                               *args, **kwargs)
 
@@ -75,6 +116,15 @@ class RecurrenceField(MultiValueField):
         if errors:
             raise ValidationError(errors)
 
+        budget = get_setting('EXPANSION_BUDGET')
+
+        if (budget and value.dtstart is not None and
+                estimate_cost(value) > budget):
+            raise ValidationError('This recurrence is too expensive to '
+                                  'expand.  Please select fewer occurrences '
+                                  'or an earlier end date.',
+                                  code='over_budget')
+
         return value
 
 
@@ -83,18 +133,75 @@ def get_rrule_form_fields(key_order=None, field_widgets=None, only=None,
     """Gets a dict with the key being the rrule field name and the value
     being the widget for the field.
 
+    The fields are built once for each combination of the params and copies
+    of the cached prototype fields are returned. The fields aren't cached when
+    field_widgets is given since the widget instances can't be compared, so
+    every call would add another entry to the cache and keep the widgets
+    alive.
+
     :param key_order: list of rrule keys that will define the display order.
     :param field_widgets: dict of widgets keyed by rrule freq field name to
             override the default widget.
     :param only: list of rrule field to only include
     :param exclude: list of rrule fields to exclude
     """
-    # Define the order for the OrderedDict.  This will define the order they
-    # are displayed in the widget.
-    key_order = ['dtstart', 'freq', 'interval', 'bymonth', 'byweekday',
-                 'wkst', 'bysetpos', 'byyearday', 'bymonthday', 'byweekno',
-                 'byhour', 'byminute', 'bysecond', 'byeaster', 'count',
-                 'until']
+    if field_widgets:
+        return _build_rrule_form_fields(key_order=key_order,
+                                        field_widgets=field_widgets,
+                                        only=only,
+                                        exclude=exclude)
+
+    key = (tuple(key_order) if key_order != None else None,
+           tuple(only) if only != None else None,
+           tuple(exclude) if exclude != None else None)
+    cache = get_form_field_cache()
+    fields = cache.get(key)
+
+    if fields is None:
+        fields = _build_rrule_form_fields(key_order=key_order,
+                                          field_widgets=field_widgets,
+                                          only=only,
+                                          exclude=exclude)
+        cache.set(key, fields)
+
+    return OrderedDict((field_name, _copy_form_field(field))
+                       for field_name, field in fields.items())
+
+
+def _copy_form_field(field):
+    """Copies a form field the same way Field.__deepcopy__ does except the
+    choices are shallow copied, so the choice tuples are shared instead of
+    deep copying hundreds of them for the by year day field.
+    """
+    result = copy.copy(field)
+    result.widget = copy.deepcopy(field.widget)
+    result.validators = field.validators[:]
+
+    if hasattr(field, '_choices'):
+        result._choices = list(field._choices)
+
+    return result
+
+
+def get_form_field_cache():
+    """Gets the process wide cache of the prototype rrule form fields. The
+    cache is sized by the RECURRENCES_RRULE_CACHE_SIZE setting.
+    """
+    global _form_field_cache
+
+    if _form_field_cache is None:
+        _form_field_cache = LRUCache(max_size=get_setting('RRULE_CACHE_SIZE'))
+
+    return _form_field_cache
+
+
+def _build_rrule_form_fields(key_order=None, field_widgets=None, only=None,
+                             exclude=None):
+    """Builds the rrule form fields. See get_rrule_form_fields for the params.
+    """
+    # The order for the OrderedDict defines the order the fields are
+    # displayed in the widget.
+    key_order = list(key_order) if key_order else list(DEFAULT_KEY_ORDER)
 
     if only != None:
         key_order = [k for k in key_order if k in only]
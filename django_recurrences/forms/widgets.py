@@ -2,16 +2,57 @@ from __future__ import unicode_literals
 
 from django.forms.widgets import MultiWidget
 from django.template.loader import render_to_string
+from django.utils.encoding import force_text
 from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
 
+from ..conf import get_setting
 from ..constants import Frequency
+from ..rrule import BaseRecurrence
 from ..rrule import Recurrence
+from ..utils.cache import LRUCache
+
+
+WIDGET_TEMPLATE_NAME = 'django_recurrences/widget/widget.html'
+
+# The choice widgets whose rendered html is cached. Their markup only depends
+# on the choices, the field name, the value and the language.
+CACHED_CHOICE_WIDGET_NAMES = ('bymonth', 'byweekday', 'interval')
+
+_choice_html_cache = None
+
+
+def get_choice_html_cache():
+    """Gets the process wide cache of rendered choice widget html. The cache
+    is sized by the RECURRENCES_RRULE_CACHE_SIZE setting.
+    """
+    global _choice_html_cache
+
+    if _choice_html_cache is None:
+        _choice_html_cache = LRUCache(max_size=get_setting('RRULE_CACHE_SIZE'))
+
+    return _choice_html_cache
+
+
+def _get_value_key(value):
+    """Gets a hashable key for a widget value that renders the same html."""
+    if value is None:
+        return None
+
+    if isinstance(value, (list, tuple)):
+        return tuple(force_text(v) for v in value)
+
+    return force_text(value)
 
 
 class FrequencyWidget(MultiWidget):
 
-    def __init__(self, keyed_widgets, attrs=None, label_overrides=None, *args,
-                 **kwargs):
+    # If True, the widget is rendered with the single WIDGET_TEMPLATE_NAME
+    # template instead of rendering a template for each field.
+    single_template = False
+
+    def __init__(self, keyed_widgets, attrs=None, label_overrides=None,
+                 single_template=None, *args, **kwargs):
         """
 
         :param keyed_widgets: an OrderedDict of rrule field names as the key
@@ -19,9 +60,18 @@ class FrequencyWidget(MultiWidget):
         :param label_overrides: dict of rrule field widget labels to override.
             A value of None will not even render a label field.  A value of ''
             will render an empty label field.
+        :param single_template: if True, the whole widget is rendered with one
+            pass of the WIDGET_TEMPLATE_NAME template, which includes the
+            form_field.html and ending.html templates, instead of rendering a
+            template for each field. Defaults to the single_template class
+            attribute.
         """
         self.keyed_widgets = keyed_widgets
         self.label_overrides = label_overrides
+
+        if single_template is not None:
+            self.single_template = single_template
+
         self.labels = self.get_widget_labels()
         self.key_order = [k for k in keyed_widgets.keys()]
         widgets = [w for w in keyed_widgets.values()]
@@ -118,9 +168,13 @@ class FrequencyWidget(MultiWidget):
     def render(self, name, value, attrs=None):
         """Render the html for the widget."""
 
-        if not isinstance(value, Recurrence):
+        if not isinstance(value, BaseRecurrence):
             value = self.decompress(value)
 
+        if self.single_template:
+            return self.render_single_template(name=name, value=value,
+                                               attrs=attrs)
+
         rendered_html = []
 
         for widget_name, widget in self.keyed_widgets.items():
@@ -149,26 +203,86 @@ class FrequencyWidget(MultiWidget):
         return mark_safe('<div class="recurrence-widget {0}-recurrence">'
                          '{1}</div>'.format(name, all_widget_html))
 
+    def render_single_template(self, name, value, attrs=None):
+        """Renders the html for the widget with a single pass of the
+        WIDGET_TEMPLATE_NAME template. The html is the same as render().
+        """
+        fields = [self.get_field_context(name=name, value=value,
+                                         widget_name=widget_name,
+                                         widget=widget,
+                                         label=self.labels.get(widget_name))
+                  for widget_name, widget in self.keyed_widgets.items()
+                  if widget_name not in ('count', 'until')]
+
+        ending_context = self.get_ending_context(name=name, value=value,
+                                                 attrs=attrs)
+        ending_context['is_ending'] = True
+
+        try:
+            # Try to put the ending options right after the  weekday
+            fields.insert(self.key_order.index('byweekday') + 1,
+                          ending_context)
+        except ValueError:
+            fields.append(ending_context)
+
+        return mark_safe(render_to_string(WIDGET_TEMPLATE_NAME, {
+            'name': name,
+            'fields': fields
+        }))
+
+    def render_widget(self, name, widget_name, widget, value, attrs):
+        """Renders a sub widget. The html of the choice widgets in
+        CACHED_CHOICE_WIDGET_NAMES is cached.
+        """
+        if widget_name not in CACHED_CHOICE_WIDGET_NAMES:
+            return widget.render(name=name, value=value, attrs=attrs)
+
+        key = (widget.__class__, name, _get_value_key(value),
+               tuple(sorted(attrs.items())),
+               tuple(sorted(widget.attrs.items())),
+               tuple(getattr(widget, 'choices', ())),
+               get_language())
+        cache = get_choice_html_cache()
+        html = cache.get(key)
+
+        if html is None:
+            html = widget.render(name=name, value=value, attrs=attrs)
+            cache.set(key, html)
+
+        return html
+
     def render_field(self, name, value, widget_name, widget, label=None):
         """Renders a widget field."""
-        widget_attrs = {'id': 'id_{0}_{1}'.format(name, widget_name)}
-        context = {'name': name, 'widget_name': widget_name}
+        context = self.get_field_context(name=name, value=value,
+                                         widget_name=widget_name,
+                                         widget=widget, label=label)
+
+        if context['is_hidden']:
+            return context['widget_html']
+
+        return render_to_string('django_recurrences/widget/form_field.html',
+                                context)
 
-        if label != None:
-            context['label'] = label
+    def get_field_context(self, name, value, widget_name, widget, label=None):
+        """Gets the template context for a widget field."""
+        widget_attrs = {'id': 'id_{0}_{1}'.format(name, widget_name)}
+        context = {'name': name, 'widget_name': widget_name, 'label': label}
 
         if widget_name in ('bymonth', 'byweekday', 'interval'):
             widget_attrs['class'] = widget_name
         else:
             widget_attrs['class'] = 'form-control {0}'.format(widget_name)
 
-        context['widget_html'] = widget.render(
+        context['widget_html'] = self.render_widget(
                                     name='{0}_{1}'.format(name, widget_name),
+                                    widget_name=widget_name,
+                                    widget=widget,
                                     value=getattr(value, widget_name, None),
                                     attrs=widget_attrs)
+        context['is_hidden'] = getattr(widget, 'input_type', None) == 'hidden'
 
-        if getattr(widget, 'input_type', None) == 'hidden':
-            return context['widget_html']
+        if context['is_hidden']:
+            return context
 
         if widget_name == 'interval':
             context['post_widget_html'] = (
@@ -179,11 +293,18 @@ class FrequencyWidget(MultiWidget):
         if getattr(widget, 'help_text', None) and widget.help_text:
             context['help_text'] = widget.help_text
 
-        return render_to_string('django_recurrences/widget/form_field.html',
-                                context)
+        return context
 
     def render_ending(self, name, value, attrs=None):
         """Render the ending frequency radio options."""
+        return render_to_string('django_recurrences/widget/ending.html',
+                                self.get_ending_context(name=name,
+                                                        value=value,
+                                                        attrs=attrs))
+
+    def get_ending_context(self, name, value, attrs=None):
+        """Gets the template context for the ending frequency radio options.
+        """
         count = getattr(value, 'count', None)
         count_widget_html = self.keyed_widgets.get('count').render(
                                     name='{0}_count'.format(name),
@@ -210,5 +331,4 @@ class FrequencyWidget(MultiWidget):
         elif value.until != None:
             context['ending'] = 'until'
 
-        return render_to_string('django_recurrences/widget/ending.html',
-                                context)
+        return context
@@ -0,0 +1,88 @@
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...db.models.mixins import AbstractNextOccurrenceModelMixin
+
+try:
+    from django.apps import apps
+    get_models = apps.get_models
+except ImportError:
+    # Django < 1.7
+    from django.db.models import get_models
+
+
+class Command(BaseCommand):
+    help = ('Advances the next occurrence of every recurring object whose '
+            'next occurrence has passed.')
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size',
+                    action='store',
+                    dest='chunk_size',
+                    type='int',
+                    default=1000,
+                    help='The number of objects to advance at a time.'),
+    )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        chunk_size = options.get('chunk_size') or 1000
+        verbosity = int(options.get('verbosity', 1))
+
+        for model in get_models():
+            if not issubclass(model, AbstractNextOccurrenceModelMixin):
+                continue
+
+            advanced = advance_next_occurrences(model, now=now,
+                                                chunk_size=chunk_size)
+
+            if verbosity > 0:
+                self.stdout.write('Advanced {0} {1} objects.'.format(
+                                        advanced, model._meta.object_name))
+
+
+def advance_next_occurrences(model, now, chunk_size=1000):
+    """Advances the next occurrence of all objects of the model whose next
+    occurrence is before now. The objects are loaded in chunks ordered by
+    primary key and the new values are written with update queries so the
+    objects aren't saved.
+
+    Returns the number of objects advanced.
+
+    :param model: model that uses AbstractNextOccurrenceModelMixin.
+    :param now: the date to advance the next occurrences to.
+    :param chunk_size: the number of objects to advance at a time.
+    """
+    queryset = model._default_manager.filter(
+                                next_occurrence__lt=now).order_by('pk')
+    last_pk = None
+    advanced = 0
+
+    while True:
+        chunk = queryset
+
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+
+        objs = list(chunk[:chunk_size])
+
+        if not objs:
+            return advanced
+
+        # Group the objects by their new value to reduce the number of
+        # update queries.
+        pks_by_date = defaultdict(list)
+
+        for obj in objs:
+            pks_by_date[obj.advance_next_occurrence(now=now)].append(obj.pk)
+
+        for next_occurrence, pks in pks_by_date.items():
+            model._default_manager.filter(pk__in=pks).update(
+                                            next_occurrence=next_occurrence)
+
+        last_pk = objs[-1].pk
+        advanced += len(objs)
@@ -1,5 +1,38 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.utils.translation import ugettext as _
+from django_recurrences.db.models.managers import OccurrenceManager
 from django_recurrences.db.models.mixins import AbstractRecurrenceModelMixin
 
+try:
+    from django.contrib.contenttypes.fields import GenericForeignKey
+except ImportError:
+    # Django < 1.7
+    from django.contrib.contenttypes.generic import GenericForeignKey
+
 
 class Recurrence(AbstractRecurrenceModelMixin):
     """Concrete implementation for recurrence base on rrule."""
+
+
+class Occurrence(models.Model):
+    """A materialized occurrence of a recurring object.
+
+    Occurrences are only written for models that set
+    ``materialize_occurrences = True`` and are kept in sync with the rule
+    fields each time the recurring object is saved. This allows date range
+    lookups to be done with a single indexed query instead of expanding every
+    recurrence rule in python.
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    start = models.DateTimeField()
+    ordinal = models.PositiveIntegerField(verbose_name=_('Occurrence Number'))
+
+    objects = OccurrenceManager()
+
+    class Meta:
+        ordering = ('start',)
+        index_together = (('start', 'content_type'),
+                          ('content_type', 'object_id'))
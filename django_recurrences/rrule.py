@@ -3,11 +3,28 @@ from __future__ import unicode_literals
 import collections
 from datetime import date
 from datetime import datetime
+from datetime import timedelta
+from itertools import dropwhile
+from itertools import islice
+from itertools import takewhile
 
+from dateutil.rrule import rrule
 from dateutil.rrule import weekday
 from django.utils.six import string_types
 from django_core.utils.date_parsers import parse_datetime
 
+from .conf import get_setting
+from .constants import Engine
+from .exceptions import HorizonRequired
+from .exceptions import TooManyOccurrences
+from .utils import bitsets
+from .utils.arithmetic import count_between
+from .utils.cache import LRUCache
+from .utils.cost import check_budget
+
+
+_rrule_cache = None
+
 
 def _get_datetime(value):
     """Helper method to set a date or datetime field.
@@ -78,7 +95,337 @@ def _get_rrule_int_list(value):
     return value
 
 
-class Recurrence(object):
+def get_rrule_cache():
+    """Gets the process wide cache of compiled rrule objects keyed by the
+    recurrence fingerprint. The size of the cache is set by the
+    RECURRENCES_RRULE_CACHE_SIZE setting.
+    """
+    global _rrule_cache
+
+    if _rrule_cache is None:
+        _rrule_cache = LRUCache(max_size=get_setting('RRULE_CACHE_SIZE'))
+
+    return _rrule_cache
+
+
+def window_dates(dates, after=None, before=None, limit=None):
+    """Lazily limits an iterable of sorted dates to a window.
+
+    >>> from datetime import datetime
+    >>> dates = [datetime(2013, 1, d) for d in range(1, 6)]
+    >>> list(window_dates(dates, after=datetime(2013, 1, 2), limit=2))
+    [datetime.datetime(2013, 1, 2, 0, 0), datetime.datetime(2013, 1, 3, 0, 0)]
+
+    :param dates: iterable of dates in ascending order.
+    :param after: only include dates on or after this date.
+    :param before: only include dates on or before this date.
+    :param limit: the max number of dates to include.
+    """
+    if after is not None:
+        if hasattr(dates, 'xafter'):
+            # rrule objects can do this themselves
+            dates = dates.xafter(after, inc=True)
+        else:
+            dates = dropwhile(lambda dt: dt < after, dates)
+
+    if before is not None:
+        dates = takewhile(lambda dt: dt <= before, dates)
+
+    if limit is not None:
+        dates = islice(dates, limit)
+
+    return dates
+
+
+def get_list_limit(limit=None):
+    """Gets the number of dates to expand when listing dates with the limit.
+    When the RECURRENCES_MAX_OCCURRENCES setting is smaller than the limit,
+    one date more than the setting is expanded so check_occurrences can tell
+    the max was exceeded.
+
+    :param limit: the max number of dates requested.
+    """
+    max_occurrences = get_setting('MAX_OCCURRENCES')
+
+    if not max_occurrences or (limit is not None and limit <= max_occurrences):
+        return limit
+
+    return max_occurrences + 1
+
+
+def check_occurrences(num_dates):
+    """Raises TooManyOccurrences if the number of listed dates exceeds the
+    RECURRENCES_MAX_OCCURRENCES setting.
+
+    :param num_dates: the number of dates that were listed.
+    """
+    max_occurrences = get_setting('MAX_OCCURRENCES')
+
+    if max_occurrences and num_dates > max_occurrences:
+        raise TooManyOccurrences('The recurrence has more than {0} '
+                                 'occurrences. Pass a smaller date range or '
+                                 'a limit.'.format(max_occurrences))
+
+
+def list_dates(dates, limit=None):
+    """Lists the sorted dates, enforcing the RECURRENCES_MAX_OCCURRENCES
+    setting unless the limit is smaller.
+
+    :param dates: iterable of dates in ascending order.
+    :param limit: the max number of dates to list.
+    """
+    list_limit = get_list_limit(limit)
+
+    if list_limit is not None:
+        dates = islice(dates, list_limit)
+
+    dates = list(dates)
+
+    if list_limit != limit:
+        check_occurrences(len(dates))
+
+    return dates
+
+
+class BaseRecurrence(object):
+    """Base class with the behavior shared by the recurrence types. Sub
+    classes must provide an attribute for each of the rrule field names.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def get_field_names(cls, exclude=None):
+        """Gets all the rrule field names.
+
+        :param exclude: list of names to exclude
+        """
+        if not exclude:
+            exclude = []
+
+        field_names = ['dtstart', 'freq', 'interval', 'wkst', 'count', 'until',
+                       'bysetpos', 'bymonth', 'bymonthday', 'byyearday',
+                       'byeaster', 'byweekno', 'byweekday', 'byhour',
+                       'byminute', 'bysecond']
+
+        return [n for n in field_names if n not in exclude]
+
+    def to_dict(self):
+        vals = {}
+
+        for field_name in self.get_field_names():
+            val = getattr(self, field_name, None)
+
+            if val != None:
+                vals[field_name] = val
+
+        return vals
+
+    def fingerprint(self):
+        """Gets a hashable, canonical representation of the recurrence rule.
+        Recurrences with the same rule values have the same fingerprint.
+
+        >>> from datetime import datetime
+        >>> recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=3)
+        >>> recurrence.fingerprint() == Recurrence(dtstart='2013-01-01',
+        ...                                        freq='3').fingerprint()
+        True
+        """
+        return tuple(sorted(
+            (field_name, tuple(val) if isinstance(val, list) else val)
+            for field_name, val in self.to_dict().items()
+        ))
+
+    def get_rrule(self, use_cache=True):
+        """Gets the dateutil rrule object for the recurrence.
+
+        Compiled rrule objects are shared between recurrences with the same
+        rule so the returned rrule shouldn't be modified. The cache is keyed
+        by the fingerprint, which includes dtstart and until, so recurrences
+        with the same rule but different start dates don't share an rrule.
+        dateutil builds the rule from dtstart, so it can't be re-anchored to
+        another start date without being rebuilt. The shared rrules
+        are built without dateutil's date cache, which would keep every date
+        ever iterated in memory for as long as the rule is in the cache.
+
+        :param use_cache: if False, a new rrule is always built.
+        """
+        if not use_cache:
+            return rrule(**self.to_dict())
+
+        return get_rrule_cache().get_or_set(
+            self.fingerprint(),
+            lambda: rrule(**self.to_dict())
+        )
+
+    def iter_dates(self, after=None, before=None, limit=None):
+        """Lazily iterates the dates of the recurrence. The window is
+        inclusive so dates equal to after or before are included. Raises
+        ExpansionBudgetExceeded when the estimated cost of the expansion is
+        over budget (see django_recurrences.utils.cost.check_budget).
+
+        :param after: only include dates on or after this date.
+        :param before: only include dates on or before this date.
+        :param limit: the max number of dates to yield.
+        """
+        check_budget(self, after=after, before=before, limit=limit)
+
+        for dt in self._iter_dates(after=after, before=before, limit=limit):
+            yield dt
+
+    def _iter_dates(self, after=None, before=None, limit=None):
+        if self.is_recurring():
+            dates = self.get_rrule()
+        else:
+            dates = [self.dtstart] if self.dtstart else []
+
+        return window_dates(dates, after=after, before=before, limit=limit)
+
+    def get_dates(self, after=None, before=None, limit=None, engine=None):
+        """Gets a list of the dates of the recurrence within the optional
+        window. See iter_dates for the params. Open ended recurrences are
+        only listed until the horizon (see get_window_end) when before isn't
+        given. Raises TooManyOccurrences when there are more dates than the
+        RECURRENCES_MAX_OCCURRENCES setting and a smaller limit isn't given.
+
+        :param engine: the engine used to expand the occurrences. If
+            Engine.NUMPY, a numpy.datetime64 array is returned instead of a
+            list. Rules the numpy engine doesn't support are expanded with
+            dateutil and converted to an array.
+        """
+        before = self.get_window_end(after=after, before=before)
+        check_budget(self, after=after, before=before, limit=limit)
+
+        if engine == Engine.NUMPY:
+            from .utils import vectorized
+
+            if vectorized.is_supported(self, before=before):
+                list_limit = get_list_limit(limit)
+                dates = vectorized.get_dates_array(self, after=after,
+                                                   before=before,
+                                                   limit=list_limit)
+
+                if list_limit != limit:
+                    check_occurrences(len(dates))
+
+                return dates
+
+            return vectorized.to_dates_array(list_dates(
+                        self._iter_dates(after=after, before=before),
+                        limit=limit))
+
+        return list_dates(self._iter_dates(after=after, before=before),
+                          limit=limit)
+
+    def get_window_end(self, after=None, before=None):
+        """Gets the end of the window to list the dates for. Open ended
+        recurrences that aren't given an end are listed until the
+        RECURRENCES_OPEN_ENDED_HORIZON_DAYS setting after the start of the
+        window. Raises HorizonRequired if the setting is None.
+
+        :param after: the start of the window.
+        :param before: the end of the window.
+        """
+        if before is not None or not self.is_open_ended():
+            return before
+
+        horizon_days = get_setting('OPEN_ENDED_HORIZON_DAYS')
+
+        if horizon_days is None:
+            raise HorizonRequired('An end date is required to list the dates '
+                                  'of a recurrence without a count or until '
+                                  'date.')
+
+        start = self.dtstart
+
+        if after is not None and (start is None or after > start):
+            start = after
+
+        if start is None:
+            return before
+
+        return start + timedelta(days=horizon_days)
+
+    def count_between(self, start, end):
+        """Counts the occurrences between the start and end dates
+        (inclusive). Common rules are counted arithmetically. Other rules are
+        counted by iterating the rrule without listing the dates.
+
+        :param start: the start of the date range.
+        :param end: the end of the date range.
+        """
+        if not self.is_recurring():
+            return len(self.get_dates(after=start, before=end))
+
+        count = count_between(self, start, end)
+
+        if count is None:
+            dates = window_dates(self.get_rrule(), after=start, before=end)
+            count = sum(1 for dt in dates)
+
+        return count
+
+    def occurs_at(self, dt):
+        """Boolean indicating if the datetime is an occurrence of the
+        recurrence. The rule is compiled to bit masks so the check doesn't
+        iterate the rrule, except for rules with bysetpos.
+
+        :param dt: the datetime to check.
+        """
+        if not self.is_recurring():
+            return dt == self.dtstart
+
+        return bitsets.occurs_at(self, dt)
+
+    def is_recurring(self):
+        """For this object to be recurring, it must contain at least a start
+        date (dtstart) and a frequency (f) and dtstart != until.
+
+        >>> from datetime import datetime
+        >>> now = datetime.now()
+        >>> Recurrence(dtstart=now).is_recurring()
+        False
+        >>> Recurrence(dtstart=now, freq=1).is_recurring()
+        True
+        >>> Recurrence(dtstart=now, until=now).is_recurring()
+        False
+        >>> Recurrence(dtstart=now, count=5).is_recurring()
+        True
+
+        """
+        keys = list(self.to_dict().keys())
+
+        if (len(keys) <= 1 or
+            self.dtstart == self.until or
+            (len(keys) == 2 and 'dtstart' in keys and 'interval' in keys)):
+            return False
+
+        return True
+
+    def explain(self, after=None, before=None, limit=None, engine=None):
+        """Describes how the dates of the recurrence would be expanded. See
+        django_recurrences.utils.cost.explain.
+        """
+        from .utils.cost import explain
+        return explain(self, after=after, before=before, limit=limit,
+                       engine=engine)
+
+    def is_open_ended(self):
+        """Boolean indicating if the recurrence repeats without a count or
+        until date.
+
+        >>> from datetime import datetime
+        >>> now = datetime.now()
+        >>> Recurrence(dtstart=now, freq=3).is_open_ended()
+        True
+        >>> Recurrence(dtstart=now, freq=3, count=5).is_open_ended()
+        False
+
+        """
+        return (self.is_recurring() and not self.count and
+                self.until is None)
+
+
+class Recurrence(BaseRecurrence):
     """Represents recurrence for an object based on RRule."""
 
     @property
@@ -223,54 +570,111 @@ class Recurrence(object):
                                                               'interval']):
             setattr(self, field_name, kwargs.get(field_name))
 
+    def freeze(self):
+        """Gets an immutable, hashable FrozenRecurrence with the same values.
+        """
+        return FrozenRecurrence.from_trusted(**self.to_dict())
+
+
+class FrozenRecurrence(BaseRecurrence):
+    """Immutable and hashable recurrence based on rrule.
+
+    The values are stored in slots instead of an instance dict and list values
+    are stored as tuples, so frozen recurrences use less memory and can be
+    used as dict or cache keys.
+
+    >>> from datetime import datetime
+    >>> recurrence = FrozenRecurrence(dtstart=datetime(2013, 1, 1), freq=3)
+    >>> recurrence == FrozenRecurrence(dtstart='2013-01-01', freq='3')
+    True
+    >>> len(set([recurrence, FrozenRecurrence(dtstart='2013-01-01', freq=3)]))
+    1
+    """
+    __slots__ = ('dtstart', 'freq', 'interval', 'wkst', 'count', 'until',
+                 'bysetpos', 'bymonth', 'bymonthday', 'byyearday', 'byeaster',
+                 'byweekno', 'byweekday', 'byhour', 'byminute', 'bysecond',
+                 '_hash')
+
+    def __init__(self, freq=None, interval=1, **kwargs):
+        """Same params as Recurrence. The values are coerced the same way
+        Recurrence coerces them.
+        """
+        recurrence = Recurrence(freq=freq, interval=interval, **kwargs)
+        self._set_values(recurrence.to_dict())
+
     @classmethod
-    def get_field_names(cls, exclude=None):
-        """Gets all the rrule field names.
+    def from_trusted(cls, **kwargs):
+        """Creates a frozen recurrence without coercing the values. This
+        should only be used for values that have already been validated, like
+        values loaded from the database.
 
-        :param exclude: list of names to exclude
+        :param kwargs: the rrule field values keyed by the rrule field name.
         """
-        if not exclude:
-            exclude = []
+        recurrence = cls.__new__(cls)
+        recurrence._set_values(kwargs)
+        return recurrence
 
-        field_names = ['dtstart', 'freq', 'interval', 'wkst', 'count', 'until',
-                       'bysetpos', 'bymonth', 'bymonthday', 'byyearday',
-                       'byeaster', 'byweekno', 'byweekday', 'byhour',
-                       'byminute', 'bysecond']
+    def _set_values(self, values):
+        set_value = super(FrozenRecurrence, self).__setattr__
+        set_value('interval', 1)
 
-        return [n for n in field_names if n not in exclude]
+        for field_name in self.get_field_names(exclude=['interval']):
+            set_value(field_name, None)
 
-    def to_dict(self):
-        vals = {}
+        for field_name, value in values.items():
+            set_value(field_name,
+                      tuple(value) if isinstance(value, list) else value)
 
-        for field_name in self.get_field_names():
-            val = getattr(self, field_name, None)
+        set_value('_hash', None)
 
-            if val != None:
-                vals[field_name] = val
+    def __reduce__(self):
+        # Pickling would restore the slots with the blocked __setattr__
+        return (_unpickle_frozen_recurrence, (self.to_dict(),))
 
-        return vals
+    def __copy__(self):
+        return self
 
-    def is_recurring(self):
-        """For this object to be recurring, it must contain at least a start
-        date (dtstart) and a frequency (f) and dtstart != until.
+    def __deepcopy__(self, memo):
+        return self
 
-        >>> from datetime import datetime
-        >>> now = datetime.now()
-        >>> Recurrence(dtstart=now).is_recurring()
-        False
-        >>> Recurrence(dtstart=now, freq=1).is_recurring()
-        True
-        >>> Recurrence(dtstart=now, until=now).is_recurring()
-        False
-        >>> Recurrence(dtstart=now, count=5).is_recurring()
-        True
+    def __repr__(self):
+        return 'FrozenRecurrence({0})'.format(', '.join(
+            '{0}={1!r}'.format(field_name, value)
+            for field_name, value in self.fingerprint()
+        ))
 
-        """
-        keys = list(self.to_dict().keys())
+    def __setattr__(self, name, value):
+        raise AttributeError('FrozenRecurrence objects are immutable.')
 
-        if (len(keys) <= 1 or
-            self.dtstart == self.until or
-            (len(keys) == 2 and 'dtstart' in keys and 'interval' in keys)):
-            return False
+    def __delattr__(self, name):
+        raise AttributeError('FrozenRecurrence objects are immutable.')
 
-        return True
+    def __eq__(self, other):
+        if not isinstance(other, FrozenRecurrence):
+            return NotImplemented
+
+        return self.fingerprint() == other.fingerprint()
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        if self._hash is None:
+            super(FrozenRecurrence, self).__setattr__(
+                                        '_hash', hash(self.fingerprint()))
+
+        return self._hash
+
+    def fingerprint(self):
+        # The list values are already tuples
+        return tuple(sorted(self.to_dict().items()))
+
+    def thaw(self):
+        """Gets a mutable Recurrence with the same values."""
+        return Recurrence(**self.to_dict())
+
+
+def _unpickle_frozen_recurrence(values):
+    """Rebuilds a pickled FrozenRecurrence from its field values."""
+    return FrozenRecurrence.from_trusted(**values)
@@ -0,0 +1,21 @@
+from __future__ import unicode_literals
+
+from django.dispatch import Signal
+
+
+# Sent after the occurrences of a recurring object are expanded. The sender is
+# the model class and the arguments are:
+#
+# * operation: the method that did the work ("get_rrule", "get_dates" or
+#   "get_end_date").
+# * fingerprint: the recurrence rule fingerprint (see
+#   BaseRecurrence.fingerprint).
+# * freq: the rule frequency.
+# * occurrences: the number of occurrences produced or None.
+# * duration: the number of seconds the operation took.
+# * engine: the django_recurrences.constants.Engine that did the work.
+# * exception: the exception that was swallowed while expanding the rule or
+#   None.
+rule_expanded = Signal(providing_args=['operation', 'fingerprint', 'freq',
+                                      'occurrences', 'duration', 'engine',
+                                      'exception'])
@@ -0,0 +1,220 @@
+"""The async API for python 3.6+. Import the names from
+django_recurrences.utils.aio instead, which also works on older pythons.
+"""
+from __future__ import unicode_literals
+
+import asyncio
+from functools import partial
+from itertools import islice
+
+from django.db import close_old_connections
+
+from ..conf import get_setting
+from .cost import estimate_cost
+
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+async def run_sync(func, *args, **kwargs):
+    """Runs the blocking function in the event loop's default executor and
+    returns the result. The executor threads open their own database
+    connections, so the connections that are unusable or past CONN_MAX_AGE
+    are closed before and after the call like at the start and end of a
+    request.
+
+    :param func: the function to call.
+    :param args: the positional args for the function.
+    :param kwargs: the keyword args for the function.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, partial(_call, func, args,
+                                                    kwargs))
+
+
+def _call(func, args, kwargs):
+    close_old_connections()
+
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def is_inline(recurrence, after=None, before=None, limit=None):
+    """Boolean indicating if the recurrence is cheap enough to expand on the
+    event loop. The estimated cost (see django_recurrences.utils.cost) must
+    not be over the RECURRENCES_ASYNC_INLINE_COST setting.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    :param after: the start of the window.
+    :param before: the end of the window.
+    :param limit: the max number of dates listed.
+    """
+    max_cost = get_setting('ASYNC_INLINE_COST')
+
+    if not max_cost:
+        return False
+
+    return estimate_cost(recurrence, after=after, before=before,
+                         limit=limit) <= max_cost
+
+
+def _take(iterator, num):
+    return list(islice(iterator, num))
+
+
+async def iter_chunks(iterator, chunk_size, inline=True):
+    """Lists the items of the iterator in chunks. There's a yield point
+    after each chunk, including the last one, so long iterations and
+    iterations of many short iterators don't block the event loop.
+
+    :param iterator: the iterator to list.
+    :param chunk_size: the max number of items in each chunk.
+    :param inline: if False, each chunk is listed in the executor.
+    """
+    while True:
+        if inline:
+            chunk = _take(iterator, chunk_size)
+        else:
+            chunk = await run_sync(_take, iterator, chunk_size)
+
+        if chunk:
+            yield chunk
+
+        await asyncio.sleep(0)
+
+        if len(chunk) < chunk_size:
+            return
+
+
+class AsyncRecurrenceModelMixin(object):
+    """Async methods for the recurrence model mixins."""
+
+    async def aget_dates(self, after=None, before=None, limit=None,
+                         engine=None):
+        """Async version of get_dates. Rules that are cheap to expand are
+        expanded on the event loop, the others in the executor.
+        """
+        recurrence = self.get_recurrence(frozen=True)
+        window_end = recurrence.get_window_end(after=after, before=before)
+        get_dates = partial(self.get_dates, after=after, before=before,
+                            limit=limit, engine=engine)
+
+        if is_inline(recurrence, after=after, before=window_end, limit=limit):
+            return get_dates()
+
+        return await run_sync(get_dates)
+
+    async def aiter_occurrences(self, after=None, before=None,
+                                chunk_size=None):
+        """Async generator of lists of the dates of the object. See iter_dates
+        for the params. Open ended rules are only iterated until the horizon
+        when before isn't given.
+
+        :param chunk_size: the max number of dates in each list.
+        """
+        recurrence = self.get_recurrence(frozen=True)
+        before = recurrence.get_window_end(after=after, before=before)
+        inline = is_inline(recurrence, after=after, before=before)
+        dates = self.iter_dates(after=after, before=before)
+
+        async for chunk in iter_chunks(dates, chunk_size or DEFAULT_CHUNK_SIZE,
+                                       inline=inline):
+            yield chunk
+
+    async def asave(self, *args, **kwargs):
+        """Async version of save. The end date is computed in the executor."""
+        return await run_sync(self.save, *args, **kwargs)
+
+
+class AsyncRecurrenceQuerySetMixin(object):
+    """Async methods for the recurrence querysets. The objects are fetched
+    in executor calls that each load many objects instead of one call per
+    object.
+    """
+
+    async def aoccurring_between(self, start, end, errors=None):
+        """Async version of occurring_between."""
+        return await run_sync(self.occurring_between, start=start, end=end,
+                              errors=errors)
+
+    async def acount_occurrences_by_day(self, start, end):
+        """Async version of count_occurrences_by_day."""
+        return await run_sync(self.count_occurrences_by_day, start=start,
+                              end=end)
+
+    async def aiter_occurrences(self, start, end, chunk_size=None,
+                                batch_size=None):
+        """Async generator of lists of (object, occurrence) tuples between the
+        start and end dates (inclusive). The objects are fetched in batches
+        ordered by primary key so the whole queryset is never held in memory.
+        The occurrences are grouped by object instead of being sorted by
+        date. The event loop gets a turn after each object (see iter_chunks).
+
+        :param start: the start of the date range.
+        :param end: the end of the date range.
+        :param chunk_size: the max number of occurrences in each list.
+        :param batch_size: the number of objects fetched per query.
+        """
+        chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        batch_size = batch_size or DEFAULT_CHUNK_SIZE
+        queryset = self.overlapping(start=start, end=end).order_by('pk')
+        last_pk = None
+        occurrences = []
+
+        while True:
+            batch = queryset
+
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+
+            objs = await run_sync(list, batch[:batch_size])
+
+            for obj in objs:
+                async for dates in obj.aiter_occurrences(
+                                                after=start,
+                                                before=end,
+                                                chunk_size=chunk_size):
+                    occurrences.extend((obj, dt) for dt in dates)
+
+                    while len(occurrences) >= chunk_size:
+                        yield occurrences[:chunk_size]
+                        occurrences = occurrences[chunk_size:]
+
+            if len(objs) < batch_size:
+                break
+
+            last_pk = objs[-1].pk
+
+        if occurrences:
+            yield occurrences
+
+
+class AsyncRecurrenceManagerMixin(object):
+    """Async methods for the recurrence managers."""
+
+    async def acreate(self, *args, **kwargs):
+        """Async version of create. The end date is computed in the executor.
+        """
+        return await run_sync(self.create, *args, **kwargs)
+
+    async def abulk_create_recurrences(self, objs, batch_size=None):
+        """Async version of bulk_create_recurrences."""
+        return await run_sync(self.bulk_create_recurrences, objs,
+                              batch_size=batch_size)
+
+    async def aoccurring_between(self, start, end, errors=None):
+        return await self.get_queryset().aoccurring_between(start=start,
+                                                            end=end,
+                                                            errors=errors)
+
+    async def acount_occurrences_by_day(self, start, end):
+        return await self.get_queryset().acount_occurrences_by_day(
+                                                        start=start, end=end)
+
+    def aiter_occurrences(self, start, end, chunk_size=None,
+                          batch_size=None):
+        return self.get_queryset().aiter_occurrences(start=start, end=end,
+                                                     chunk_size=chunk_size,
+                                                     batch_size=batch_size)
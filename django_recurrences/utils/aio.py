@@ -0,0 +1,31 @@
+"""Async counterparts of the recurrence APIs for ASGI views.
+
+Cheap expansions run on the event loop with a yield point between chunks.
+Expensive ones, and all the database queries, run in the event loop's default
+executor. An expansion is cheap when its estimated cost (see
+django_recurrences.utils.cost) isn't over the RECURRENCES_ASYNC_INLINE_COST
+setting.
+
+The async methods use python 3.6 syntax so they're only added to the models and
+managers on python 3.6+. On older pythons the mixins are empty.
+"""
+from __future__ import unicode_literals
+
+import sys
+
+
+if sys.version_info >= (3, 6):
+    from ._aio import AsyncRecurrenceManagerMixin
+    from ._aio import AsyncRecurrenceModelMixin
+    from ._aio import AsyncRecurrenceQuerySetMixin
+    from ._aio import iter_chunks
+    from ._aio import run_sync
+else:
+    class AsyncRecurrenceModelMixin(object):
+        pass
+
+    class AsyncRecurrenceQuerySetMixin(object):
+        pass
+
+    class AsyncRecurrenceManagerMixin(object):
+        pass
@@ -0,0 +1,415 @@
+from __future__ import unicode_literals
+
+import calendar
+from datetime import MAXYEAR
+from datetime import timedelta
+
+from ..constants import Frequency
+
+
+# The rrule fields that filter or expand the occurrences of a rule.
+BY_FIELD_NAMES = ('bysetpos', 'bymonth', 'bymonthday', 'byyearday',
+                  'byeaster', 'byweekno', 'byweekday', 'byhour', 'byminute',
+                  'bysecond')
+
+# Number of seconds in a single period for the fixed length frequencies.
+PERIOD_SECONDS = {
+    Frequency.WEEKLY: 7 * 24 * 60 * 60,
+    Frequency.DAILY: 24 * 60 * 60,
+    Frequency.HOURLY: 60 * 60,
+    Frequency.MINUTELY: 60,
+    Frequency.SECONDLY: 1
+}
+
+# Every month has at least this many days.
+MIN_MONTH_DAYS = 28
+
+
+def get_by_fields(recurrence):
+    """Gets a dict of the BYxxx fields that have a value for the recurrence.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    """
+    by_fields = {}
+
+    for field_name in BY_FIELD_NAMES:
+        value = getattr(recurrence, field_name, None)
+
+        if value:
+            by_fields[field_name] = value
+
+    return by_fields
+
+
+def get_nth_occurrence(recurrence, n):
+    """Gets the nth (zero based) occurrence of the recurrence without
+    expanding all the occurrences before it. The count and until values of the
+    recurrence are not applied.
+
+    Returns None when the rule can't be computed arithmetically, in which case
+    the caller should fall back to iterating the rrule.
+
+    >>> from datetime import datetime
+    >>> from django_recurrences.rrule import Recurrence
+    >>> recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=4)
+    >>> get_nth_occurrence(recurrence, 9999)
+    datetime.datetime(2014, 2, 21, 15, 0)
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    :param n: the zero based index of the occurrence to get.
+    """
+    dtstart = recurrence.dtstart
+
+    if dtstart is None or recurrence.freq is None or n < 0:
+        return None
+
+    # rrule ignores microseconds
+    dtstart = dtstart.replace(microsecond=0)
+    freq = recurrence.freq
+    interval = recurrence.interval or 1
+    by_fields = get_by_fields(recurrence)
+
+    try:
+        if not by_fields:
+            if freq in PERIOD_SECONDS:
+                return dtstart + timedelta(
+                                seconds=n * interval * PERIOD_SECONDS[freq])
+            elif freq == Frequency.MONTHLY:
+                return _get_nth_month_day(dtstart, interval, [dtstart.day], n)
+            elif freq == Frequency.YEARLY:
+                return _get_nth_year_day(dtstart, interval, n)
+        elif list(by_fields.keys()) == ['byweekday']:
+            if freq == Frequency.WEEKLY or (freq == Frequency.DAILY and
+                                            interval == 1):
+                # Daily by weekday with an interval of 1 is the same as weekly
+                # by weekday with an interval of 1.
+                if freq == Frequency.DAILY:
+                    interval = 1
+
+                return _get_nth_weekday(dtstart=dtstart,
+                                        interval=interval,
+                                        weekdays=by_fields['byweekday'],
+                                        wkst=recurrence.wkst,
+                                        n=n)
+        elif (list(by_fields.keys()) == ['bymonthday'] and
+              freq == Frequency.MONTHLY):
+            return _get_nth_month_day(dtstart, interval,
+                                      by_fields['bymonthday'], n)
+    except (OverflowError, ValueError):
+        # Went past the max date supported by datetime.
+        pass
+
+    return None
+
+
+def get_last_occurrence(recurrence):
+    """Gets the last occurrence for a recurrence that's limited by a count.
+
+    Returns None when the rule can't be computed arithmetically, in which case
+    the caller should fall back to iterating the rrule.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    """
+    if not recurrence.count or recurrence.count < 0 or recurrence.until:
+        return None
+
+    return get_nth_occurrence(recurrence, recurrence.count - 1)
+
+
+def _get_nth_weekday(dtstart, interval, weekdays, wkst, n):
+    """Gets the nth occurrence of a weekly by weekday rule.
+
+    Every week in the rule has the same number of occurrences, so only the
+    first (possibly partial) week needs to be handled separately.
+    """
+    if wkst is None:
+        wkst = calendar.firstweekday()
+
+    offsets = sorted(set((int(day) - wkst) % 7 for day in weekdays))
+    start_offset = (dtstart.weekday() - wkst) % 7
+    first_week_offsets = [o for o in offsets if o >= start_offset]
+
+    if n < len(first_week_offsets):
+        return dtstart + timedelta(days=first_week_offsets[n] - start_offset)
+
+    weeks, index = divmod(n - len(first_week_offsets), len(offsets))
+    days = (weeks + 1) * interval * 7 + offsets[index] - start_offset
+    return dtstart + timedelta(days=days)
+
+
+def _get_month_days(year, month, monthdays):
+    """Gets the sorted days in the month for the bymonthday values. Negative
+    values are counted from the end of the month.
+    """
+    num_days = calendar.monthrange(year, month)[1]
+    days = set()
+
+    for day in monthdays:
+        day = int(day)
+
+        if day < 0:
+            day = num_days + day + 1
+
+        if 1 <= day <= num_days:
+            days.add(day)
+
+    return sorted(days)
+
+
+def _add_months(dtstart, months):
+    """Gets the (year, month) tuple the number of months after the dtstart."""
+    years, month_index = divmod(dtstart.month - 1 + months, 12)
+    return dtstart.year + years, month_index + 1
+
+
+def _get_nth_month_day(dtstart, interval, monthdays, n):
+    """Gets the nth occurrence of a monthly by month day rule.
+
+    When every month contains every month day, the months are skipped
+    arithmetically. Otherwise, the months are walked one period at a time
+    which is still much cheaper than generating each occurrence.
+    """
+    first_month_days = [d for d in _get_month_days(dtstart.year,
+                                                   dtstart.month,
+                                                   monthdays)
+                        if d >= dtstart.day]
+
+    if n < len(first_month_days):
+        return dtstart.replace(day=first_month_days[n])
+
+    n -= len(first_month_days)
+    monthdays = set(int(day) for day in monthdays)
+
+    if (all(0 < day <= MIN_MONTH_DAYS for day in monthdays) or
+        all(-MIN_MONTH_DAYS <= day < 0 for day in monthdays)):
+        months, index = divmod(n, len(monthdays))
+        year, month = _add_months(dtstart, (months + 1) * interval)
+        day = _get_month_days(year, month, monthdays)[index]
+        return dtstart.replace(year=year, month=month, day=day)
+
+    # The month pattern repeats at least every 12 periods. If none of those
+    # periods have an occurrence the rule never occurs again.
+    empty_periods = 0
+    period = 0
+
+    while empty_periods <= 12:
+        period += 1
+        year, month = _add_months(dtstart, period * interval)
+        days = _get_month_days(year, month, monthdays)
+
+        if n < len(days):
+            return dtstart.replace(year=year, month=month, day=days[n])
+
+        n -= len(days)
+        empty_periods = empty_periods + 1 if not days else 0
+
+    return None
+
+
+def _get_nth_year_day(dtstart, interval, n):
+    """Gets the nth occurrence of a yearly rule without any BYxxx filters.
+    The rule occurs on the month and day of the dtstart.
+    """
+    if (dtstart.month, dtstart.day) != (2, 29):
+        return dtstart.replace(year=dtstart.year + n * interval)
+
+    # Feb 29th only occurs in leap years so the years need to be walked.
+    year = dtstart.year
+
+    while n > 0:
+        year += interval
+
+        if year > MAXYEAR:
+            return None
+
+        if calendar.isleap(year):
+            n -= 1
+
+    return dtstart.replace(year=year)
+
+
+def count_occurrences(recurrence, dt):
+    """Counts the occurrences of the recurrence on or before a date without
+    expanding them. The count and until values of the recurrence are not
+    applied.
+
+    Returns None when the rule can't be counted arithmetically, in which case
+    the caller should fall back to iterating the rrule.
+
+    >>> from datetime import datetime
+    >>> from django_recurrences.rrule import Recurrence
+    >>> recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=3)
+    >>> count_occurrences(recurrence, datetime(2013, 12, 31))
+    365
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    :param dt: count the occurrences on or before this date.
+    """
+    dtstart = recurrence.dtstart
+
+    if dtstart is None or recurrence.freq is None:
+        return None
+
+    # rrule ignores microseconds
+    dtstart = dtstart.replace(microsecond=0)
+
+    if dt < dtstart:
+        return 0
+
+    freq = recurrence.freq
+    interval = recurrence.interval or 1
+    by_fields = get_by_fields(recurrence)
+
+    if not by_fields:
+        if freq in PERIOD_SECONDS:
+            delta = dt - dtstart
+            seconds = delta.days * PERIOD_SECONDS[Frequency.DAILY] + \
+                      delta.seconds
+            return seconds // (interval * PERIOD_SECONDS[freq]) + 1
+        elif freq == Frequency.MONTHLY:
+            return _count_month_days(dtstart, interval, [dtstart.day], dt)
+        elif freq == Frequency.YEARLY:
+            return _count_year_days(dtstart, interval, dt)
+    elif list(by_fields.keys()) == ['byweekday']:
+        if freq == Frequency.WEEKLY or (freq == Frequency.DAILY and
+                                        interval == 1):
+            return _count_weekdays(dtstart=dtstart,
+                                   interval=(interval
+                                             if freq == Frequency.WEEKLY
+                                             else 1),
+                                   weekdays=by_fields['byweekday'],
+                                   wkst=recurrence.wkst,
+                                   dt=dt)
+    elif (list(by_fields.keys()) == ['bymonthday'] and
+          freq == Frequency.MONTHLY):
+        return _count_month_days(dtstart, interval, by_fields['bymonthday'],
+                                 dt)
+
+    return None
+
+
+def count_between(recurrence, start, end):
+    """Counts the occurrences of the recurrence between the start and end
+    dates (inclusive) without expanding them. The count and until values of
+    the recurrence are applied.
+
+    Returns None when the rule can't be counted arithmetically.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    :param start: the start of the date range.
+    :param end: the end of the date range.
+    """
+    if recurrence.until and recurrence.until < end:
+        end = recurrence.until
+
+    if end < start:
+        return 0
+
+    through_end = count_occurrences(recurrence, end)
+
+    if through_end is None:
+        return None
+
+    # Occurrences never have microseconds so this counts the occurrences
+    # before the start.
+    before_start = count_occurrences(recurrence,
+                                     start - timedelta(microseconds=1))
+
+    if recurrence.count:
+        through_end = min(through_end, recurrence.count)
+        before_start = min(before_start, recurrence.count)
+
+    return through_end - before_start
+
+
+def _count_weekdays(dtstart, interval, weekdays, wkst, dt):
+    """Counts the occurrences of a weekly by weekday rule on or before dt.
+
+    Every week in the rule has the same number of occurrences, so only the
+    first (possibly partial) week and the week of dt need to be handled
+    separately.
+    """
+    if wkst is None:
+        wkst = calendar.firstweekday()
+
+    offsets = sorted(set((int(day) - wkst) % 7 for day in weekdays))
+    start_offset = (dtstart.weekday() - wkst) % 7
+    # The start of the first week at the time of the dtstart
+    week_start = dtstart - timedelta(days=start_offset)
+    week = (dt - week_start).days // 7
+
+    def _count_week(week, offsets):
+        """Counts the offsets in the week that are on or before dt."""
+        return len([o for o in offsets
+                    if week_start + timedelta(days=week * 7 + o) <= dt])
+
+    first_week_offsets = [o for o in offsets if o >= start_offset]
+
+    if week == 0:
+        return _count_week(0, first_week_offsets)
+
+    count = len(first_week_offsets) + (week - 1) // interval * len(offsets)
+
+    if week % interval == 0:
+        count += _count_week(week, offsets)
+
+    return count
+
+
+def _count_month_days(dtstart, interval, monthdays, dt):
+    """Counts the occurrences of a monthly by month day rule on or before dt.
+
+    When every month contains every month day, the full months are counted
+    arithmetically. Otherwise, the months are walked one period at a time
+    which is still much cheaper than generating each occurrence.
+    """
+    months = (dt.year - dtstart.year) * 12 + dt.month - dtstart.month
+    last_period = months // interval
+
+    def _count_month(period, min_day=1):
+        """Counts the days in the period's month that are on or before dt."""
+        year, month = _add_months(dtstart, period * interval)
+        return len([d for d in _get_month_days(year, month, monthdays)
+                    if d >= min_day and
+                    dtstart.replace(year=year, month=month, day=d) <= dt])
+
+    if last_period == 0:
+        return _count_month(0, min_day=dtstart.day)
+
+    count = _count_month(0, min_day=dtstart.day) + _count_month(last_period)
+    monthdays = set(int(day) for day in monthdays)
+
+    if (all(0 < day <= MIN_MONTH_DAYS for day in monthdays) or
+        all(-MIN_MONTH_DAYS <= day < 0 for day in monthdays)):
+        return count + (last_period - 1) * len(monthdays)
+
+    for period in range(1, last_period):
+        year, month = _add_months(dtstart, period * interval)
+        count += len(_get_month_days(year, month, monthdays))
+
+    return count
+
+
+def _count_year_days(dtstart, interval, dt):
+    """Counts the occurrences of a yearly rule without any BYxxx filters on or
+    before dt. The rule occurs on the month and day of the dtstart.
+    """
+    last_period = (dt.year - dtstart.year) // interval
+
+    if (dtstart.month, dtstart.day) != (2, 29):
+        if (dt.year - dtstart.year) % interval == 0 and \
+           dtstart.replace(year=dt.year) > dt:
+            last_period -= 1
+
+        return last_period + 1
+
+    # Feb 29th only occurs in leap years
+    count = 0
+
+    for period in range(last_period + 1):
+        year = dtstart.year + period * interval
+
+        if calendar.isleap(year) and dtstart.replace(year=year) <= dt:
+            count += 1
+
+    return count
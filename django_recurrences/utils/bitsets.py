@@ -0,0 +1,383 @@
+"""Constant time occurrence membership tests.
+
+A recurrence rule is compiled into bit masks for each of its BYxxx fields
+(including the values rrule implies from the dtstart) so checking if a date
+is an occurrence is a handful of bit tests and some interval arithmetic
+instead of iterating the rrule from the dtstart.
+
+The filters mirror dateutil's rrule implementation. Rules with bysetpos
+can't be checked per date since the set position depends on the other dates
+in the period, so those rules are checked by iterating the rrule.
+"""
+from __future__ import unicode_literals
+
+import calendar
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+
+from dateutil import easter
+
+from ..conf import get_setting
+from ..constants import Frequency
+from .arithmetic import count_occurrences
+from .cache import LRUCache
+
+
+_compiled_cache = None
+
+
+def get_compiled_cache():
+    """Gets the process wide cache of compiled recurrences. The cache is
+    sized by the RECURRENCES_RRULE_CACHE_SIZE setting.
+    """
+    global _compiled_cache
+
+    if _compiled_cache is None:
+        _compiled_cache = LRUCache(max_size=get_setting('RRULE_CACHE_SIZE'))
+
+    return _compiled_cache
+
+
+def to_mask(values, offset=0):
+    """Converts an iterable of ints to a bit mask.
+
+    >>> bin(to_mask([1, 3], offset=-1))
+    '0b101'
+
+    :param values: the int values to set.
+    :param offset: the value added to each int to get its bit index.
+    """
+    mask = 0
+
+    for value in values:
+        mask |= 1 << (int(value) + offset)
+
+    return mask
+
+
+def get_day_fields(recurrence):
+    """Gets a (bymonth, bymonthday, byweekday) tuple for the recurrence
+    including the values rrule implies from the dtstart when the rule doesn't
+    have any day filters.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    """
+    dtstart = recurrence.dtstart
+    freq = recurrence.freq
+    bymonth = recurrence.bymonth
+    bymonthday = recurrence.bymonthday
+    byweekday = recurrence.byweekday
+
+    if not (recurrence.byweekno or recurrence.byyearday or bymonthday or
+            byweekday or recurrence.byeaster):
+        if freq == Frequency.YEARLY:
+            bymonth = bymonth or [dtstart.month]
+            bymonthday = [dtstart.day]
+        elif freq == Frequency.MONTHLY:
+            bymonthday = [dtstart.day]
+        elif freq == Frequency.WEEKLY:
+            byweekday = [dtstart.weekday()]
+
+    return bymonth, bymonthday, byweekday
+
+
+def _has_bit(mask, index):
+    return index >= 0 and (mask >> index) & 1
+
+
+class CompiledRecurrence(object):
+    """A recurrence rule compiled to bit masks.
+
+    >>> from django_recurrences.rrule import Recurrence
+    >>> rule = CompiledRecurrence(Recurrence(dtstart=datetime(2013, 1, 1),
+    ...                                      freq=2, byweekday=[0, 2]))
+    >>> rule.occurs_at(datetime(2013, 1, 2))
+    True
+    >>> rule.occurs_at(datetime(2013, 1, 3))
+    False
+    """
+
+    def __init__(self, recurrence):
+        """
+        :param recurrence: the django_recurrences.rrule.Recurrence object.
+        """
+        # Make sure rrule accepts the rule
+        recurrence.get_rrule()
+        self.recurrence = recurrence
+
+        dtstart = recurrence.dtstart
+
+        if not isinstance(dtstart, datetime):
+            dtstart = datetime.fromordinal(dtstart.toordinal())
+
+        dtstart = dtstart.replace(microsecond=0)
+        freq = recurrence.freq
+
+        self.dtstart = dtstart
+        self.freq = freq
+        self.interval = recurrence.interval or 1
+        self.until = recurrence.until
+        self.count = recurrence.count
+        self.wkst = recurrence.wkst
+
+        if self.wkst is None:
+            self.wkst = calendar.firstweekday()
+
+        bymonth, bymonthday, byweekday = get_day_fields(recurrence)
+        byweekno = recurrence.byweekno
+        byyearday = recurrence.byyearday
+        byeaster = recurrence.byeaster
+
+        self.month_mask = to_mask(bymonth or [], offset=-1)
+        self.month_day_mask = to_mask(d for d in bymonthday or [] if d > 0)
+        self.neg_month_day_mask = to_mask(-d for d in bymonthday or []
+                                          if d < 0)
+        self.weekday_mask = to_mask(byweekday or [])
+        self.year_day_mask = to_mask(d for d in byyearday or [] if d > 0)
+        self.neg_year_day_mask = to_mask(-d for d in byyearday or []
+                                         if d < 0)
+        self.byweekno = set(int(n) for n in byweekno or [])
+        self.byeaster = set(int(o) for o in byeaster or [])
+        self.hour_mask = self._get_time_mask(recurrence.byhour, 24,
+                                             Frequency.HOURLY, dtstart.hour)
+        self.minute_mask = self._get_time_mask(recurrence.byminute, 60,
+                                               Frequency.MINUTELY,
+                                               dtstart.minute)
+        self.second_mask = self._get_time_mask(recurrence.bysecond, 60,
+                                               Frequency.SECONDLY,
+                                               dtstart.second)
+        self._week_number_masks = {}
+
+    def _get_time_mask(self, values, size, freq, default):
+        """Gets the mask for a time field. Frequencies less frequent than the
+        field's frequency occur at the dtstart's value when the field isn't
+        set.
+        """
+        if values:
+            return to_mask(values)
+        elif self.freq < freq:
+            return to_mask([default])
+
+        return (1 << size) - 1
+
+    def occurs_at(self, dt):
+        """Boolean indicating if the datetime is an occurrence of the rule.
+
+        :param dt: the datetime to check.
+        """
+        if (dt.microsecond or dt < self.dtstart or
+            (self.until is not None and dt > self.until)):
+            return False
+
+        if not (_has_bit(self.hour_mask, dt.hour) and
+                _has_bit(self.minute_mask, dt.minute) and
+                _has_bit(self.second_mask, dt.second)):
+            return False
+
+        if not self._in_interval(dt):
+            return False
+
+        if not self._matches_day(dt):
+            return False
+
+        if self.count:
+            count = count_occurrences(self.recurrence, dt)
+
+            if count is None:
+                # Iterating is bounded by the count
+                return dt in self.recurrence.get_rrule()
+
+            return count <= self.count
+
+        return True
+
+    def _in_interval(self, dt):
+        """Boolean indicating if the period containing the datetime is one of
+        the periods the interval includes.
+        """
+        if self.interval == 1:
+            return True
+
+        dtstart = self.dtstart
+        freq = self.freq
+
+        if freq == Frequency.YEARLY:
+            periods = dt.year - dtstart.year
+        elif freq == Frequency.MONTHLY:
+            periods = (dt.year - dtstart.year) * 12 + dt.month - dtstart.month
+        elif freq == Frequency.WEEKLY:
+            periods = (self._get_week_start(dt) -
+                       self._get_week_start(dtstart)).days // 7
+        else:
+            days = (dt.date() - dtstart.date()).days
+
+            if freq == Frequency.DAILY:
+                periods = days
+            elif freq == Frequency.HOURLY:
+                periods = days * 24 + dt.hour - dtstart.hour
+            elif freq == Frequency.MINUTELY:
+                periods = ((days * 24 + dt.hour - dtstart.hour) * 60 +
+                           dt.minute - dtstart.minute)
+            else:
+                periods = (((days * 24 + dt.hour - dtstart.hour) * 60 +
+                            dt.minute - dtstart.minute) * 60 +
+                           dt.second - dtstart.second)
+
+        return periods % self.interval == 0
+
+    def _get_week_start(self, dt):
+        """Gets the date of the start of the week containing the datetime."""
+        return dt.date() - timedelta(days=(dt.weekday() - self.wkst) % 7)
+
+    def _matches_day(self, dt):
+        """Boolean indicating if the day of the datetime passes the day
+        filters of the rule.
+        """
+        day = dt.day
+        month_len = calendar.monthrange(dt.year, dt.month)[1]
+        year_day = dt.timetuple().tm_yday
+        year_len = 365 + calendar.isleap(dt.year)
+
+        if self.month_mask and not _has_bit(self.month_mask, dt.month - 1):
+            return False
+
+        if self.weekday_mask and not _has_bit(self.weekday_mask,
+                                              dt.weekday()):
+            return False
+
+        if ((self.month_day_mask or self.neg_month_day_mask) and
+            not _has_bit(self.month_day_mask, day) and
+            not _has_bit(self.neg_month_day_mask, month_len - day + 1)):
+            return False
+
+        if ((self.year_day_mask or self.neg_year_day_mask) and
+            not _has_bit(self.year_day_mask, year_day) and
+            not _has_bit(self.neg_year_day_mask, year_len - year_day + 1)):
+            return False
+
+        if self.byweekno or self.byeaster:
+            # rrule checks these against the year the period started in which
+            # can be the previous year for weekly periods.
+            year = dt.year
+
+            if self.freq == Frequency.WEEKLY:
+                year = max(self._get_week_start(dt), self.dtstart.date()).year
+
+            index = dt.toordinal() - date(year, 1, 1).toordinal()
+
+            if self.byweekno and not _has_bit(self._get_week_number_mask(year),
+                                              index):
+                return False
+
+            if self.byeaster and (index - (easter.easter(year).toordinal() -
+                                           date(year, 1, 1).toordinal())
+                                  not in self.byeaster):
+                return False
+
+        return True
+
+    def _get_week_number_mask(self, year):
+        """Gets the mask of the day indexes (from Jan 1st) of the year that are
+        in the rule's week numbers. This mirrors how rrule builds its week
+        number mask and is cached per year.
+        """
+        if year in self._week_number_masks:
+            return self._week_number_masks[year]
+
+        wkst = self.wkst
+        byweekno = self.byweekno
+        year_len = 365 + calendar.isleap(year)
+        year_weekday = date(year, 1, 1).weekday()
+        mask = 0
+
+        def _mark_week(i):
+            """Marks the days from the index until the next week start."""
+            marked = 0
+
+            for j in range(7):
+                marked |= 1 << i
+                i += 1
+
+                if (year_weekday + i) % 7 == wkst:
+                    break
+
+            return marked
+
+        no1wkst = firstwkst = (7 - year_weekday + wkst) % 7
+
+        if no1wkst >= 4:
+            no1wkst = 0
+            week_year_len = year_len + (year_weekday - wkst) % 7
+        else:
+            week_year_len = year_len - no1wkst
+
+        div, mod = divmod(week_year_len, 7)
+        num_weeks = div + mod // 4
+
+        for n in byweekno:
+            if n < 0:
+                n += num_weeks + 1
+
+            if not (0 < n <= num_weeks):
+                continue
+
+            if n > 1:
+                i = no1wkst + (n - 1) * 7
+
+                if no1wkst != firstwkst:
+                    i -= 7 - firstwkst
+            else:
+                i = no1wkst
+
+            mask |= _mark_week(i)
+
+        if 1 in byweekno:
+            # Week number 1 of next year
+            i = no1wkst + num_weeks * 7
+
+            if no1wkst != firstwkst:
+                i -= 7 - firstwkst
+
+            if i < year_len:
+                mask |= _mark_week(i)
+
+        if no1wkst:
+            # The last week number of last year
+            if -1 not in byweekno:
+                last_year_weekday = date(year - 1, 1, 1).weekday()
+                last_no1wkst = (7 - last_year_weekday + wkst) % 7
+                last_year_len = 365 + calendar.isleap(year - 1)
+
+                if last_no1wkst >= 4:
+                    last_num_weeks = 52 + (last_year_len + (
+                                    last_year_weekday - wkst) % 7) % 7 // 4
+                else:
+                    last_num_weeks = 52 + (year_len - no1wkst) % 7 // 4
+            else:
+                last_num_weeks = -1
+
+            if last_num_weeks in byweekno:
+                mask |= (1 << no1wkst) - 1
+
+        self._week_number_masks[year] = mask
+        return mask
+
+
+def occurs_at(recurrence, dt):
+    """Boolean indicating if the datetime is an occurrence of the recurrence.
+    The compiled masks are cached by the recurrence's fingerprint so repeated
+    checks for the same rule only do the bit tests.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    :param dt: the datetime to check.
+    """
+    if recurrence.bysetpos:
+        # The set position depends on the other dates in the period
+        return dt in recurrence.get_rrule()
+
+    compiled = get_compiled_cache().get_or_set(
+        recurrence.fingerprint(),
+        lambda: CompiledRecurrence(recurrence)
+    )
+    return compiled.occurs_at(dt)
@@ -0,0 +1,114 @@
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache(object):
+    """A bounded, thread safe, least recently used cache.
+
+    >>> cache = LRUCache(max_size=2)
+    >>> cache.set('a', 1)
+    >>> cache.set('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.set('c', 3)
+    >>> cache.get('b') is None
+    True
+    >>> cache.stats()['evictions']
+    1
+    """
+
+    def __init__(self, max_size=1000):
+        """
+        :param max_size: the max number of items to keep in the cache. A
+            value of 0 disables the cache.
+        """
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Gets the cached value for the key and marks it as the most recently
+        used item.
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Caches the value for the key and evicts the least recently used
+        items when the cache is full.
+        """
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            self._evict()
+
+    def get_or_set(self, key, value_func):
+        """Gets the cached value for the key. If the key isn't cached, the
+        value is created by calling value_func and cached.
+
+        :param key: the cache key.
+        :param value_func: callable that takes no arguments and returns the
+            value to cache.
+        """
+        missing = object()
+        value = self.get(key, default=missing)
+
+        if value is missing:
+            value = value_func()
+            self.set(key, value)
+
+        return value
+
+    def resize(self, max_size):
+        """Changes the max size of the cache, evicting items if needed."""
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def clear(self):
+        """Removes all items from the cache and resets the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Gets a dict of the cache counters."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'max_size': self.max_size
+        }
+
+    def _evict(self):
+        """Evicts the least recently used items until the cache fits within
+        the max size. The lock must be held by the caller.
+        """
+        while len(self._data) > max(self.max_size, 0):
+            self._data.popitem(last=False)
+            self.evictions += 1
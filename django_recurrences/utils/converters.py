@@ -1,5 +1,39 @@
 from __future__ import unicode_literals
 
+from dateutil.rrule import FREQNAMES
+
+from ..conf import get_setting
+from .cache import LRUCache
+
+
+# The order the rule parts are written to a RRULE string so equal rules have
+# equal strings.
+RRULE_PARTS = (('freq', 'FREQ'),
+               ('interval', 'INTERVAL'),
+               ('wkst', 'WKST'),
+               ('count', 'COUNT'),
+               ('bysetpos', 'BYSETPOS'),
+               ('bymonth', 'BYMONTH'),
+               ('bymonthday', 'BYMONTHDAY'),
+               ('byyearday', 'BYYEARDAY'),
+               ('byeaster', 'BYEASTER'),
+               ('byweekno', 'BYWEEKNO'),
+               ('byweekday', 'BYDAY'),
+               ('byhour', 'BYHOUR'),
+               ('byminute', 'BYMINUTE'),
+               ('bysecond', 'BYSECOND'))
+
+RRULE_PART_NAMES = dict((part, field_name)
+                        for field_name, part in RRULE_PARTS)
+
+WEEKDAY_NAMES = {0: 'Monday', 1: 'Tuesday', 2: 'Wednesday', 3: 'Thursday',
+                 4: 'Friday', 5: 'Saturday', 6: 'Sunday'}
+
+WEEKDAY_ABBREVIATIONS = {0: 'MO', 1: 'TU', 2: 'WE', 3: 'TH', 4: 'FR', 5: 'SA',
+                         6: 'SU'}
+
+_rrule_str_cache = None
+
 
 def int_to_weekday(weekday_int, is_abbreviated=False):
     """
@@ -17,22 +51,8 @@ def int_to_weekday(weekday_int, is_abbreviated=False):
         'TU'
 
     """
-    if weekday_int == 0:
-        return 'MO' if is_abbreviated else 'Monday'
-    elif weekday_int == 1:
-        return 'TU' if is_abbreviated else 'Tuesday'
-    elif weekday_int == 2:
-        return 'WE' if is_abbreviated else 'Wednesday'
-    elif weekday_int == 3:
-        return 'TH' if is_abbreviated else 'Thursday'
-    elif weekday_int == 4:
-        return 'FR' if is_abbreviated else 'Friday'
-    elif weekday_int == 5:
-        return 'SA' if is_abbreviated else 'Saturday'
-    elif weekday_int == 6:
-        return 'SU' if is_abbreviated else 'Sunday'
-
-    return ''
+    names = WEEKDAY_ABBREVIATIONS if is_abbreviated else WEEKDAY_NAMES
+    return names.get(weekday_int, '')
 
 
 def weekday_to_int(day):
@@ -62,3 +82,111 @@ def weekday_to_int(day):
             return 6
 
         return -1
+
+
+def to_rrule_str(values):
+    """Packs the rule values into a RFC 5545 RRULE string. The dtstart and
+    until values aren't included.
+
+    >>> rule = to_rrule_str({'freq': 2, 'interval': 2, 'byweekday': [0, 2]})
+    >>> rule == 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE'
+    True
+
+    :param values: dict of rule values keyed by rrule field name.
+    """
+    parts = []
+
+    for field_name, part in RRULE_PARTS:
+        value = values.get(field_name)
+
+        if value is None or value == [] or value == ():
+            continue
+
+        if field_name == 'freq':
+            if value < 0:
+                # Frequency.ONCE isn't a recurrence
+                continue
+
+            value = FREQNAMES[value]
+        elif field_name == 'interval' and value == 1:
+            continue
+        elif field_name == 'wkst':
+            value = int_to_weekday(value, is_abbreviated=True)
+        elif field_name == 'byweekday':
+            value = ','.join(int_to_weekday(v, is_abbreviated=True)
+                             for v in value)
+        elif isinstance(value, (list, tuple)):
+            value = ','.join(str(v) for v in value)
+
+        parts.append('{0}={1}'.format(part, value))
+
+    return ';'.join(parts)
+
+
+def get_rrule_str_cache():
+    """Gets the process wide cache of parsed RRULE strings."""
+    global _rrule_str_cache
+
+    if _rrule_str_cache is None:
+        _rrule_str_cache = LRUCache(max_size=get_setting('RRULE_CACHE_SIZE'))
+
+    return _rrule_str_cache
+
+
+def parse_rrule_str(value):
+    """Parses a RRULE string packed by to_rrule_str into a dict of rule values
+    keyed by rrule field name. List values are returned as tuples since the
+    parsed values are cached and shared, so they shouldn't be modified.
+
+    >>> parse_rrule_str('FREQ=WEEKLY;BYDAY=MO,WE') == {'freq': 2,
+    ...                                                'byweekday': (0, 2)}
+    True
+
+    Raises ValueError for the parts to_rrule_str doesn't write, like UNTIL and
+    DTSTART, and for weekdays with an offset, like "1MO", since the rule
+    fields can't store them.
+
+    :param value: the RRULE string.
+    """
+    if not value:
+        return {}
+
+    return get_rrule_str_cache().get_or_set(value,
+                                            lambda: _parse_rrule_str(value))
+
+
+def _parse_rrule_str(value):
+    values = {}
+
+    for part in value.split(';'):
+        name, part_value = part.split('=', 1)
+        field_name = RRULE_PART_NAMES.get(name.upper())
+
+        if field_name is None:
+            raise ValueError('Unsupported RRULE part "{0}" in "{1}".'.format(
+                                                                name, value))
+
+        if field_name == 'freq':
+            values[field_name] = FREQNAMES.index(part_value.upper())
+        elif field_name == 'wkst':
+            values[field_name] = _parse_weekday(part_value, rrule_str=value)
+        elif field_name == 'byweekday':
+            values[field_name] = tuple(_parse_weekday(v, rrule_str=value)
+                                       for v in part_value.split(','))
+        elif field_name in ('interval', 'count'):
+            values[field_name] = int(part_value)
+        else:
+            values[field_name] = tuple(int(v) for v in part_value.split(','))
+
+    return values
+
+
+def _parse_weekday(day, rrule_str):
+    weekday = weekday_to_int(day)
+
+    if weekday == -1:
+        raise ValueError('Unsupported weekday "{0}" in "{1}". Weekdays with '
+                         'an offset, like "1MO", aren\'t supported.'.format(
+                                                            day, rrule_str))
+
+    return weekday
@@ -0,0 +1,365 @@
+"""Static cost estimates for expanding recurrence rules.
+
+dateutil expands a rule one period of the frequency at a time. For YEARLY,
+MONTHLY, WEEKLY and DAILY rules every day in the period is checked against the
+day filters (bymonth, byweekday, ...) and the days that match are combined
+with the times (byhour, byminute, bysecond). Rules with bysetpos also list the
+days of the period again for each set position. Rules with a frequency
+shorter than a day check one time per iteration and skip the rest of a day
+that doesn't match.
+
+The candidates are counted from the rule values without building the rrule,
+so legal but expensive rules can be rejected before they're expanded. The
+counts are estimates of the work, not exact numbers.
+"""
+from __future__ import division
+from __future__ import unicode_literals
+
+import threading
+from contextlib import contextmanager
+
+from ..conf import get_setting
+from ..constants import Engine
+from ..constants import Frequency
+from ..exceptions import ExpansionBudgetExceeded
+from ..exceptions import HorizonRequired
+from . import arithmetic
+from .arithmetic import get_by_fields
+
+
+DAY_SECONDS = 24 * 60 * 60
+INFINITY = float('inf')
+
+# The average number of days in a period of each frequency that's at least a
+# day long.
+PERIOD_DAYS = {
+    Frequency.YEARLY: 365.25,
+    Frequency.MONTHLY: 30.44,
+    Frequency.WEEKLY: 7,
+    Frequency.DAILY: 1,
+}
+
+# The number of time slots in a day for the frequencies shorter than a day.
+DAY_SLOTS = {
+    Frequency.HOURLY: 24,
+    Frequency.MINUTELY: 24 * 60,
+    Frequency.SECONDLY: DAY_SECONDS,
+}
+
+# The number of distinct values each day filter selects from. A filter with n
+# values matches about n / DAY_FILTER_VALUES[name] of the days.
+DAY_FILTER_VALUES = {
+    'bymonth': 12,
+    'bymonthday': 30.44,
+    'byyearday': 365.25,
+    'byweekno': 52.18,
+    'byweekday': 7,
+    'byeaster': 365.25,
+}
+
+# The (field name, frequency, number of distinct values) of the time fields.
+# A time field filters the time slots of the rules with the same or a shorter
+# frequency and adds times to each slot of the longer ones.
+TIME_FIELDS = (
+    ('byhour', Frequency.HOURLY, 24),
+    ('byminute', Frequency.MINUTELY, 60),
+    ('bysecond', Frequency.SECONDLY, 60),
+)
+
+_local = threading.local()
+
+
+def get_value_counts(recurrence):
+    """Gets the number of distinct values of each BYxxx field of the rule
+    with dateutil's defaults filled in. For example, a YEARLY rule without any
+    day filters only occurs on the month and day of the start date.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    """
+    counts = dict((field_name, len(set(value)))
+                  for field_name, value in get_by_fields(recurrence).items())
+    freq = recurrence.freq
+
+    if not set(counts) & set(['byweekno', 'byyearday', 'bymonthday',
+                              'byweekday', 'byeaster']):
+        if freq == Frequency.YEARLY:
+            counts.setdefault('bymonth', 1)
+            counts['bymonthday'] = 1
+        elif freq == Frequency.MONTHLY:
+            counts['bymonthday'] = 1
+        elif freq == Frequency.WEEKLY:
+            counts['byweekday'] = 1
+
+    # The times default to the time of the start date for the frequencies
+    # longer than the time field.
+    if freq < Frequency.HOURLY:
+        counts.setdefault('byhour', 1)
+
+    if freq < Frequency.MINUTELY:
+        counts.setdefault('byminute', 1)
+
+    if freq < Frequency.SECONDLY:
+        counts.setdefault('bysecond', 1)
+
+    return counts
+
+
+def get_rates(recurrence):
+    """Gets a (occurrences, candidates) tuple of the average number of
+    occurrences and of the candidates dateutil checks per day of the rule.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    """
+    counts = get_value_counts(recurrence)
+    freq = recurrence.freq
+    interval = recurrence.interval or 1
+    day_fraction = 1
+
+    for field_name, num_values in DAY_FILTER_VALUES.items():
+        if field_name in counts:
+            day_fraction *= min(1, counts[field_name] / num_values)
+
+    if freq in PERIOD_DAYS:
+        times = (counts['byhour'] * counts['byminute'] *
+                 counts['bysecond'])
+        days_checked = 1 / interval
+        occurrences = days_checked * day_fraction * times
+
+        if recurrence.bysetpos:
+            num_positions = len(set(recurrence.bysetpos))
+            period_occurrences = occurrences * PERIOD_DAYS[freq] * interval
+            occurrences *= (min(num_positions, period_occurrences) /
+                            period_occurrences if period_occurrences else 0)
+            days_checked *= 1 + num_positions
+
+        return occurrences, days_checked + occurrences
+
+    times = DAY_SLOTS.get(freq, 1) / interval
+
+    for field_name, field_freq, num_values in TIME_FIELDS:
+        if field_name not in counts:
+            continue
+
+        if freq >= field_freq:
+            times *= min(1, counts[field_name] / num_values)
+        else:
+            times *= counts[field_name]
+
+    occurrences = day_fraction * times
+    # Days that don't match are skipped in a single iteration
+    candidates = day_fraction * max(times, 1) + (1 - day_fraction)
+    return occurrences, candidates
+
+
+def estimate_candidates_per_occurrence(recurrence):
+    """Estimates the number of candidates dateutil checks for each
+    occurrence of the rule. Returns infinity for rules that don't occur.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    """
+    if not recurrence.is_recurring() or recurrence.freq is None:
+        return 1
+
+    occurrences, candidates = get_rates(recurrence)
+    return candidates / occurrences if occurrences else INFINITY
+
+
+def estimate_cost(recurrence, after=None, before=None, limit=None):
+    """Estimates the number of candidates dateutil checks to list the dates
+    of the recurrence in the window. rrule always starts at the start date,
+    so the days before the window are counted too. Returns infinity when the
+    expansion isn't bounded by the window, limit, count or until date.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    :param after: the start of the window.
+    :param before: the end of the window.
+    :param limit: the max number of dates listed.
+    """
+    if not recurrence.is_recurring() or recurrence.freq is None:
+        return 1
+
+    occurrences, candidates = get_rates(recurrence)
+    dtstart = recurrence.dtstart
+    days = INFINITY
+
+    if dtstart is not None:
+        for end in (before, recurrence.until):
+            if end is not None:
+                days = min(days, _get_days(dtstart, end))
+
+    if occurrences:
+        if recurrence.count:
+            days = min(days, recurrence.count / occurrences)
+
+        if limit is not None:
+            days_to_after = 0
+
+            if after is not None and dtstart is not None:
+                days_to_after = max(0, _get_days(dtstart, after))
+
+            days = min(days, days_to_after + limit / occurrences)
+
+    if days == INFINITY:
+        return INFINITY
+
+    if recurrence.freq in PERIOD_DAYS:
+        # The days of the first period are all checked
+        days = max(days, PERIOD_DAYS[recurrence.freq] *
+                   (recurrence.interval or 1))
+
+    return int(max(days, 0) * candidates) + 1
+
+
+def _get_days(start, end):
+    return (end - start).total_seconds() / DAY_SECONDS
+
+
+@contextmanager
+def expansion_budget(max_cost):
+    """Limits the total estimated cost of the rule expansions in the block,
+    for example to give each request a budget. Expansions that would go over
+    the remaining budget raise ExpansionBudgetExceeded::
+
+        with expansion_budget(1000000):
+            dates = obj.get_dates(after=start, before=end)
+
+    :param max_cost: the max total number of candidates checked.
+    """
+    previous = getattr(_local, 'remaining', None)
+    _local.remaining = max_cost
+
+    try:
+        yield
+    finally:
+        _local.remaining = previous
+
+
+def get_remaining_budget():
+    """Gets the remaining budget of the current expansion_budget block or
+    None outside of a block.
+    """
+    return getattr(_local, 'remaining', None)
+
+
+def check_budget(recurrence, after=None, before=None, limit=None):
+    """Raises ExpansionBudgetExceeded if the estimated cost of listing the
+    dates in the window is over the RECURRENCES_EXPANSION_BUDGET setting or
+    the remaining budget of the current expansion_budget block. The cost is
+    taken from the remaining budget. Nothing is estimated when neither budget
+    is set.
+
+    Unbounded windows are iterated lazily, so only the cost of getting to the
+    first date is checked.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    :param after: the start of the window.
+    :param before: the end of the window.
+    :param limit: the max number of dates listed.
+    """
+    budget = get_setting('EXPANSION_BUDGET')
+    remaining = get_remaining_budget()
+
+    if not budget and remaining is None:
+        return
+
+    cost = estimate_cost(recurrence, after=after, before=before, limit=limit)
+
+    if cost == INFINITY:
+        cost = estimate_cost(recurrence, after=after, before=before, limit=1)
+
+    if budget and cost > budget:
+        raise ExpansionBudgetExceeded(
+            'Expanding the recurrence would check about {0} candidate dates, '
+            'which is over the budget of {1}.'.format(cost, budget))
+
+    if remaining is not None:
+        if cost > remaining:
+            raise ExpansionBudgetExceeded(
+                'Expanding the recurrence would check about {0} candidate '
+                'dates, which is over the remaining budget of {1}.'.format(
+                                                            cost, remaining))
+
+        _local.remaining = remaining - cost
+
+
+def explain(recurrence, after=None, before=None, limit=None, engine=None):
+    """Describes how the dates of the recurrence would be expanded. Returns a
+    dict with:
+
+    * recurring: if the recurrence is recurring.
+    * open_ended: if the recurrence doesn't have a count or until date.
+    * engine: the engine get_dates would use.
+    * end_date: how the end date is computed. Engine.ARITHMETIC,
+      Engine.DATEUTIL or None for open ended rules.
+    * count_between: Engine.ARITHMETIC or Engine.DATEUTIL.
+    * occurs_at: Engine.BITSETS or Engine.DATEUTIL for rules with bysetpos.
+    * database: if the occurrences can be generated in the database (see
+      django_recurrences.utils.sql).
+    * window_end: the end of the window the dates are listed until.
+    * candidates_per_occurrence: see estimate_candidates_per_occurrence.
+    * estimated_cost: see estimate_cost.
+    * budget: the RECURRENCES_EXPANSION_BUDGET setting.
+    * within_budget: if the estimated cost isn't over the budget.
+
+    See get_dates for the params.
+    """
+    from . import vectorized
+    from .sql import FREQUENCY_SECONDS
+
+    is_recurring = recurrence.is_recurring()
+    by_fields = get_by_fields(recurrence)
+
+    try:
+        window_end = recurrence.get_window_end(after=after, before=before)
+        cost = estimate_cost(recurrence, after=after, before=window_end,
+                             limit=limit)
+    except HorizonRequired:
+        window_end = None
+        cost = INFINITY
+
+    budget = get_setting('EXPANSION_BUDGET')
+    explanation = {
+        'recurring': is_recurring,
+        'open_ended': recurrence.is_open_ended(),
+        'engine': Engine.DATEUTIL,
+        'end_date': None,
+        'count_between': Engine.DATEUTIL,
+        'occurs_at': Engine.BITSETS,
+        'database': not is_recurring or (
+                    recurrence.freq in FREQUENCY_SECONDS and not by_fields),
+        'window_end': window_end,
+        'candidates_per_occurrence': estimate_candidates_per_occurrence(
+                                                                recurrence),
+        'estimated_cost': cost,
+        'budget': budget,
+        'within_budget': not budget or cost <= budget,
+    }
+
+    if not is_recurring:
+        explanation['end_date'] = Engine.ARITHMETIC
+        explanation['count_between'] = Engine.ARITHMETIC
+        explanation['occurs_at'] = Engine.ARITHMETIC
+        return explanation
+
+    if (engine == Engine.NUMPY and
+            vectorized.is_supported(recurrence, before=window_end)):
+        explanation['engine'] = Engine.NUMPY
+
+    if not explanation['open_ended']:
+        if arithmetic.get_last_occurrence(recurrence) is not None:
+            explanation['end_date'] = Engine.ARITHMETIC
+        else:
+            explanation['end_date'] = Engine.DATEUTIL
+
+    start = recurrence.dtstart
+
+    try:
+        if arithmetic.count_between(recurrence, start, start) is not None:
+            explanation['count_between'] = Engine.ARITHMETIC
+    except Exception as e:
+        pass
+
+    if recurrence.bysetpos:
+        explanation['occurs_at'] = Engine.DATEUTIL
+
+    return explanation
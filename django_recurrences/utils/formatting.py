@@ -0,0 +1,168 @@
+"""Human readable recurrence strings.
+
+The frequency part of the string, like "Every Monday and Friday", only
+depends on a few of the rule values and the active language, so it's cached.
+The dates are formatted separately for each recurrence.
+"""
+from __future__ import unicode_literals
+
+from django.utils.translation import get_language
+from django.utils.translation import ugettext as _
+
+from ..conf import get_setting
+from ..constants import Frequency
+from .cache import LRUCache
+from .converters import int_to_weekday
+
+
+DATE_FORMAT = '%b %d, %Y'
+
+_frequency_str_cache = None
+
+
+def get_frequency_str_cache():
+    """Gets the process wide cache of the frequency strings keyed by the rule
+    values they depend on and the language. The cache is sized by the
+    RECURRENCES_RRULE_CACHE_SIZE setting.
+    """
+    global _frequency_str_cache
+
+    if _frequency_str_cache is None:
+        _frequency_str_cache = LRUCache(
+                                    max_size=get_setting('RRULE_CACHE_SIZE'))
+
+    return _frequency_str_cache
+
+
+def get_weekday_str(weekdays):
+    """Takes the byweekday iterable of ints and converts to String days.
+
+    >>> get_weekday_str([0, 2])
+    'Monday and Wednesday'
+    >>> get_weekday_str([0, 1, 2])
+    'Monday, Tuesday and Wednesday'
+
+    :param weekdays: an int weekday or iterable of int weekdays.
+    """
+    if isinstance(weekdays, int):
+        weekdays = [weekdays]
+
+    days = [int_to_weekday(day) for day in weekdays]
+
+    if len(days) < 2:
+        return ''.join(days)
+
+    return '{0}{1}{2}'.format(', '.join(days[:-1]), _(' and '), days[-1])
+
+
+def get_frequency_str(freq, byweekday=None):
+    """Gets the frequency part of the recurrence string, for example
+    "Every Monday and Friday". Returns an empty string when there isn't a
+    frequency.
+
+    :param freq: the django_recurrences.constants.Frequency.
+    :param byweekday: the int weekdays of a weekly rule.
+    """
+    if isinstance(byweekday, list):
+        byweekday = tuple(byweekday)
+
+    key = (freq, byweekday, get_language())
+    cache = get_frequency_str_cache()
+    frequency = cache.get(key)
+
+    if frequency is None:
+        frequency = _get_frequency_str(freq, byweekday)
+        cache.set(key, frequency)
+
+    return frequency
+
+
+def _get_frequency_str(freq, byweekday):
+    if freq == Frequency.YEARLY:
+        return _('Every year')
+    elif freq == Frequency.MONTHLY:
+        return _('Every month')
+    elif freq == Frequency.WEEKLY:
+        weekday_str = get_weekday_str(byweekday) if byweekday else _('week')
+        return _('Every {0}').format(weekday_str)
+    elif freq == Frequency.DAILY:
+        return _('Everyday')
+    elif freq == Frequency.HOURLY:
+        return _('Every hour')
+    elif freq == Frequency.MINUTELY:
+        return _('Every minute')
+    elif freq == Frequency.SECONDLY:
+        return _('Every second')
+
+    return ''
+
+
+def get_dates_str(recurrence):
+    """Gets the dates part of the recurrence string.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    """
+    start_str = recurrence.dtstart.strftime(DATE_FORMAT)
+
+    if not recurrence.is_recurring():
+        return start_str
+
+    if recurrence.count:
+        return _('Starting {0} occurring {1} times').format(start_str,
+                                                            recurrence.count)
+
+    if recurrence.until:
+        return '{0} - {1}'.format(start_str,
+                                  recurrence.until.strftime(DATE_FORMAT))
+
+    return _('Starting {0}').format(start_str)
+
+
+def recurrence_to_str(recurrence):
+    """Formats the recurrence into a human readable string.
+
+    Format:
+
+    * {{ FREQUENCY }}, {{ DATES }}
+
+    Examples:
+
+    * 'Every Tuesday and Thursday, Nov 01, 2011 - Nov 10, 2011'
+    * 'Everyday, Starting Nov 01, 2011 occurring 10 times'
+    * 'Nov 01, 2011' for objects that don't recur
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    """
+    dates_str = get_dates_str(recurrence)
+
+    if not recurrence.is_recurring():
+        return dates_str
+
+    frequency = get_frequency_str(recurrence.freq, recurrence.byweekday)
+
+    if not frequency:
+        return dates_str
+
+    return '{0}, {1}'.format(frequency, dates_str)
+
+
+def render_recurrence_strings(objs):
+    """Gets the recurrence strings for the recurring objects in the same
+    order. Each distinct recurrence is only formatted once, so this is faster
+    than calling recurrence_str() on each object for lists with repeated
+    rules.
+
+    :param objs: iterable of objects using a recurrence model mixin.
+    """
+    strings = {}
+    results = []
+
+    for obj in objs:
+        recurrence = obj.get_recurrence(frozen=True)
+
+        if recurrence not in strings:
+            strings[recurrence] = recurrence_to_str(recurrence)
+
+        results.append(strings[recurrence])
+
+    return results
@@ -0,0 +1,184 @@
+from __future__ import unicode_literals
+
+from collections import deque
+from itertools import islice
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # python 2 without the "futures" backport installed
+    ProcessPoolExecutor = None
+
+
+# The rule fields shipped to the worker processes in this order.
+RULE_FIELD_NAMES = ('start_date', 'end_date', 'freq', 'interval', 'wkst',
+                    'count', 'bysetpos', 'bymonth', 'bymonthday', 'byyearday',
+                    'byeaster', 'byweekno', 'byweekday', 'byhour', 'byminute',
+                    'bysecond')
+
+# The rule fields of the models that store the rule in a packed RRULE string
+# (see AbstractPackedRecurrenceModelMixin).
+PACKED_RULE_FIELD_NAMES = ('start_date', 'end_date', 'rrule')
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def expand_queryset(queryset, start, end, workers=None, chunk_size=None,
+                    errors=None):
+    """Expands the occurrences of every recurring object in the queryset
+    between the start and end dates (inclusive).
+
+    The rule values are streamed from the database as compact tuples and
+    expanded in a process pool so the expansion isn't limited to a single
+    core. The results are yielded in the same order as the queryset.
+
+    Like the model's get_dates, rows that are over the expansion budget or
+    have more than RECURRENCES_MAX_OCCURRENCES occurrences in the range raise
+    a RecurrenceError. Those rows are skipped so one rule doesn't stop the
+    expansion of the rest of the queryset.
+
+    Yields (pk, dates) tuples.
+
+    :param queryset: queryset of a model using AbstractRecurrenceModelMixin.
+    :param start: the start of the date range.
+    :param end: the end of the date range.
+    :param workers: the number of worker processes. If None or 1, or
+        concurrent.futures isn't available, the rules are expanded in the
+        current process.
+    :param chunk_size: the number of rules sent to a worker at a time.
+    :param errors: optional list. A (pk, exception) tuple is appended for
+        each skipped row.
+    """
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    field_names = get_rule_field_names(queryset.model)
+    fields = [queryset.model._meta.get_field(field_name)
+              for field_name in field_names]
+    rows = (_decode_row(fields, row) for row in queryset.values_list(
+                                            'pk', *field_names).iterator())
+    chunks = iter(lambda: list(islice(rows, chunk_size)), [])
+
+    if not workers or workers <= 1 or ProcessPoolExecutor is None:
+        for chunk in chunks:
+            for result in _iter_results(expand_rows(chunk, start, end,
+                                                    field_names=field_names),
+                                        errors=errors):
+                yield result
+
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(expand_rows, chunk, start, end,
+                                           field_names=field_names))
+
+            # Limit the number of chunks held in memory
+            if len(pending) >= workers * 2:
+                for result in _iter_results(pending.popleft().result(),
+                                            errors=errors):
+                    yield result
+
+        while pending:
+            for result in _iter_results(pending.popleft().result(),
+                                        errors=errors):
+                yield result
+    finally:
+        # The consumer may stop early, so don't expand the chunks that are
+        # still queued.
+        for future in pending:
+            future.cancel()
+
+        executor.shutdown(wait=False)
+
+
+def get_rule_field_names(model):
+    """Gets the names of the fields the model stores the rule in.
+
+    :param model: a model using AbstractRecurrenceModelMixin or
+        AbstractPackedRecurrenceModelMixin.
+    """
+    from ..db.models.mixins import AbstractPackedRecurrenceModelMixin
+
+    if issubclass(model, AbstractPackedRecurrenceModelMixin):
+        return PACKED_RULE_FIELD_NAMES
+
+    return RULE_FIELD_NAMES
+
+
+def expand_rows(rows, start, end, field_names=RULE_FIELD_NAMES):
+    """Expands the occurrences of the rule rows between the start and end
+    dates. This is run in the worker processes so it must stay a module level
+    function.
+
+    Returns a list of (pk, dates, error) tuples. The error is the
+    RecurrenceError raised when listing the dates of the row and dates is None
+    when it's set.
+
+    :param rows: list of (pk, start_date, end_date, ...) tuples with the
+        python values of the fields in the order of field_names.
+    :param start: the start of the date range.
+    :param end: the end of the date range.
+    :param field_names: the names of the rule fields (see
+        get_rule_field_names).
+    """
+    from ..exceptions import RecurrenceError
+    from ..rrule import FrozenRecurrence
+    from ..rrule import list_dates
+    from ..rrule import window_dates
+    from .converters import parse_rrule_str
+    from .cost import check_budget
+
+    results = []
+
+    for row in rows:
+        values = dict((field_name, value)
+                      for field_name, value in zip(field_names, row[1:])
+                      if value is not None)
+
+        if 'rrule' in values:
+            values.update(parse_rrule_str(values.pop('rrule')))
+
+        values['dtstart'] = values.pop('start_date')
+        values['until'] = values.pop('end_date', None)
+        recurrence = FrozenRecurrence.from_trusted(**values)
+        dates = [recurrence.dtstart]
+
+        if recurrence.is_recurring():
+            try:
+                # Skip the shared rrule cache since it's per process
+                dates = recurrence.get_rrule(use_cache=False)
+            except Exception as e:
+                pass
+
+        try:
+            check_budget(recurrence, after=start, before=end)
+            results.append((row[0], list_dates(window_dates(
+                                dates, after=start, before=end)), None))
+        except RecurrenceError as e:
+            results.append((row[0], None, e))
+
+    return results
+
+
+def _iter_results(results, errors=None):
+    """Yields the (pk, dates) tuples of the rows that were expanded and adds
+    the others to the errors list.
+    """
+    for pk, dates, error in results:
+        if error is None:
+            yield pk, dates
+        elif errors is not None:
+            errors.append((pk, error))
+
+
+def _decode_row(fields, row):
+    """Converts the database values of a values_list row to the python values
+    of the fields. List fields come back from values_list as their database
+    value.
+    """
+    return (row[0],) + tuple(
+        value if value is None else field.to_python(value)
+        for field, value in zip(fields, row[1:])
+    )
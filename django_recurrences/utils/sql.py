@@ -0,0 +1,242 @@
+"""Expands simple recurrence rules inside the database.
+
+DAILY, WEEKLY and HOURLY rules without any BYxxx fields are a fixed number of
+seconds apart, so their occurrences are generated with a WITH RECURSIVE common
+table expression. Reports like the number of occurrences per day then run in
+the database instead of pulling every occurrence into python. All other rules
+have to be expanded with rrule.
+"""
+from __future__ import unicode_literals
+
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.six import string_types
+
+from ..constants import Frequency
+
+
+# The seconds between the occurrences of each frequency that can be expanded
+# in the database.
+FREQUENCY_SECONDS = {
+    Frequency.WEEKLY: 7 * 24 * 60 * 60,
+    Frequency.DAILY: 24 * 60 * 60,
+    Frequency.HOURLY: 60 * 60,
+}
+
+LIST_FIELD_NAMES = ('bysetpos', 'bymonth', 'bymonthday', 'byyearday',
+                    'byeaster', 'byweekno', 'byweekday', 'byhour', 'byminute',
+                    'bysecond')
+
+# The date arithmetic templates for each database vendor:
+#
+#   param: a datetime query param.
+#   trunc: drops the microseconds like rrule does for the dtstart.
+#   seconds: the seconds since the epoch of a datetime.
+#   add: adds {1} seconds to the datetime {0}.
+#   ceil_div: divides the positive int {0} by {1} rounding up.
+#   date: the date of a datetime.
+VENDOR_SQL = {
+    'sqlite': {
+        'param': '%s',
+        'trunc': 'datetime({0})',
+        'seconds': "CAST(strftime('%%s', {0}) AS INTEGER)",
+        'add': "datetime({0}, '+' || ({1}) || ' seconds')",
+        'ceil_div': '((({0}) + ({1}) - 1) / ({1}))',
+        'date': 'date({0})',
+    },
+    'postgresql': {
+        'param': 'CAST(%s AS TIMESTAMP WITH TIME ZONE)',
+        'trunc': "date_trunc('second', {0})",
+        'seconds': 'CAST(EXTRACT(EPOCH FROM {0}) AS BIGINT)',
+        'add': "({0} + ({1}) * INTERVAL '1 second')",
+        'ceil_div': '((({0}) + ({1}) - 1) / ({1}))',
+        'date': 'CAST({0} AS DATE)',
+    },
+    'mysql': {
+        'param': 'CAST(%s AS DATETIME)',
+        'trunc': '{0}',
+        'seconds': 'UNIX_TIMESTAMP({0})',
+        'add': '({0} + INTERVAL ({1}) SECOND)',
+        'ceil_div': '((({0}) + ({1}) - 1) DIV ({1}))',
+        'date': 'DATE({0})',
+    },
+}
+
+
+def get_expandable_q():
+    """Gets the Q object for the objects whose occurrences can be generated
+    in the database. Non recurring objects are included since they only have
+    the one occurrence. rrule repeats the start date forever for an interval
+    of 0, so those objects are left to rrule.
+    """
+    q = Q(freq__isnull=True) | Q(freq__in=list(FREQUENCY_SECONDS))
+    q &= Q(interval__isnull=True) | Q(interval__gt=0)
+
+    for field_name in LIST_FIELD_NAMES:
+        q &= (Q(**{'{0}__isnull'.format(field_name): True}) |
+              Q(**{field_name: []}))
+
+    return q
+
+
+def get_vendor_sql(connection):
+    """Gets the date arithmetic templates for the database connection."""
+    try:
+        return VENDOR_SQL[connection.vendor]
+    except KeyError:
+        raise NotImplementedError('Expanding recurrences in the database '
+                                  'isn\'t supported for {0}.'.format(
+                                                        connection.vendor))
+
+
+def get_occurrences_cte(queryset, start, end):
+    """Gets the (sql, params) for a WITH RECURSIVE clause defining an
+    "occurrences" table with (object_id, n, start, step, until_date,
+    max_count) columns. The table has the occurrences between the start and
+    end dates of the objects in the queryset that can be expanded in the
+    database (see get_expandable_q) plus at most one row per object outside
+    of the date range. Use get_occurrences_sql to only get the occurrences in
+    the date range.
+
+    The recursion starts at the first occurrence on or after the start date
+    instead of the object's start date so the rows before the date range
+    aren't generated.
+
+    :param queryset: queryset of a model using AbstractRecurrenceModelMixin.
+    :param start: the start of the date range.
+    :param end: the end of the date range.
+    """
+    connection = connections[queryset.db]
+    vendor_sql = get_vendor_sql(connection)
+    opts = queryset.model._meta
+    qn = connection.ops.quote_name
+
+    def _column(field_name):
+        return qn(opts.get_field(field_name).column)
+
+    pk_sql, pk_params = queryset.filter(get_expandable_q()).overlapping(
+                    start=start, end=end).values('pk').query.sql_with_params()
+    start_param = connection.ops.value_to_db_datetime(start)
+    end_param = connection.ops.value_to_db_datetime(end)
+
+    # A NULL interval is an interval of 1 like in get_dates
+    step = 'CASE {0} {1} ELSE NULL END * COALESCE({2}, 1)'.format(
+                _column('freq'),
+                ' '.join('WHEN {0} THEN {1}'.format(freq, seconds)
+                         for freq, seconds
+                         in sorted(FREQUENCY_SECONDS.items())),
+                _column('interval'))
+    # rrule drops the microseconds of the dtstart but get_dates keeps them for
+    # non recurring objects
+    dtstart = vendor_sql['trunc'].format(_column('start_date'))
+    seconds_before_start = '{0} - {1}'.format(
+                vendor_sql['seconds'].format(vendor_sql['param']),
+                vendor_sql['seconds'].format(dtstart))
+    skip = ('CASE WHEN {0} IS NULL OR {1} <= 0 THEN 0 ELSE {2} END'.format(
+                _column('freq'), seconds_before_start,
+                vendor_sql['ceil_div'].format(seconds_before_start, step)))
+    next_start = vendor_sql['add'].format('start', 'step')
+
+    sql = ('WITH RECURSIVE occurrences '
+           '(object_id, n, start, step, until_date, max_count) AS ('
+           'SELECT object_id, skip, '
+           'CASE WHEN skip = 0 THEN start ELSE {add_skip} END, '
+           'step, until_date, max_count FROM ('
+           'SELECT {pk} AS object_id, '
+           'CASE WHEN {freq} IS NULL THEN {start_date} ELSE {dtstart} END '
+           'AS start, {step} AS step, '
+           '{skip} AS skip, {end_date} AS until_date, '
+           '{count} AS max_count '
+           'FROM {table} WHERE {pk} IN ({pk_sql})) rules '
+           'UNION ALL '
+           'SELECT object_id, n + 1, {next_start}, step, until_date, '
+           'max_count '
+           'FROM occurrences '
+           'WHERE step IS NOT NULL '
+           'AND {next_start} <= {param} '
+           'AND (max_count IS NULL OR n + 1 < max_count) '
+           'AND (until_date IS NULL OR {next_start} <= until_date))').format(
+                add_skip=vendor_sql['add'].format('start', 'skip * step'),
+                pk=_column(opts.pk.name),
+                freq=_column('freq'),
+                start_date=_column('start_date'),
+                dtstart=dtstart,
+                step=step,
+                skip=skip,
+                end_date=_column('end_date'),
+                count=_column('count'),
+                table=qn(opts.db_table),
+                pk_sql=pk_sql,
+                next_start=next_start,
+                param=vendor_sql['param'])
+
+    params = [start_param, start_param] + list(pk_params) + [end_param]
+    return sql, params
+
+
+def get_occurrences_sql(queryset, start, end, select='object_id, start'):
+    """Gets the (sql, params) for a query of (object_id, start) rows for the
+    occurrences between the start and end dates (inclusive) of the objects in
+    the queryset that can be expanded in the database. The query can be used
+    as a subquery to join or aggregate the occurrences.
+
+    :param queryset: queryset of a model using AbstractRecurrenceModelMixin.
+    :param start: the start of the date range.
+    :param end: the end of the date range.
+    :param select: the select list for the query on the occurrences table.
+    """
+    connection = connections[queryset.db]
+    vendor_sql = get_vendor_sql(connection)
+    cte_sql, params = get_occurrences_cte(queryset, start=start, end=end)
+    sql = ('{0} SELECT {1} FROM occurrences '
+           'WHERE start >= {2} AND start <= {2} '
+           'AND (max_count IS NULL OR n < max_count) '
+           'AND (until_date IS NULL OR start <= until_date)').format(
+                cte_sql, select, vendor_sql['param'])
+    params.extend([connection.ops.value_to_db_datetime(start),
+                   connection.ops.value_to_db_datetime(end)])
+    return sql, params
+
+
+def count_by_day(queryset, start, end):
+    """Gets the number of occurrences per day between the start and end
+    dates (inclusive) of all the objects in the queryset. The occurrences of
+    the rules that can be expanded in the database are counted with a single
+    aggregate query. The remaining objects are expanded with rrule.
+
+    Returns a list of (date, count) tuples ordered by the date. The dates are
+    in the database's time zone (UTC when USE_TZ is True).
+
+    :param queryset: queryset of a model using AbstractRecurrenceModelMixin.
+    :param start: the start of the date range.
+    :param end: the end of the date range.
+    """
+    connection = connections[queryset.db]
+    vendor_sql = get_vendor_sql(connection)
+    day = vendor_sql['date'].format('start')
+    sql, params = get_occurrences_sql(queryset, start=start, end=end,
+                                      select='{0}, COUNT(*)'.format(day))
+    sql = '{0} GROUP BY {1}'.format(sql, day)
+    counts = {}
+
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+
+    for day, count in cursor.fetchall():
+        if isinstance(day, string_types):
+            day = parse_date(day)
+
+        counts[day] = count
+
+    for obj in queryset.exclude(get_expandable_q()).overlapping(
+                                            start=start, end=end).iterator():
+        for occurrence in obj.get_dates(after=start, before=end):
+            if timezone.is_aware(occurrence):
+                occurrence = occurrence.astimezone(timezone.utc)
+
+            day = occurrence.date()
+            counts[day] = counts.get(day, 0) + 1
+
+    return sorted(counts.items())
@@ -0,0 +1,182 @@
+"""In process instrumentation for the rule expansions.
+
+Timings are only taken when the RECURRENCES_COLLECT_STATS setting is True or
+something is connected to the rule_expanded signal, so there's no overhead
+otherwise. The collected stats can be scraped with registry.snapshot().
+"""
+from __future__ import unicode_literals
+
+import heapq
+from bisect import bisect_left
+from itertools import count
+from threading import Lock
+from timeit import default_timer
+
+from ..conf import get_setting
+from ..signals import rule_expanded
+
+
+# The upper bounds of the histogram buckets. Values above the last bound are
+# counted in an extra overflow bucket.
+DURATION_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1, 10)
+OCCURRENCE_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+# The number of slowest rules to keep.
+SLOWEST_SIZE = 10
+
+
+class Histogram(object):
+    """Counts values in fixed buckets.
+
+    >>> histogram = Histogram(buckets=(1, 10))
+    >>> histogram.observe(5)
+    >>> histogram.observe(50)
+    >>> histogram.to_dict()['counts']
+    [0, 1, 1]
+    """
+
+    def __init__(self, buckets):
+        """
+        :param buckets: sorted tuple of the bucket upper bounds (inclusive).
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def to_dict(self):
+        return {
+            'buckets': list(self.buckets),
+            'counts': list(self.counts),
+            'count': self.count,
+            'total': self.total,
+            'max': self.max
+        }
+
+
+class StatsRegistry(object):
+    """Thread safe registry of counters and histograms."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """Clears all the collected stats."""
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.slowest = []
+            # Breaks ties between equal durations so the fingerprints are
+            # never compared.
+            self._sequence = count()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS):
+        """Adds the value to the named histogram.
+
+        :param buckets: the bucket upper bounds used when the histogram is
+            created.
+        """
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(buckets=buckets)
+
+            self.histograms[name].observe(value)
+
+    def record_slow(self, duration, operation, fingerprint):
+        """Keeps track of the slowest rules."""
+        with self._lock:
+            item = (duration, next(self._sequence), operation, fingerprint)
+
+            if len(self.slowest) < SLOWEST_SIZE:
+                heapq.heappush(self.slowest, item)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def snapshot(self):
+        """Gets a dict of all the collected stats."""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': dict((name, histogram.to_dict())
+                                   for name, histogram
+                                   in self.histograms.items()),
+                'slowest': [{'duration': duration,
+                             'operation': operation,
+                             'fingerprint': repr(fingerprint)}
+                            for duration, sequence, operation, fingerprint
+                            in sorted(self.slowest, reverse=True)]
+            }
+
+
+registry = StatsRegistry()
+
+
+def is_enabled():
+    """Boolean indicating if the rule expansions should be timed."""
+    return bool(rule_expanded.receivers) or get_setting('COLLECT_STATS')
+
+
+def start_timer():
+    """Gets the start time for an instrumented operation or None if the
+    instrumentation is disabled.
+    """
+    return default_timer() if is_enabled() else None
+
+
+def report(sender, operation, recurrence, started, occurrences=None,
+           engine=None, exception=None):
+    """Records the stats for an operation and sends the rule_expanded signal.
+    Does nothing if the timer wasn't started.
+
+    :param sender: the model class of the recurring object.
+    :param operation: the name of the operation.
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    :param started: the value returned from start_timer().
+    :param occurrences: the number of occurrences produced.
+    :param engine: the django_recurrences.constants.Engine that did the work.
+    :param exception: the exception that was swallowed or None.
+    """
+    if started is None:
+        return
+
+    duration = default_timer() - started
+    fingerprint = recurrence.fingerprint()
+
+    if get_setting('COLLECT_STATS'):
+        registry.increment('{0}.calls'.format(operation))
+        registry.observe('{0}.duration'.format(operation), duration)
+
+        if engine:
+            registry.increment('{0}.engine.{1}'.format(operation, engine))
+
+        if exception is not None:
+            registry.increment('{0}.errors'.format(operation))
+
+        if occurrences is not None:
+            registry.observe('{0}.occurrences'.format(operation), occurrences,
+                             buckets=OCCURRENCE_BUCKETS)
+
+        registry.record_slow(duration, operation, fingerprint)
+
+    rule_expanded.send(sender=sender,
+                       operation=operation,
+                       fingerprint=fingerprint,
+                       freq=recurrence.freq,
+                       occurrences=occurrences,
+                       duration=duration,
+                       engine=engine,
+                       exception=exception)
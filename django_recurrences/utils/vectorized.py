@@ -0,0 +1,253 @@
+"""Vectorized occurrence engine for simple periodic rules.
+
+The occurrences of SECONDLY, MINUTELY, HOURLY, DAILY and WEEKLY rules that
+only use the byweekday and byhour filters form an arithmetic progression with
+a mask. Instead of building a python datetime for every occurrence, the
+occurrences are computed as numpy.datetime64 arrays in bounded chunks.
+
+numpy is an optional dependency. When it isn't installed, is_supported always
+returns False.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import calendar
+from datetime import datetime
+
+from ..constants import Frequency
+from .arithmetic import PERIOD_SECONDS
+from .arithmetic import get_by_fields
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+DAY_SECONDS = PERIOD_SECONDS[Frequency.DAILY]
+HOUR_SECONDS = PERIOD_SECONDS[Frequency.HOURLY]
+WEEK_SECONDS = PERIOD_SECONDS[Frequency.WEEKLY]
+
+# The number of candidate times computed at once.
+DEFAULT_CHUNK_SIZE = 2 ** 16
+
+SUPPORTED_BY_FIELDS = set(['byweekday', 'byhour'])
+
+
+def is_supported(recurrence, before=None):
+    """Boolean indicating if the recurrence can be expanded with the
+    vectorized engine.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object.
+    :param before: the end of the window the dates are needed for. A rule
+        must be bounded by a count, until or before date.
+    """
+    dtstart = recurrence.dtstart
+
+    return bool(numpy is not None and
+                isinstance(dtstart, datetime) and
+                dtstart.tzinfo is None and
+                recurrence.freq in PERIOD_SECONDS and
+                (recurrence.count or recurrence.until or before) and
+                set(get_by_fields(recurrence).keys()) <= SUPPORTED_BY_FIELDS)
+
+
+def _to_seconds(dt):
+    """Converts a naive datetime to the number of seconds since the epoch."""
+    if not isinstance(dt, datetime):
+        dt = datetime(dt.year, dt.month, dt.day)
+
+    return calendar.timegm(dt.timetuple())
+
+
+def _lcm(a, b):
+    """Gets the least common multiple of two positive integers."""
+    x, y = a, b
+
+    while y:
+        x, y = y, x % y
+
+    return a * b // x
+
+
+def _get_plan(recurrence):
+    """Gets the arithmetic that defines the candidate times of the rule.
+
+    Returns a dict with:
+
+    * anchor: the epoch seconds the candidate grid is anchored to.
+    * step: the seconds between each candidate.
+    * origin: the epoch seconds the rule periods start at.
+    * period: the length of a rule period in seconds.
+    * interval: only every nth period is included.
+    * weekdays: set of weekdays a candidate must fall on or None.
+    * hours: set of hours a candidate must fall on or None.
+    """
+    dtstart = recurrence.dtstart.replace(microsecond=0)
+    freq = recurrence.freq
+    interval = recurrence.interval or 1
+    start = _to_seconds(dtstart)
+    midnight = start - (start % DAY_SECONDS)
+    weekdays = set(int(d) for d in recurrence.byweekday or []) or None
+    hours = set(int(h) for h in recurrence.byhour or []) or None
+
+    if freq in (Frequency.HOURLY, Frequency.MINUTELY, Frequency.SECONDLY):
+        # Candidates are every interval periods from the dtstart
+        return {'anchor': start,
+                'step': PERIOD_SECONDS[freq] * interval,
+                'origin': start,
+                'period': PERIOD_SECONDS[freq] * interval,
+                'interval': 1,
+                'weekdays': weekdays,
+                'hours': hours}
+
+    if freq == Frequency.WEEKLY:
+        wkst = recurrence.wkst
+
+        if wkst is None:
+            wkst = calendar.firstweekday()
+
+        origin = midnight - ((dtstart.weekday() - wkst) % 7) * DAY_SECONDS
+        period = WEEK_SECONDS
+        weekdays = weekdays or set([dtstart.weekday()])
+    else:
+        origin = midnight
+        period = DAY_SECONDS
+
+    if hours:
+        # byhour expands the daily candidates to each hour at the minute and
+        # second of the dtstart.
+        anchor = midnight + start % HOUR_SECONDS
+        step = HOUR_SECONDS
+    elif freq == Frequency.DAILY:
+        anchor = start
+        step = DAY_SECONDS * interval
+        period = step
+        interval = 1
+    else:
+        anchor = start
+        step = DAY_SECONDS
+
+    return {'anchor': anchor,
+            'step': step,
+            'origin': origin,
+            'period': period,
+            'interval': interval,
+            'weekdays': weekdays,
+            'hours': hours}
+
+
+def _get_mask(times, plan):
+    """Gets the boolean mask for the candidate times that match the rule."""
+    mask = numpy.ones(times.shape, dtype=bool)
+
+    if plan['interval'] > 1:
+        mask &= ((times - plan['origin']) // plan['period']) % \
+                plan['interval'] == 0
+
+    if plan['weekdays']:
+        # The epoch was a Thursday (3)
+        weekdays = (times // DAY_SECONDS + 3) % 7
+        mask &= numpy.in1d(weekdays, sorted(plan['weekdays']))
+
+    if plan['hours']:
+        hours = (times % DAY_SECONDS) // HOUR_SECONDS
+        mask &= numpy.in1d(hours, sorted(plan['hours']))
+
+    return mask
+
+
+def iter_date_chunks(recurrence, after=None, before=None,
+                     chunk_size=DEFAULT_CHUNK_SIZE):
+    """Lazily yields numpy.datetime64 arrays of the occurrences of the
+    recurrence. The window is inclusive so dates equal to after or before are
+    included.
+
+    :param recurrence: the django_recurrences.rrule.Recurrence object. It
+        must be supported by the engine (see is_supported).
+    :param after: only include dates on or after this date.
+    :param before: only include dates on or before this date.
+    :param chunk_size: the max number of candidate times computed at once.
+    """
+    plan = _get_plan(recurrence)
+    start = _to_seconds(recurrence.dtstart.replace(microsecond=0))
+    count = recurrence.count
+    lower = start if after is None else max(start, _to_seconds(after))
+    upper = min(_to_seconds(d) for d in (recurrence.until, before)
+                if d is not None) if (recurrence.until or before) else None
+
+    if count:
+        # The count includes the occurrences before the window
+        first = start
+    else:
+        first = lower
+
+    index = -(-(first - plan['anchor']) // plan['step'])
+    # The candidate mask repeats every cycle seconds. If a full cycle doesn't
+    # have any matches, the rule never occurs.
+    cycle = _lcm(_lcm(WEEK_SECONDS, plan['period'] * plan['interval']),
+                 plan['step'])
+    end_index = index + cycle // plan['step'] + 1
+    matched = 0
+
+    while True:
+        times = plan['anchor'] + plan['step'] * numpy.arange(
+                            index, index + chunk_size, dtype=numpy.int64)
+        index += chunk_size
+
+        if upper is not None:
+            times = times[times <= upper]
+
+        times = times[_get_mask(times, plan)]
+
+        if count:
+            times = times[:count - matched]
+
+        matched += len(times)
+        times = times[times >= lower]
+
+        if len(times):
+            yield times.astype('datetime64[s]')
+
+        if ((count and matched >= count) or
+            (upper is not None and
+             plan['anchor'] + plan['step'] * index > upper) or
+            (not matched and index > end_index)):
+            break
+
+
+def require_numpy():
+    """Raises an ImportError if numpy isn't installed."""
+    if numpy is None:
+        raise ImportError('numpy is required for the numpy engine.')
+
+
+def to_dates_array(dates):
+    """Converts a list of dates to a numpy.datetime64 array."""
+    require_numpy()
+    return numpy.array(dates, dtype='datetime64[s]')
+
+
+def get_dates_array(recurrence, after=None, before=None, limit=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE):
+    """Gets a numpy.datetime64 array of the occurrences of the recurrence.
+    See iter_date_chunks for the params.
+
+    :param limit: the max number of dates to include.
+    """
+    chunks = []
+    total = 0
+
+    for chunk in iter_date_chunks(recurrence, after=after, before=before,
+                                  chunk_size=chunk_size):
+        chunks.append(chunk)
+        total += len(chunk)
+
+        if limit is not None and total >= limit:
+            break
+
+    if not chunks:
+        return numpy.array([], dtype='datetime64[s]')
+
+    dates = numpy.concatenate(chunks)
+    return dates[:limit] if limit is not None else dates
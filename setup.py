@@ -37,6 +37,9 @@ setup(
     install_requires=[
         'python-dateutil>=1.5'
     ],
+    extras_require={
+        'numpy': ['numpy']
+    },
     setup_requires=[
         'django >= 1.5.5',
         'python-dateutil>=1.5',
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""Micro benchmarks for the recurrence hot paths.
+
+From the test directory where the manage.py file is, run::
+
+    python benchmarks.py --output results.json
+
+To check for regressions against a saved run::
+
+    python benchmarks.py --baseline results.json --threshold 1.25
+
+The command exits with a status of 1 when a benchmark is slower than the
+baseline by more than the threshold ratio.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from collections import OrderedDict
+from datetime import datetime
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+import django
+
+if hasattr(django, 'setup'):
+    # Django >= 1.7
+    django.setup()
+
+import dateutil
+from django.http.request import QueryDict
+from django.utils.http import urlencode
+from django_recurrences.constants import Frequency
+from django_recurrences.forms.fields import RecurrenceField
+from django_recurrences.models import Recurrence as RecurrenceModel
+from django_recurrences.rrule import Recurrence
+from django_recurrences.rrule import get_rrule_cache
+
+
+# The minimum time a single timing run should take so the timer resolution
+# doesn't skew the results.
+MIN_RUN_SECONDS = 0.2
+
+DTSTART = datetime(2013, 1, 1, 9, 30)
+
+RECURRENCE_KWARGS = {
+    'dtstart': DTSTART,
+    'freq': Frequency.WEEKLY,
+    'interval': 2,
+    'byweekday': [0, 2, 4],
+    'count': 50
+}
+
+# A bounded rule for each frequency
+FREQUENCY_KWARGS = OrderedDict([
+    ('yearly', {'freq': Frequency.YEARLY, 'count': 100}),
+    ('monthly', {'freq': Frequency.MONTHLY, 'bymonthday': [1, 15],
+                 'count': 100}),
+    ('weekly', {'freq': Frequency.WEEKLY, 'byweekday': [0, 2, 4],
+                'count': 100}),
+    ('daily', {'freq': Frequency.DAILY, 'count': 100}),
+    ('hourly', {'freq': Frequency.HOURLY, 'count': 100}),
+    ('minutely', {'freq': Frequency.MINUTELY, 'count': 100}),
+    ('secondly', {'freq': Frequency.SECONDLY, 'count': 100}),
+])
+
+
+def _get_model(**kwargs):
+    """Gets an unsaved recurrence model with the rule values set."""
+    model_kwargs = dict((k, v) for k, v in kwargs.items()
+                        if k not in ('dtstart', 'until'))
+    return RecurrenceModel(start_date=kwargs.get('dtstart', DTSTART),
+                           end_date=kwargs.get('until'),
+                           **model_kwargs)
+
+
+def _cold(method_name, **kwargs):
+    """Gets a callable that calls the model method on a new model with an
+    empty rrule cache, so the rrule is built every call like the first time a
+    rule is seen.
+    """
+    def func():
+        get_rrule_cache().clear()
+        return getattr(_get_model(**kwargs), method_name)()
+
+    return func
+
+
+def get_benchmarks():
+    """Gets an OrderedDict of benchmark name to the callable to time."""
+    benchmarks = OrderedDict()
+    recurrence = Recurrence(**RECURRENCE_KWARGS)
+    model = _get_model(**RECURRENCE_KWARGS)
+
+    benchmarks['recurrence.init'] = lambda: Recurrence(**RECURRENCE_KWARGS)
+    benchmarks['recurrence.to_dict'] = recurrence.to_dict
+    benchmarks['recurrence.is_recurring'] = recurrence.is_recurring
+    benchmarks['model.get_recurrence'] = model.get_recurrence
+    benchmarks['model.recurrence_str'] = model.recurrence_str
+
+    # The cold benchmarks include building the model and the rrule. The warm
+    # ones call the same model again, which reuses its cached rrule.
+    for name, kwargs in FREQUENCY_KWARGS.items():
+        freq_model = _get_model(dtstart=DTSTART, **kwargs)
+        benchmarks['model.get_rrule.{0}'.format(name)] = _cold(
+                                        'get_rrule', dtstart=DTSTART, **kwargs)
+        benchmarks['model.get_rrule.{0}.warm'.format(name)] = \
+            freq_model.get_rrule
+        benchmarks['model.get_dates.{0}'.format(name)] = _cold(
+                                        'get_dates', dtstart=DTSTART, **kwargs)
+        benchmarks['model.get_dates.{0}.warm'.format(name)] = \
+            freq_model.get_dates
+        # This is the end date computation done by save()
+        benchmarks['model.end_date.{0}'.format(name)] = _cold(
+                                        'get_end_date_from_recurrence',
+                                        dtstart=DTSTART, **kwargs)
+
+    field = RecurrenceField()
+    widget = field.widget
+    data = QueryDict(urlencode([
+        ('recurrence_dtstart', '2013-01-01'),
+        ('recurrence_freq', Frequency.WEEKLY),
+        ('recurrence_interval', 2),
+        ('recurrence_byweekday', 0),
+        ('recurrence_byweekday', 2),
+        ('recurrence_ending', 'count'),
+        ('recurrence_count', 50),
+    ]))
+
+    benchmarks['widget.render'] = lambda: widget.render('recurrence',
+                                                        recurrence)
+    single_widget = RecurrenceField(single_template=True).widget
+    benchmarks['widget.render.single_template'] = \
+        lambda: single_widget.render('recurrence', recurrence)
+    benchmarks['widget.value_from_datadict'] = \
+        lambda: widget.value_from_datadict(data, {}, 'recurrence')
+
+    return benchmarks
+
+
+def time_benchmark(func, repeat=5):
+    """Times the callable. The number of calls per run is increased until a
+    run takes at least MIN_RUN_SECONDS.
+
+    Returns a dict with the best and mean seconds per call.
+
+    :param func: the callable to time.
+    :param repeat: the number of timing runs.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+
+    while True:
+        elapsed = timer.timeit(number)
+
+        if elapsed >= MIN_RUN_SECONDS or number >= 10 ** 7:
+            break
+
+        number *= 10
+
+    timings = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+
+    return {
+        'best': min(timings),
+        'mean': sum(timings) / len(timings),
+        'number': number,
+        'repeat': repeat
+    }
+
+
+def run(names=None, repeat=5):
+    """Runs the benchmarks and gets the results dict.
+
+    :param names: list of substrings. Only benchmarks whose name contains one
+        of them are run.
+    :param repeat: the number of timing runs per benchmark.
+    """
+    results = OrderedDict()
+
+    for name, func in get_benchmarks().items():
+        if names and not any(n in name for n in names):
+            continue
+
+        results[name] = time_benchmark(func, repeat=repeat)
+
+    return {
+        'meta': {
+            'created': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'dateutil': getattr(dateutil, '__version__', None)
+        },
+        'results': results
+    }
+
+
+def compare(results, baseline, threshold):
+    """Compares the results against the baseline results.
+
+    Returns a list of (name, best, baseline best, ratio, regressed) tuples
+    for the benchmarks in both results.
+
+    :param results: the results dict from run().
+    :param baseline: a results dict loaded from a previous run.
+    :param threshold: the ratio above which a benchmark is a regression.
+    """
+    comparisons = []
+
+    for name, result in results['results'].items():
+        base = baseline['results'].get(name)
+
+        if not base or not base['best']:
+            continue
+
+        ratio = result['best'] / base['best']
+        comparisons.append((name, result['best'], base['best'], ratio,
+                            ratio > threshold))
+
+    return comparisons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*',
+                        help='Only run benchmarks whose name contains one of '
+                             'these values.')
+    parser.add_argument('--output', help='Write the JSON results to a file.')
+    parser.add_argument('--baseline',
+                        help='JSON results file to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='The slowdown ratio compared to the baseline '
+                             'that counts as a regression.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='The number of timing runs per benchmark.')
+    args = parser.parse_args(argv)
+
+    results = run(names=args.names, repeat=args.repeat)
+    output = json.dumps(results, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    elif not args.baseline:
+        print(output)
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = 0
+
+    for name, best, base, ratio, regressed in compare(results, baseline,
+                                                      args.threshold):
+        regressions += regressed
+        print('{0:<36} {1:>10.2f}us {2:>10.2f}us {3:>6.2f}x{4}'.format(
+                name, best * 1e6, base * 1e6, ratio,
+                ' REGRESSION' if regressed else ''))
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
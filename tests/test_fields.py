@@ -1,10 +1,18 @@
+from django.forms.widgets import TextInput
 from django.test import TestCase
+from django.test.utils import override_settings
 from tests.test_objects.forms import TestRecurrenceForm
+from tests.test_objects.models import RecurrenceTestModel
 from django_recurrences.constants import Frequency
 from django.http.request import QueryDict
 from django.utils.http import urlencode
 from datetime import datetime
 from django_recurrences.constants import Day
+from django_recurrences.forms.fields import DEFAULT_KEY_ORDER
+from django_recurrences.forms.fields import RecurrenceField
+from django_recurrences.forms.fields import get_form_field_cache
+from django_recurrences.forms.fields import get_rrule_form_fields
+from django_recurrences.rrule import Recurrence
 
 
 class FormFieldRecurrenceValidTests(TestCase):
@@ -257,6 +265,20 @@ class FormFieldRecurrenceInvalidTests(TestCase):
         self.assertFalse(form.is_valid())
         self.assertTrue('By Year Day:' in str(form.errors))
 
+    def test_invalid_byyearday_list(self):
+        """Test a form is not valid when one year day in a list is invalid.
+        """
+        query_string = urlencode({
+            'recurrence_freq': Frequency.YEARLY,
+            'recurrence_ending': 'count',
+            'recurrence_count': 5
+        })
+        query_string += ''.join('&recurrence_byyearday={0}'.format(day)
+                                for day in (1, -366, 367, 200))
+        form = TestRecurrenceForm(data=QueryDict(query_string))
+        self.assertFalse(form.is_valid())
+        self.assertTrue('By Year Day:' in str(form.errors))
+
     def test_invalid_bymonth(self):
         """Test a form is not valid when an invalid month is passed."""
         data = QueryDict(urlencode({
@@ -349,3 +371,110 @@ class FormFieldRecurrenceInvalidTests(TestCase):
         form = TestRecurrenceForm(data=data)
         self.assertFalse(form.is_valid())
         self.assertTrue('Ending:' in str(form.errors))
+
+    @override_settings(RECURRENCES_EXPANSION_BUDGET=100)
+    def test_invalid_over_budget(self):
+        """Test a form is not valid when the rule is too expensive to expand.
+        """
+        data = QueryDict(urlencode({
+            'recurrence_freq': Frequency.DAILY,
+            'recurrence_ending': 'count',
+            'recurrence_dtstart': '2013-01-01',
+            'recurrence_count': 500
+        }))
+        form = TestRecurrenceForm(data=data)
+        self.assertFalse(form.is_valid())
+        self.assertTrue('too expensive' in str(form.errors))
+
+        data = QueryDict(urlencode({
+            'recurrence_freq': Frequency.DAILY,
+            'recurrence_ending': 'count',
+            'recurrence_dtstart': '2013-01-01',
+            'recurrence_count': 20
+        }))
+        form = TestRecurrenceForm(data=data)
+        self.assertTrue(form.is_valid(), msg=form.errors)
+
+
+class FrequencyWidgetTests(TestCase):
+    """Test case for rendering the recurrence widget."""
+
+    def test_single_template_render(self):
+        """Test the single template render mode renders the same html as
+        rendering a template for each field.
+        """
+        widget = RecurrenceField().widget
+        single_widget = RecurrenceField(single_template=True).widget
+        values = [
+            Recurrence(dtstart=datetime(2013, 1, 1), freq=Frequency.WEEKLY,
+                       interval=2, byweekday=[0, 2], count=5),
+            Recurrence(dtstart=datetime(2013, 1, 1), freq=Frequency.MONTHLY,
+                       bymonth=[1, 5], until=datetime(2013, 6, 1)),
+            Recurrence()
+        ]
+
+        for value in values:
+            html = widget.render('recurrence', value)
+            self.assertEqual(single_widget.render('recurrence', value), html)
+            # The cached choice html is reused
+            self.assertEqual(widget.render('recurrence', value), html)
+
+        self.assertIn('id="id_recurrence_ending_count" type="radio" '
+                      'name="recurrence_ending" value="count" '
+                      'checked="checked"',
+                      single_widget.render('recurrence', values[0]))
+
+    def test_render_model_recurrence(self):
+        """Test rendering the recurrence of a model as the initial value."""
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                 freq=Frequency.WEEKLY, byweekday=[0, 2],
+                                 count=5)
+        widget = RecurrenceField().widget
+        html = widget.render('recurrence', tm.get_recurrence())
+
+        tm.recurrence.count = 6
+        self.assertEqual(tm.count, 5)
+        self.assertEqual(widget.render('recurrence', tm.recurrence), html)
+        self.assertEqual(widget.render('recurrence', tm.frozen_recurrence),
+                         html)
+        self.assertIn('value="5"', html)
+
+
+class RRuleFormFieldsTests(TestCase):
+    """Test case for building the rrule form fields."""
+
+    def test_fields_are_copies(self):
+        """Test each call gets its own copies of the cached fields."""
+        fields = get_rrule_form_fields()
+        other_fields = get_rrule_form_fields()
+
+        self.assertEqual(list(fields.keys()), list(DEFAULT_KEY_ORDER))
+
+        for field_name, field in fields.items():
+            self.assertIsNot(field, other_fields[field_name])
+            self.assertIsNot(field.widget, other_fields[field_name].widget)
+
+        fields['interval'].widget.attrs['class'] = 'changed'
+        fields['freq'].choices = []
+        fields = get_rrule_form_fields()
+        self.assertNotIn('class', fields['interval'].widget.attrs)
+        self.assertTrue(fields['freq'].choices)
+
+    def test_field_widgets_not_cached(self):
+        """Test the fields built with custom widgets aren't cached."""
+        cache = get_form_field_cache()
+        cache.clear()
+        fields = get_rrule_form_fields(field_widgets={
+            'interval': TextInput(attrs={'class': 'custom'})
+        })
+
+        self.assertIsInstance(fields['interval'].widget, TextInput)
+        self.assertEqual(fields['interval'].widget.attrs['class'], 'custom')
+        self.assertEqual(len(cache), 0)
+
+    def test_key_order(self):
+        """Test the fields are in the key order."""
+        fields = get_rrule_form_fields(key_order=['freq', 'dtstart', 'count',
+                                                  'until'])
+        self.assertEqual(list(fields.keys()),
+                         ['freq', 'dtstart', 'count', 'until'])
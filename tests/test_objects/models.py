@@ -1,5 +1,25 @@
+from django_recurrences.db.models.mixins import AbstractDayMaskModelMixin
+from django_recurrences.db.models.mixins import AbstractNextOccurrenceModelMixin
+from django_recurrences.db.models.mixins import AbstractPackedRecurrenceModelMixin
 from django_recurrences.db.models.mixins import AbstractRecurrenceModelMixin
 
 
 class RecurrenceTestModel(AbstractRecurrenceModelMixin):
     """Test model that implements."""
+
+
+class MaterializedRecurrenceTestModel(AbstractRecurrenceModelMixin):
+    """Test model that materializes its occurrences."""
+    materialize_occurrences = True
+
+
+class NextOccurrenceTestModel(AbstractNextOccurrenceModelMixin):
+    """Test model that stores its next occurrence."""
+
+
+class PackedRecurrenceTestModel(AbstractPackedRecurrenceModelMixin):
+    """Test model that stores its rule in a RRULE string."""
+
+
+class DayMaskRecurrenceTestModel(AbstractDayMaskModelMixin):
+    """Test model that stores its day filters as bit masks."""
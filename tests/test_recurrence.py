@@ -1,11 +1,53 @@
+import copy
+import pickle
+import sys
+from datetime import date
 from datetime import datetime
+from datetime import timedelta
+from itertools import islice
+from unittest import skipIf
 
 from dateutil.rrule import DAILY
+from dateutil.rrule import HOURLY
+from dateutil.rrule import MINUTELY
+from dateutil.rrule import MONTHLY
+from dateutil.rrule import SECONDLY
+from dateutil.rrule import WEEKLY
+from dateutil.rrule import YEARLY
 from dateutil.rrule import WE, TH
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django.utils.dateparse import parse_datetime
+from django_recurrences.constants import Engine
 from django_recurrences.constants import Frequency
+from django_recurrences.exceptions import ExpansionBudgetExceeded
+from django_recurrences.exceptions import HorizonRequired
+from django_recurrences.exceptions import TooManyOccurrences
+from django_recurrences.models import Occurrence
+from django_recurrences.rrule import FrozenRecurrence
 from django_recurrences.rrule import Recurrence
+from django_recurrences.rrule import get_rrule_cache
+from django_recurrences.signals import rule_expanded
+from django_recurrences.utils import stats
+from django_recurrences.utils import parallel
+from django_recurrences.utils import vectorized
+from django_recurrences.utils.parallel import expand_queryset
+from django_recurrences.utils.sql import get_expandable_q
+from django_recurrences.utils.cache import LRUCache
+from django_recurrences.utils.converters import parse_rrule_str
+from django_recurrences.utils.cost import estimate_candidates_per_occurrence
+from django_recurrences.utils.cost import estimate_cost
+from django_recurrences.utils.cost import expansion_budget
+from django_recurrences.utils.formatting import render_recurrence_strings
 
+from tests.test_objects.models import DayMaskRecurrenceTestModel
+from tests.test_objects.models import MaterializedRecurrenceTestModel
+from tests.test_objects.models import NextOccurrenceTestModel
+from tests.test_objects.models import PackedRecurrenceTestModel
 from tests.test_objects.models import RecurrenceTestModel
 
 
@@ -44,6 +86,25 @@ class FieldTests(TestCase):
 
         self.assertEqual(actual_dates, dates)
 
+    def test_get_dates_window(self):
+        """Test getting the dates for a window of the recurrence."""
+        tm = RecurrenceTestModel(start_date=datetime(2011, 1, 1),
+                                 freq=DAILY)
+        dates = tm.get_dates(after=datetime(2011, 3, 1),
+                             before=datetime(2011, 3, 3))
+
+        self.assertEqual(dates, [datetime(2011, 3, 1),
+                                 datetime(2011, 3, 2),
+                                 datetime(2011, 3, 3)])
+
+    def test_iter_dates_limit(self):
+        """Test lazily iterating the dates with a limit."""
+        recurrence = Recurrence(dtstart=datetime(2011, 1, 1), freq=DAILY)
+        dates = recurrence.iter_dates(after=datetime(2011, 2, 1), limit=2)
+
+        self.assertEqual(list(dates), [datetime(2011, 2, 1),
+                                       datetime(2011, 2, 2)])
+
     def test_no_recurrence(self):
         """Test when there's only 1 occurrence."""
         start_date = datetime(2011, 1, 1)
@@ -119,6 +180,75 @@ class FieldTests(TestCase):
         self.assertEqual(tm.recurrence_str(),
                           u'Every Monday, Wednesday and Friday, Nov 21, 2011 - Dec 02, 2011')
 
+    def test_recurrence_string_all_frequencies(self):
+        """Test the recurrence string for the frequencies with a count and
+        for non recurring objects.
+        """
+        start_date = datetime(2011, 11, 21)
+        tm = RecurrenceTestModel(start_date=start_date, freq=MINUTELY,
+                                 count=3)
+        self.assertEqual(tm.recurrence_str(),
+                         u'Every minute, Starting Nov 21, 2011 occurring 3 '
+                         u'times')
+
+        tm.freq = Frequency.SECONDLY
+        self.assertEqual(tm.recurrence_str(),
+                         u'Every second, Starting Nov 21, 2011 occurring 3 '
+                         u'times')
+
+        tm = RecurrenceTestModel(start_date=start_date, freq=WEEKLY,
+                                 byweekday=[1], count=2)
+        self.assertEqual(tm.recurrence_str(),
+                         u'Every Tuesday, Starting Nov 21, 2011 occurring 2 '
+                         u'times')
+
+        tm = RecurrenceTestModel.objects.create(start_date=start_date)
+        self.assertEqual(tm.recurrence_str(), u'Nov 21, 2011')
+
+    def test_recurrence_string_single_weekday(self):
+        """Test a single weekday doesn't have a space before the comma. This
+        used to render as "Every Tuesday , Nov 22, 2011 - Nov 29, 2011".
+        """
+        tm = RecurrenceTestModel(start_date=datetime(2011, 11, 22),
+                                 end_date=datetime(2011, 11, 29),
+                                 freq=WEEKLY,
+                                 byweekday=[1])
+        self.assertEqual(tm.recurrence_str(),
+                         u'Every Tuesday, Nov 22, 2011 - Nov 29, 2011')
+
+    def test_render_recurrence_strings(self):
+        """Test formatting the recurrence strings for many objects."""
+        start_date = datetime(2011, 11, 21)
+        daily = RecurrenceTestModel(start_date=start_date, freq=DAILY,
+                                    count=3)
+        weekly = RecurrenceTestModel(start_date=start_date, freq=WEEKLY,
+                                     byweekday=[0, 2], count=4)
+        objs = [daily, weekly, daily]
+
+        self.assertEqual(render_recurrence_strings(objs),
+                         [obj.recurrence_str() for obj in objs])
+
+    def test_rule_list_field_validation(self):
+        """Test the list items of the rule fields are validated against the
+        valid values.
+        """
+        tm = RecurrenceTestModel(start_date=datetime(2011, 11, 21),
+                                 freq=YEARLY, count=3,
+                                 byyearday=list(range(1, 367)) + [-1])
+        tm.full_clean()
+        self.assertEqual(tm.byyearday[-1], -1)
+
+        with self.assertRaises(ValidationError):
+            tm.byyearday = [1, 367]
+
+        with self.assertRaises(ValidationError):
+            tm.byweekday = [7]
+
+        self.assertEqual(tm.byyearday[-1], -1)
+        tm.byhour = []
+        tm.full_clean()
+        self.assertEqual(tm.byhour, [])
+
 
 class RecurrenceManagerTests(TestCase):
 
@@ -355,3 +485,1271 @@ class RecurrenceManagerTests(TestCase):
 
         self.assertEqual(tm.end_date, expected_end_date)
         self.assertEqual(tm.until, expected_end_date)
+
+    def test_end_date_by_count_hourly(self):
+        """Test the end date for a large count is computed correctly."""
+        tm = RecurrenceTestModel.objects.create(start_date=self.dates[0],
+                                                freq=Frequency.HOURLY,
+                                                count=10000)
+        self.assertEqual(tm.end_date, datetime(2014, 2, 21, 15))
+
+    def test_end_date_by_count_weekly_byweekday(self):
+        """Test the end date for a weekly by weekday rule."""
+        tm = RecurrenceTestModel.objects.create(start_date=self.dates[0],
+                                                freq=Frequency.WEEKLY,
+                                                interval=2,
+                                                byweekday=[0, 2, 4],
+                                                count=10)
+        self.assertEqual(tm.end_date, tm.get_dates()[-1])
+        self.assertEqual(tm.end_date, datetime(2013, 2, 13))
+
+    def test_end_date_by_count_monthly_bymonthday(self):
+        """Test the end date for a monthly rule on days not in every month."""
+        tm = RecurrenceTestModel.objects.create(start_date=self.dates[0],
+                                                freq=Frequency.MONTHLY,
+                                                bymonthday=[30, -1],
+                                                count=5)
+        self.assertEqual(tm.end_date, tm.get_dates()[-1])
+        self.assertEqual(tm.end_date, datetime(2013, 3, 31))
+
+    def test_occurring_between(self):
+        """Test getting the occurrences for objects between two dates."""
+        daily = RecurrenceTestModel.objects.create(start_date=self.dates[0],
+                                                   freq=Frequency.DAILY,
+                                                   count=5)
+        single = RecurrenceTestModel.objects.create(start_date=self.dates[2])
+        # Outside of the date range
+        RecurrenceTestModel.objects.create(start_date=datetime(2013, 2, 1),
+                                           freq=Frequency.DAILY,
+                                           count=5)
+        occurrences = RecurrenceTestModel.objects.occurring_between(
+                                                        start=self.dates[2],
+                                                        end=self.dates[3])
+
+        self.assertEqual([(obj.id, date) for obj, date in occurrences],
+                         [(daily.id, self.dates[2]),
+                          (single.id, self.dates[2]),
+                          (daily.id, self.dates[3])])
+
+    @override_settings(RECURRENCES_MAX_OCCURRENCES=10)
+    def test_occurring_between_skips_errors(self):
+        """Test an object whose dates can't be listed is skipped instead of
+        failing the query.
+        """
+        daily = RecurrenceTestModel.objects.create(start_date=self.dates[0],
+                                                   freq=Frequency.DAILY,
+                                                   count=5)
+        hourly = RecurrenceTestModel.objects.create(start_date=self.dates[0],
+                                                    freq=Frequency.HOURLY,
+                                                    count=100)
+        errors = []
+        occurrences = RecurrenceTestModel.objects.occurring_between(
+                                                        start=self.dates[0],
+                                                        end=self.dates[1],
+                                                        errors=errors)
+
+        self.assertEqual([(obj.id, date) for obj, date in occurrences],
+                         [(daily.id, self.dates[0]),
+                          (daily.id, self.dates[1])])
+        self.assertEqual([(obj.id, type(e)) for obj, e in errors],
+                         [(hourly.id, TooManyOccurrences)])
+
+
+class BulkRecurrenceTests(TestCase):
+
+    def test_bulk_create_recurrences(self):
+        """Test the end dates are set when bulk creating objects."""
+        start_date = datetime(2013, 1, 1)
+        objs = [RecurrenceTestModel(start_date=start_date, freq=DAILY,
+                                    count=5)
+                for i in range(3)]
+        objs.append(RecurrenceTestModel(start_date=start_date))
+        objs.append(RecurrenceTestModel(start_date=start_date,
+                                        freq=WEEKLY,
+                                        end_date=datetime(2013, 2, 1)))
+        RecurrenceTestModel.objects.bulk_create_recurrences(objs,
+                                                            batch_size=2)
+        end_dates = RecurrenceTestModel.objects.order_by('id').values_list(
+                                                        'end_date', flat=True)
+
+        self.assertEqual(list(end_dates), [datetime(2013, 1, 5),
+                                           datetime(2013, 1, 5),
+                                           datetime(2013, 1, 5),
+                                           start_date,
+                                           datetime(2013, 2, 1)])
+
+    def test_bulk_set_recurrence(self):
+        """Test setting the same recurrence on all objects in a queryset."""
+        for i in range(3):
+            RecurrenceTestModel.objects.create(start_date=datetime(2013, 1, 1))
+
+        updated = RecurrenceTestModel.objects.all().bulk_set_recurrence(
+                                            freq=WEEKLY,
+                                            start_date=datetime(2013, 2, 1),
+                                            byweekday=[0, 2],
+                                            count=4,
+                                            batch_size=2)
+
+        self.assertEqual(updated, 3)
+
+        for tm in RecurrenceTestModel.objects.all():
+            self.assertEqual(tm.freq, WEEKLY)
+            self.assertEqual(tm.byweekday, [0, 2])
+            self.assertEqual(tm.end_date, datetime(2013, 2, 13))
+            self.assertEqual(tm.get_dates()[-1], tm.end_date)
+
+    def test_bulk_materialized(self):
+        """Test the bulk methods write the occurrences of models that
+        materialize them.
+        """
+        manager = MaterializedRecurrenceTestModel.objects
+        manager.bulk_create_recurrences([
+            MaterializedRecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                            freq=DAILY,
+                                            count=count)
+            for count in (2, 3)
+        ])
+
+        self.assertEqual([tm.get_occurrences().count()
+                          for tm in manager.order_by('id')], [2, 3])
+
+        manager.all().bulk_set_recurrence(freq=WEEKLY,
+                                          start_date=datetime(2013, 2, 1),
+                                          count=4)
+        occurrences = Occurrence.objects.between(
+                                    start=datetime(2013, 1, 1),
+                                    end=datetime(2013, 12, 31),
+                                    model=MaterializedRecurrenceTestModel)
+
+        self.assertEqual(len(occurrences), 8)
+        self.assertEqual(sorted(set(o.start for o in occurrences)),
+                         manager.all()[0].get_dates())
+
+
+class OccurrenceTests(TestCase):
+
+    def test_occurrences_materialized_on_save(self):
+        """Test the occurrences are written when the object is saved."""
+        tm = MaterializedRecurrenceTestModel.objects.create(
+                                            start_date=datetime(2013, 1, 1),
+                                            freq=Frequency.DAILY,
+                                            count=3)
+        occurrences = list(tm.get_occurrences())
+
+        self.assertEqual([o.start for o in occurrences],
+                         [datetime(2013, 1, 1),
+                          datetime(2013, 1, 2),
+                          datetime(2013, 1, 3)])
+        self.assertEqual([o.ordinal for o in occurrences], [1, 2, 3])
+
+    def test_occurrences_resynced_on_recurrence_change(self):
+        """Test the occurrences stay in sync when the rule changes."""
+        tm = MaterializedRecurrenceTestModel.objects.create(
+                                            start_date=datetime(2013, 1, 1),
+                                            freq=Frequency.DAILY,
+                                            count=3)
+        tm.set_recurrence(start_date=datetime(2013, 2, 1),
+                          freq=Frequency.WEEKLY,
+                          count=2)
+        tm.save()
+
+        self.assertEqual([o.start for o in tm.get_occurrences()],
+                         [datetime(2013, 2, 1), datetime(2013, 2, 8)])
+
+    def test_occurrences_between(self):
+        """Test the occurrence range lookup across recurring objects."""
+        daily = MaterializedRecurrenceTestModel.objects.create(
+                                            start_date=datetime(2013, 1, 1),
+                                            freq=Frequency.DAILY,
+                                            count=10)
+        MaterializedRecurrenceTestModel.objects.create(
+                                            start_date=datetime(2013, 3, 1))
+        occurrences = Occurrence.objects.between(
+                                    start=datetime(2013, 1, 4),
+                                    end=datetime(2013, 1, 5),
+                                    model=MaterializedRecurrenceTestModel)
+
+        self.assertEqual([(o.object_id, o.start) for o in occurrences],
+                         [(daily.id, datetime(2013, 1, 4)),
+                          (daily.id, datetime(2013, 1, 5))])
+
+    def test_occurrences_synced_in_transaction(self):
+        """Test the object isn't saved without its occurrences when syncing
+        the occurrences fails.
+        """
+        tm = MaterializedRecurrenceTestModel.objects.create(
+                                            start_date=datetime(2013, 1, 1),
+                                            freq=Frequency.DAILY,
+                                            count=3)
+
+        def sync_occurrences():
+            tm.get_occurrences().delete()
+            raise ValueError('Sync failed')
+
+        tm.sync_occurrences = sync_occurrences
+        tm.count = 5
+        tm.end_date = None
+
+        with self.assertRaises(ValueError):
+            tm.save()
+
+        self.assertEqual(MaterializedRecurrenceTestModel.objects.get(
+                                                        id=tm.id).count, 3)
+        self.assertEqual(tm.get_occurrences().count(), 3)
+
+    @override_settings(RECURRENCES_EXPANSION_BUDGET=100)
+    def test_occurrences_sync_over_budget(self):
+        """Test a rule that's too expensive to materialize raises and the
+        object isn't saved.
+        """
+        tm = MaterializedRecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                             end_date=datetime(2014, 1, 1),
+                                             freq=Frequency.SECONDLY)
+
+        self.assertRaises(ExpansionBudgetExceeded, tm.save)
+        self.assertFalse(MaterializedRecurrenceTestModel.objects.exists())
+        self.assertFalse(Occurrence.objects.exists())
+
+    def test_occurrences_deleted_with_object(self):
+        """Test the occurrences are removed when the object is deleted."""
+        tm = MaterializedRecurrenceTestModel.objects.create(
+                                            start_date=datetime(2013, 1, 1),
+                                            freq=Frequency.DAILY,
+                                            count=3)
+        tm.delete()
+
+        self.assertFalse(Occurrence.objects.exists())
+
+
+class RRuleCacheTests(TestCase):
+
+    def test_identical_rules_share_rrule(self):
+        """Test recurrences with the same rule share the compiled rrule."""
+        cache = get_rrule_cache()
+        hits = cache.hits
+        first = Recurrence(dtstart=datetime(1999, 3, 7), freq=DAILY, count=5)
+        second = Recurrence(dtstart=datetime(1999, 3, 7), freq=DAILY, count=5)
+
+        self.assertIs(first.get_rrule(), second.get_rrule())
+        self.assertEqual(cache.hits, hits + 1)
+
+    def test_hit_rate(self):
+        """Test the hit rate for rows that copy a rule. The cache is keyed by
+        the whole rule including the start date, so rows with the same rule
+        and a different start date only hit the cache on later expansions.
+        """
+        start = datetime(2013, 1, 7, 9)
+        objs = [RecurrenceTestModel(start_date=start, freq=WEEKLY,
+                                    byweekday=[0], count=10)
+                for i in range(10)]
+        objs.extend(RecurrenceTestModel(start_date=start + timedelta(days=i),
+                                        freq=WEEKLY, byweekday=[0], count=10)
+                    for i in range(1, 6))
+        RecurrenceTestModel.objects.bulk_create_recurrences(objs)
+        cache = get_rrule_cache()
+        cache.clear()
+
+        for tm in RecurrenceTestModel.objects.all():
+            tm.get_dates()
+
+        self.assertEqual((cache.hits, cache.misses), (9, 6))
+
+        for tm in RecurrenceTestModel.objects.all():
+            tm.get_dates()
+
+        self.assertEqual((cache.hits, cache.misses), (24, 6))
+
+    def test_different_rules_dont_share_rrule(self):
+        """Test recurrences with different rules get different rrules."""
+        first = Recurrence(dtstart=datetime(2013, 1, 1), freq=DAILY, count=5)
+        second = Recurrence(dtstart=datetime(2013, 1, 1), freq=DAILY, count=6)
+
+        self.assertIsNot(first.get_rrule(), second.get_rrule())
+        self.assertEqual(len(list(second.get_rrule())), 6)
+
+    def test_shared_rrule_doesnt_keep_dates(self):
+        """Test the shared rrule doesn't keep the dates it has iterated."""
+        recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=SECONDLY)
+        rule = recurrence.get_rrule()
+        dates = list(islice(rule, 1000))
+
+        self.assertEqual(len(dates), 1000)
+        # dateutil keeps the iterated dates of cached rrules in _cache
+        self.assertIsNone(rule._cache)
+        self.assertIs(recurrence.get_rrule(), rule)
+        self.assertEqual(list(islice(rule, 1000)), dates)
+
+    def test_eviction(self):
+        """Test the least recently used items are evicted."""
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 0,
+                                         'evictions': 1, 'size': 2,
+                                         'max_size': 2})
+
+
+class FrozenRecurrenceTests(TestCase):
+
+    def test_equal_and_hashable(self):
+        """Test frozen recurrences with the same rule are equal and can be
+        used as dict keys.
+        """
+        first = FrozenRecurrence(dtstart=datetime(2013, 1, 1), freq=DAILY,
+                                 byweekday=[WE, TH])
+        second = Recurrence(dtstart='2013-01-01', freq='3',
+                            byweekday=[2, 3]).freeze()
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(set([first, second])), 1)
+        self.assertEqual(first.byweekday, (2, 3))
+
+    def test_immutable(self):
+        """Test frozen recurrences can't be changed."""
+        recurrence = FrozenRecurrence(dtstart=datetime(2013, 1, 1), freq=DAILY)
+
+        with self.assertRaises(AttributeError):
+            recurrence.freq = Frequency.WEEKLY
+
+        self.assertFalse(hasattr(recurrence, '__dict__'))
+
+    def test_pickle_and_copy(self):
+        """Test frozen recurrences can be pickled and copied, so they can be
+        used as keys of the django cache backends.
+        """
+        recurrence = FrozenRecurrence(dtstart=datetime(2013, 1, 1),
+                                      freq=WEEKLY, byweekday=[0, 2], count=5)
+
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            unpickled = pickle.loads(pickle.dumps(recurrence, protocol))
+            self.assertEqual(unpickled, recurrence)
+            self.assertEqual(hash(unpickled), hash(recurrence))
+            self.assertEqual(unpickled.byweekday, (0, 2))
+
+        self.assertIs(copy.copy(recurrence), recurrence)
+        self.assertIs(copy.deepcopy(recurrence), recurrence)
+        self.assertEqual(repr(recurrence),
+                         'FrozenRecurrence(byweekday=(0, 2), count=5, '
+                         'dtstart={0!r}, freq=2, interval=1)'.format(
+                                                    datetime(2013, 1, 1)))
+
+    def test_from_model(self):
+        """Test getting the frozen recurrence from a model."""
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                 freq=DAILY,
+                                 count=3)
+        recurrence = tm.get_recurrence(frozen=True)
+
+        self.assertEqual(recurrence, tm.get_recurrence().freeze())
+        self.assertEqual(recurrence.get_dates(), tm.get_dates())
+
+    def test_model_cache(self):
+        """Test the model caches the recurrence and rrule until a recurrence
+        field is assigned.
+        """
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                 freq=DAILY,
+                                 count=3)
+        recurrence = tm.frozen_recurrence
+        rule = tm.get_rrule()
+
+        self.assertIs(tm.get_recurrence(frozen=True), recurrence)
+        self.assertIs(tm.get_rrule(), rule)
+        self.assertIsNot(tm.get_recurrence(), tm.get_recurrence())
+        self.assertIsNot(tm.recurrence, tm.recurrence)
+
+        tm.count = 5
+        self.assertIsNot(tm.frozen_recurrence, recurrence)
+        self.assertEqual(len(tm.get_dates()), 5)
+
+        tm.set_recurrence(freq=WEEKLY, start_date=datetime(2013, 1, 1),
+                          count=2)
+        self.assertEqual(tm.get_dates(), [datetime(2013, 1, 1),
+                                          datetime(2013, 1, 8)])
+
+        tm.byweekday = [1, 3]
+        self.assertEqual(tm.get_dates(), [datetime(2013, 1, 1),
+                                          datetime(2013, 1, 3)])
+
+    def test_model_cache_packed(self):
+        """Test setting a packed rule value clears the cached recurrence."""
+        tm = PackedRecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                       rrule='FREQ=DAILY;COUNT=3')
+        self.assertEqual(len(tm.get_dates()), 3)
+
+        tm.count = 4
+        self.assertEqual(len(tm.get_dates()), 4)
+
+
+@skipIf(vectorized.numpy is None, 'numpy is not installed')
+class NumpyEngineTests(TestCase):
+
+    def assertDatesEqual(self, dates_array, dates):
+        self.assertEqual([d.astype(datetime) for d in dates_array], dates)
+
+    def test_minutely(self):
+        """Test a minutely rule expands the same as dateutil."""
+        recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=MINUTELY,
+                                interval=7, until=datetime(2013, 1, 31))
+        dates = recurrence.get_dates(engine=Engine.NUMPY)
+
+        self.assertTrue(vectorized.is_supported(recurrence))
+        self.assertEqual(len(dates), 6172)
+        self.assertDatesEqual(dates, recurrence.get_dates())
+
+    def test_weekly_byweekday_byhour(self):
+        """Test a weekly rule with byweekday and byhour filters."""
+        recurrence = Recurrence(dtstart=datetime(2013, 1, 1, 8, 30),
+                                freq=WEEKLY, interval=2, byweekday=[0, 4],
+                                byhour=[9, 17], count=25)
+
+        self.assertDatesEqual(recurrence.get_dates(engine=Engine.NUMPY),
+                              recurrence.get_dates())
+
+    def test_window_chunks(self):
+        """Test a window is expanded in bounded chunks."""
+        recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=HOURLY,
+                                byweekday=[0, 1, 2, 3, 4])
+        after = datetime(2013, 3, 1)
+        before = datetime(2013, 3, 31)
+        chunks = list(vectorized.iter_date_chunks(recurrence, after=after,
+                                                  before=before,
+                                                  chunk_size=100))
+
+        self.assertTrue(len(chunks) > 1)
+        self.assertDatesEqual(
+            recurrence.get_dates(after=after, before=before,
+                                 engine=Engine.NUMPY),
+            recurrence.get_dates(after=after, before=before)
+        )
+
+    def test_unsupported_rule_falls_back(self):
+        """Test a rule the engine doesn't support is expanded by dateutil."""
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                 freq=MONTHLY, bymonthday=[-1], count=3)
+        dates = tm.get_dates(engine=Engine.NUMPY)
+
+        self.assertFalse(vectorized.is_supported(tm.get_recurrence()))
+        self.assertDatesEqual(dates, tm.get_dates())
+
+
+class ParallelExpansionTests(TestCase):
+
+    def setUp(self):
+        super(ParallelExpansionTests, self).setUp()
+        start_date = datetime(2013, 1, 1)
+        RecurrenceTestModel.objects.create(start_date=start_date, freq=DAILY,
+                                           count=10)
+        RecurrenceTestModel.objects.create(start_date=start_date, freq=WEEKLY,
+                                           byweekday=[0, 2, 4],
+                                           end_date=datetime(2013, 3, 1))
+        RecurrenceTestModel.objects.create(start_date=datetime(2013, 1, 3))
+        self.start = datetime(2013, 1, 3)
+        self.end = datetime(2013, 1, 20)
+
+    def get_expected(self):
+        return [(tm.id, tm.get_dates(after=self.start, before=self.end))
+                for tm in RecurrenceTestModel.objects.order_by('id')]
+
+    def test_expand_queryset(self):
+        """Test expanding a queryset in the current process."""
+        results = expand_queryset(RecurrenceTestModel.objects.order_by('id'),
+                                  start=self.start, end=self.end,
+                                  chunk_size=2)
+
+        self.assertEqual(list(results), self.get_expected())
+
+    @skipIf(parallel.ProcessPoolExecutor is None,
+            'concurrent.futures is not installed')
+    def test_expand_queryset_workers(self):
+        """Test expanding a queryset in a process pool keeps the order."""
+        results = expand_queryset(RecurrenceTestModel.objects.order_by('id'),
+                                  start=self.start, end=self.end, workers=2,
+                                  chunk_size=1)
+
+        self.assertEqual(list(results), self.get_expected())
+
+    def test_expand_queryset_packed(self):
+        """Test expanding a queryset of packed rules."""
+        create = PackedRecurrenceTestModel.objects.create
+        create(start_date=datetime(2013, 1, 1), rrule='FREQ=DAILY;COUNT=10')
+        create(start_date=datetime(2013, 1, 1),
+               end_date=datetime(2013, 3, 1),
+               rrule='FREQ=WEEKLY;BYDAY=MO,WE,FR')
+        create(start_date=datetime(2013, 1, 3))
+        queryset = PackedRecurrenceTestModel.objects.order_by('id')
+        expected = [(tm.id, tm.get_dates(after=self.start, before=self.end))
+                    for tm in queryset]
+
+        self.assertEqual(list(expand_queryset(queryset, start=self.start,
+                                              end=self.end)),
+                         expected)
+
+        if parallel.ProcessPoolExecutor is not None:
+            self.assertEqual(list(expand_queryset(queryset, start=self.start,
+                                                  end=self.end, workers=2,
+                                                  chunk_size=1)),
+                             expected)
+
+    @override_settings(RECURRENCES_MAX_OCCURRENCES=10)
+    def test_expand_queryset_skips_errors(self):
+        """Test a row with too many occurrences is skipped and reported
+        instead of stopping the expansion.
+        """
+        expected = self.get_expected()
+        tm = RecurrenceTestModel.objects.create(start_date=self.start,
+                                                freq=HOURLY, count=100)
+        queryset = RecurrenceTestModel.objects.order_by('id')
+        errors = []
+
+        self.assertEqual(list(expand_queryset(queryset, start=self.start,
+                                              end=self.end, chunk_size=2,
+                                              errors=errors)),
+                         expected)
+        self.assertEqual([(pk, type(e)) for pk, e in errors],
+                         [(tm.id, TooManyOccurrences)])
+
+        if parallel.ProcessPoolExecutor is not None:
+            errors = []
+            self.assertEqual(list(expand_queryset(queryset, start=self.start,
+                                                  end=self.end, workers=2,
+                                                  chunk_size=1,
+                                                  errors=errors)),
+                             expected)
+            self.assertEqual([(pk, type(e)) for pk, e in errors],
+                             [(tm.id, TooManyOccurrences)])
+
+
+class NextOccurrenceTests(TestCase):
+
+    def test_next_occurrence_set_on_save(self):
+        """Test the next occurrence is set when the object is saved."""
+        start_date = datetime(2013, 1, 1)
+        tm = NextOccurrenceTestModel.objects.create(
+                                            start_date=start_date,
+                                            end_date=datetime(2100, 1, 1),
+                                            freq=DAILY)
+        past = NextOccurrenceTestModel.objects.create(start_date=start_date,
+                                                      freq=DAILY,
+                                                      count=5)
+        now = datetime.now()
+
+        self.assertTrue(now <= tm.next_occurrence)
+        self.assertEqual(tm.next_occurrence, tm.get_next_occurrence(after=now))
+        self.assertIsNone(past.next_occurrence)
+
+    def test_next_occurrence_bulk(self):
+        """Test the bulk create and update methods set the next occurrence."""
+        manager = NextOccurrenceTestModel.objects
+        manager.bulk_create_recurrences([
+            NextOccurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                    end_date=datetime(2100, 1, 1),
+                                    freq=DAILY),
+            NextOccurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                    freq=DAILY,
+                                    count=5),
+        ])
+        now = datetime.now()
+
+        for tm in manager.all():
+            self.assertEqual(tm.next_occurrence,
+                             tm.get_next_occurrence(after=now))
+
+        self.assertEqual(manager.filter(next_occurrence__isnull=True).count(),
+                         1)
+
+        start_date = datetime(2100, 1, 1, 9)
+        manager.all().bulk_set_recurrence(freq=WEEKLY, start_date=start_date,
+                                          count=2)
+        self.assertEqual(
+            list(manager.values_list('next_occurrence', flat=True)),
+            [start_date, start_date])
+
+    def test_advance_next_occurrence(self):
+        """Test advancing the next occurrence from the rebased rule."""
+        tm = NextOccurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                     freq=WEEKLY, interval=2,
+                                     byweekday=[0, 4],
+                                     next_occurrence=datetime(2013, 1, 14))
+        now = datetime(2013, 2, 2)
+
+        self.assertEqual(tm.advance_next_occurrence(now=now),
+                         datetime(2013, 2, 11))
+        self.assertEqual(tm.next_occurrence,
+                         tm.get_next_occurrence(after=now))
+
+    def test_advance_next_occurrences_command(self):
+        """Test the command advances the objects whose next occurrence has
+        passed.
+        """
+        start_date = datetime(2013, 1, 1)
+        daily = NextOccurrenceTestModel.objects.create(
+                                            start_date=start_date,
+                                            end_date=datetime(2100, 1, 1),
+                                            freq=DAILY)
+        single = NextOccurrenceTestModel.objects.create(start_date=start_date)
+        NextOccurrenceTestModel.objects.all().update(
+                                                next_occurrence=start_date)
+
+        call_command('advance_next_occurrences', chunk_size=1, verbosity=0)
+
+        daily = NextOccurrenceTestModel.objects.get(id=daily.id)
+        self.assertTrue(daily.next_occurrence > start_date)
+        self.assertEqual(daily.next_occurrence, daily.get_next_occurrence())
+        self.assertIsNone(NextOccurrenceTestModel.objects.get(
+                                            id=single.id).next_occurrence)
+
+
+class CountBetweenTests(TestCase):
+
+    def test_count_between_arithmetic(self):
+        """Test counting a rule that's counted arithmetically."""
+        recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=WEEKLY,
+                                byweekday=[0, 2, 4], count=100)
+        start = datetime(2013, 7, 1)
+        end = datetime(2013, 9, 30)
+
+        self.assertEqual(recurrence.count_between(start, end),
+                         len(recurrence.get_dates(after=start, before=end)))
+
+    def test_count_between_iterated(self):
+        """Test counting a rule that's counted by iterating the rrule."""
+        recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=MONTHLY,
+                                byweekday=[0, 1, 2, 3, 4], bysetpos=[-1],
+                                until=datetime(2014, 1, 1))
+        start = datetime(2013, 7, 1)
+        end = datetime(2013, 9, 30)
+
+        self.assertEqual(recurrence.count_between(start, end), 3)
+
+    def test_model_count_between(self):
+        """Test counting the occurrences of an object."""
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 31),
+                                 freq=MONTHLY,
+                                 end_date=datetime(2013, 12, 31))
+        single = RecurrenceTestModel(start_date=datetime(2013, 1, 31))
+
+        self.assertEqual(tm.count_between(datetime(2013, 1, 1),
+                                          datetime(2013, 6, 30)), 3)
+        self.assertEqual(single.count_between(datetime(2013, 1, 1),
+                                              datetime(2013, 6, 30)), 1)
+
+
+class OpenEndedTests(TestCase):
+
+    def test_save_open_ended(self):
+        """Test saving a rule without a count or end date doesn't expand the
+        occurrences.
+        """
+        tm = RecurrenceTestModel.objects.create(
+                                        start_date=datetime(2013, 1, 1),
+                                        freq=Frequency.SECONDLY)
+        self.assertIsNone(tm.end_date)
+        self.assertTrue(tm.get_recurrence().is_open_ended())
+        self.assertEqual(RecurrenceTestModel.objects.overlapping(
+                                        start=datetime(2020, 1, 1),
+                                        end=datetime(2020, 1, 2)).count(), 1)
+
+    @override_settings(RECURRENCES_OPEN_ENDED_HORIZON_DAYS=30)
+    def test_get_dates_horizon(self):
+        """Test the dates of an open ended rule are listed until the horizon.
+        """
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1), freq=DAILY)
+        dates = tm.get_dates()
+
+        self.assertEqual(len(dates), 31)
+        self.assertEqual(dates[-1], datetime(2013, 1, 31))
+        self.assertEqual(tm.get_dates(after=datetime(2014, 1, 1))[-1],
+                         datetime(2014, 1, 31))
+        self.assertEqual(len(tm.get_dates(before=datetime(2013, 3, 1))), 60)
+
+    @override_settings(RECURRENCES_OPEN_ENDED_HORIZON_DAYS=None)
+    def test_get_dates_horizon_required(self):
+        """Test an end date is required when there isn't a horizon."""
+        recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=DAILY)
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1), freq=DAILY)
+
+        self.assertRaises(HorizonRequired, recurrence.get_dates)
+        self.assertRaises(HorizonRequired, tm.get_dates)
+        self.assertEqual(len(tm.get_dates(before=datetime(2013, 1, 10))), 10)
+
+    @override_settings(RECURRENCES_MAX_OCCURRENCES=10)
+    def test_max_occurrences(self):
+        """Test listing more dates than the max raises an error."""
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1), freq=DAILY,
+                                 count=11)
+
+        self.assertRaises(TooManyOccurrences, tm.get_dates)
+        self.assertRaises(TooManyOccurrences, tm.get_recurrence().get_dates)
+        self.assertEqual(len(tm.get_dates(limit=5)), 5)
+        self.assertEqual(len(tm.get_dates(before=datetime(2013, 1, 10))), 10)
+
+        tm.count = 10
+        self.assertEqual(len(tm.get_dates()), 10)
+
+    def test_end_date_limited(self):
+        """Test computing the end date of a rule that has to be expanded
+        doesn't enumerate a huge count.
+        """
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                 freq=MONTHLY, byweekday=[0, 2],
+                                 count=10 ** 9)
+
+        self.assertRaises(ExpansionBudgetExceeded, tm.save)
+
+        with override_settings(RECURRENCES_EXPANSION_BUDGET=None,
+                               RECURRENCES_MAX_OCCURRENCES=100):
+            self.assertRaises(TooManyOccurrences, tm.save)
+
+            tm.count = 100
+            tm.save()
+            self.assertEqual(tm.end_date, tm.get_dates()[-1])
+
+        self.assertFalse(RecurrenceTestModel.objects.exclude(
+                                                    id=tm.id).exists())
+
+
+class CostEstimateTests(TestCase):
+
+    def test_estimate_cost(self):
+        """Test expensive rules are estimated to check more candidates."""
+        dtstart = datetime(2013, 1, 1)
+        daily = Recurrence(dtstart=dtstart, freq=DAILY, count=100)
+        yearly = Recurrence(dtstart=dtstart, freq=YEARLY, count=100)
+        setpos = Recurrence(dtstart=dtstart, freq=YEARLY, count=100,
+                            byyearday=list(range(1, 367)),
+                            bysetpos=list(range(1, 367)))
+
+        self.assertEqual(estimate_candidates_per_occurrence(daily), 2)
+        self.assertTrue(estimate_cost(daily) < estimate_cost(yearly))
+        self.assertTrue(estimate_cost(yearly) < estimate_cost(setpos))
+        self.assertEqual(estimate_cost(daily, before=datetime(2013, 1, 10)),
+                         19)
+        self.assertEqual(estimate_cost(Recurrence(dtstart=dtstart,
+                                                  freq=DAILY)), float('inf'))
+
+    @override_settings(RECURRENCES_EXPANSION_BUDGET=1000)
+    def test_budget(self):
+        """Test listing the dates of a rule over budget raises an error."""
+        recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=SECONDLY,
+                                byeaster=[0], count=5000)
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                 freq=SECONDLY, byeaster=[0], count=5000)
+
+        self.assertRaises(ExpansionBudgetExceeded, recurrence.get_dates)
+        self.assertRaises(ExpansionBudgetExceeded, tm.get_dates)
+        self.assertRaises(ExpansionBudgetExceeded, next, tm.iter_dates())
+        self.assertRaises(ExpansionBudgetExceeded, list,
+                          recurrence.iter_dates())
+        self.assertEqual(len(tm.get_dates(limit=10)), 10)
+        self.assertEqual(len(list(recurrence.iter_dates(limit=10))), 10)
+
+    def test_expansion_budget(self):
+        """Test the expansions in an expansion_budget block share the
+        budget.
+        """
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1), freq=DAILY,
+                                 count=100)
+
+        with expansion_budget(300):
+            self.assertEqual(len(tm.get_dates()), 100)
+            self.assertRaises(ExpansionBudgetExceeded, tm.get_dates)
+            self.assertEqual(len(tm.get_dates(limit=10)), 10)
+
+        self.assertEqual(len(tm.get_dates()), 100)
+
+    def test_explain(self):
+        """Test explaining how the rules are expanded."""
+        daily = RecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                    freq=DAILY, count=10)
+        explanation = daily.explain()
+
+        self.assertEqual(explanation['engine'], Engine.DATEUTIL)
+        self.assertEqual(explanation['end_date'], Engine.ARITHMETIC)
+        self.assertEqual(explanation['count_between'], Engine.ARITHMETIC)
+        self.assertEqual(explanation['occurs_at'], Engine.BITSETS)
+        self.assertTrue(explanation['database'])
+        self.assertTrue(explanation['within_budget'])
+
+        setpos = Recurrence(dtstart=datetime(2013, 1, 1), freq=MONTHLY,
+                            byweekday=[4], bysetpos=[-1])
+        explanation = setpos.explain(before=datetime(2014, 1, 1))
+
+        self.assertTrue(explanation['open_ended'])
+        self.assertIsNone(explanation['end_date'])
+        self.assertEqual(explanation['count_between'], Engine.DATEUTIL)
+        self.assertEqual(explanation['occurs_at'], Engine.DATEUTIL)
+        self.assertFalse(explanation['database'])
+        self.assertEqual(explanation['window_end'], datetime(2014, 1, 1))
+
+
+class AsyncTestMixin(object):
+    """Runs the coroutines without async syntax so the tests still parse on
+    older pythons.
+    """
+
+    def run_async(self, awaitable):
+        import asyncio
+        return asyncio.get_event_loop().run_until_complete(awaitable)
+
+    def collect(self, async_iterator):
+        """Lists the items of an async iterator."""
+        items = []
+
+        while True:
+            try:
+                items.append(self.run_async(async_iterator.__anext__()))
+            except StopAsyncIteration:
+                return items
+
+
+@skipIf(sys.version_info < (3, 6), 'the async API requires python 3.6')
+class AsyncTests(AsyncTestMixin, TestCase):
+
+    def test_aget_dates(self):
+        """Test getting the dates on and off the event loop."""
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1), freq=DAILY,
+                                 count=100)
+        after = datetime(2013, 2, 1)
+
+        self.assertEqual(self.run_async(tm.aget_dates(after=after)),
+                         tm.get_dates(after=after))
+
+        with override_settings(RECURRENCES_ASYNC_INLINE_COST=None):
+            self.assertEqual(self.run_async(tm.aget_dates(after=after)),
+                             tm.get_dates(after=after))
+
+    def test_aiter_occurrences(self):
+        """Test iterating the dates in chunks."""
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1), freq=HOURLY)
+        before = datetime(2013, 1, 31)
+        chunks = self.collect(tm.aiter_occurrences(before=before,
+                                                   chunk_size=100))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [100] * 7 + [21])
+        self.assertEqual([dt for chunk in chunks for dt in chunk],
+                         tm.get_dates(before=before))
+
+        with override_settings(RECURRENCES_ASYNC_INLINE_COST=None):
+            chunks = self.collect(tm.aiter_occurrences(before=before,
+                                                       chunk_size=500))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [500, 221])
+
+
+@skipIf(sys.version_info < (3, 6), 'the async API requires python 3.6')
+class AsyncManagerTests(AsyncTestMixin, TransactionTestCase):
+    """The queries run in the executor threads, so the objects have to be
+    committed for the threads to see them.
+    """
+
+    def setUp(self):
+        create = RecurrenceTestModel.objects.create
+        self.daily = create(start_date=datetime(2013, 1, 1), freq=DAILY,
+                            count=10)
+        self.hourly = create(start_date=datetime(2013, 1, 2), freq=HOURLY,
+                             count=30)
+        self.single = create(start_date=datetime(2013, 1, 3, 12))
+        self.start = datetime(2013, 1, 2)
+        self.end = datetime(2013, 1, 4)
+
+    def test_acreate(self):
+        """Test creating an object computes the end date."""
+        tm = self.run_async(RecurrenceTestModel.objects.acreate(
+                                            start_date=datetime(2013, 1, 1),
+                                            freq=DAILY,
+                                            count=5))
+
+        self.assertEqual(tm.end_date, datetime(2013, 1, 5))
+        self.assertEqual(RecurrenceTestModel.objects.get(id=tm.id).end_date,
+                         datetime(2013, 1, 5))
+
+    def test_abulk_create_recurrences(self):
+        """Test creating objects in bulk computes the end dates."""
+        objs = [RecurrenceTestModel(start_date=datetime(2014, 1, 1),
+                                    freq=DAILY, count=count)
+                for count in (2, 3)]
+        self.run_async(RecurrenceTestModel.objects.abulk_create_recurrences(
+                                                                        objs))
+        end_dates = RecurrenceTestModel.objects.filter(
+                                start_date=datetime(2014, 1, 1)).order_by(
+                                'end_date').values_list('end_date', flat=True)
+
+        self.assertEqual(list(end_dates), [datetime(2014, 1, 2),
+                                           datetime(2014, 1, 3)])
+
+    def test_aoccurring_between(self):
+        """Test getting the occurrences between two dates."""
+        manager = RecurrenceTestModel.objects
+        occurrences = self.run_async(manager.aoccurring_between(
+                                                            start=self.start,
+                                                            end=self.end))
+
+        self.assertEqual(len(occurrences), 34)
+        self.assertEqual(occurrences, manager.occurring_between(
+                                                            start=self.start,
+                                                            end=self.end))
+        self.assertEqual(
+            self.run_async(manager.acount_occurrences_by_day(start=self.start,
+                                                             end=self.end)),
+            manager.count_occurrences_by_day(start=self.start, end=self.end))
+
+    def test_aiter_occurrences(self):
+        """Test iterating the occurrences in chunks."""
+        manager = RecurrenceTestModel.objects
+        chunks = self.collect(manager.aiter_occurrences(start=self.start,
+                                                        end=self.end,
+                                                        chunk_size=10))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 10, 4])
+        self.assertEqual(
+            sorted((obj.id, dt) for chunk in chunks for obj, dt in chunk),
+            sorted((obj.id, dt) for obj, dt in manager.occurring_between(
+                                                            start=self.start,
+                                                            end=self.end)))
+
+    def test_aiter_occurrences_batches(self):
+        """Test fetching the objects in batches ordered by primary key."""
+        manager = RecurrenceTestModel.objects
+        chunks = self.collect(manager.aiter_occurrences(start=self.start,
+                                                        end=self.end,
+                                                        chunk_size=10,
+                                                        batch_size=1))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 10, 4])
+        self.assertEqual(
+            [(obj.id, dt) for chunk in chunks for obj, dt in chunk],
+            sorted((obj.id, dt) for obj, dt in manager.occurring_between(
+                                                            start=self.start,
+                                                            end=self.end)))
+
+    def test_aiter_occurrences_yields(self):
+        """Test the event loop gets a turn after each object, even when each
+        object has fewer dates than the chunk size.
+        """
+        import asyncio
+        loop = asyncio.get_event_loop()
+        RecurrenceTestModel.objects.bulk_create([
+            RecurrenceTestModel(start_date=datetime(2013, 1, 3, hour),
+                                end_date=datetime(2013, 1, 3, hour))
+            for hour in range(20)
+        ])
+        ticks = []
+        ticking = [True]
+
+        def tick():
+            # Runs once per turn of the event loop
+            if ticking[0]:
+                ticks.append(None)
+                loop.call_soon(tick)
+
+        loop.call_soon(tick)
+        chunks = self.collect(RecurrenceTestModel.objects.aiter_occurrences(
+                                                            start=self.start,
+                                                            end=self.end,
+                                                            chunk_size=1000))
+        ticking[0] = False
+
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(len(chunks[0]), 54)
+        self.assertGreaterEqual(len(ticks), 23)
+
+
+class OccursAtTests(TestCase):
+
+    def test_occurs_at(self):
+        """Test checking if dates are occurrences of the recurrence."""
+        recurrence = Recurrence(dtstart=datetime(2013, 1, 1, 9), freq=WEEKLY,
+                                interval=2, byweekday=[0, 2],
+                                until=datetime(2013, 6, 1))
+        dates = recurrence.get_dates()
+
+        for dt in dates:
+            self.assertTrue(recurrence.occurs_at(dt))
+
+        self.assertFalse(recurrence.occurs_at(datetime(2013, 1, 7, 9)))
+        self.assertFalse(recurrence.occurs_at(datetime(2013, 1, 2, 10)))
+        self.assertFalse(recurrence.occurs_at(datetime(2013, 6, 3, 9)))
+
+    def test_occurs_at_count(self):
+        """Test dates after the count is reached aren't occurrences."""
+        recurrence = Recurrence(dtstart=datetime(2013, 1, 1), freq=MONTHLY,
+                                bymonthday=[1, 15], byhour=[8, 20], count=5)
+
+        self.assertTrue(recurrence.occurs_at(datetime(2013, 2, 1, 8)))
+        self.assertFalse(recurrence.occurs_at(datetime(2013, 2, 1, 20)))
+
+    def test_occurs_at_bysetpos(self):
+        """Test rules with bysetpos are checked by iterating the rule."""
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                 freq=MONTHLY, byweekday=[0, 1, 2, 3, 4],
+                                 bysetpos=[-1], end_date=datetime(2014, 1, 1))
+
+        self.assertTrue(tm.occurs_at(datetime(2013, 5, 31)))
+        self.assertFalse(tm.occurs_at(datetime(2013, 5, 30)))
+
+
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        super(InstrumentationTests, self).setUp()
+        self.reports = []
+        rule_expanded.connect(self.receiver)
+
+    def tearDown(self):
+        rule_expanded.disconnect(self.receiver)
+        super(InstrumentationTests, self).tearDown()
+
+    def receiver(self, sender, **kwargs):
+        self.reports.append(kwargs)
+
+    def test_get_dates_signal(self):
+        """Test the signal is sent when the dates are expanded."""
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1), freq=DAILY,
+                                 count=5)
+        tm.get_dates()
+        report = self.reports[-1]
+
+        self.assertEqual(report['operation'], 'get_dates')
+        self.assertEqual(report['fingerprint'],
+                         tm.get_recurrence().fingerprint())
+        self.assertEqual(report['freq'], DAILY)
+        self.assertEqual(report['occurrences'], 5)
+        self.assertEqual(report['engine'], Engine.DATEUTIL)
+        self.assertIsNone(report['exception'])
+        self.assertTrue(report['duration'] >= 0)
+
+    def test_swallowed_exception_reported(self):
+        """Test an exception building the rrule is reported."""
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1), freq=HOURLY,
+                                 interval=24, byhour=[1], count=5)
+
+        self.assertEqual(tm.get_dates(), [tm.start_date])
+        self.assertIsInstance(self.reports[-1]['exception'], ValueError)
+
+    @override_settings(RECURRENCES_COLLECT_STATS=True)
+    def test_stats_registry(self):
+        """Test the stats are collected in the registry."""
+        stats.registry.reset()
+        tm = RecurrenceTestModel(start_date=datetime(2013, 1, 1), freq=DAILY,
+                                 byweekday=[0, 1], byhour=[9, 17], count=10)
+        tm.get_dates()
+        tm.get_end_date_from_recurrence()
+        snapshot = stats.registry.snapshot()
+
+        self.assertEqual(snapshot['counters']['get_dates.calls'], 1)
+        self.assertEqual(snapshot['counters']['get_end_date.engine.dateutil'],
+                         1)
+        self.assertEqual(
+            snapshot['histograms']['get_dates.occurrences']['count'], 1)
+        self.assertTrue(snapshot['slowest'])
+
+
+class PackedRecurrenceTests(TestCase):
+
+    def test_packed_rrule(self):
+        """Test the rule values are stored in a single RRULE string."""
+        tm = PackedRecurrenceTestModel.objects.create(
+                                            start_date=datetime(2013, 1, 1),
+                                            freq=WEEKLY,
+                                            interval=2,
+                                            byweekday=[0, 2],
+                                            count=10)
+        tm = PackedRecurrenceTestModel.objects.get(id=tm.id)
+
+        self.assertEqual(tm.rrule,
+                         'FREQ=WEEKLY;INTERVAL=2;COUNT=10;BYDAY=MO,WE')
+        self.assertEqual(tm.freq, WEEKLY)
+        self.assertEqual(tm.byweekday, [0, 2])
+        self.assertEqual(tm.end_date, datetime(2013, 3, 11))
+
+    def test_same_api_as_fields(self):
+        """Test the packed mixin expands the same dates as the mixin that
+        stores each value in its own field.
+        """
+        kwargs = {'freq': MONTHLY, 'bymonthday': [1, -1], 'byhour': [9, 17],
+                  'count': 20}
+        packed = PackedRecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                           **kwargs)
+        fields = RecurrenceTestModel(start_date=datetime(2013, 1, 1),
+                                     **kwargs)
+
+        self.assertEqual(packed.get_recurrence().fingerprint(),
+                         fields.get_recurrence().fingerprint())
+        self.assertEqual(packed.get_dates(), fields.get_dates())
+        self.assertEqual(packed.get_end_date_from_recurrence(),
+                         fields.get_end_date_from_recurrence())
+
+    def test_set_recurrence(self):
+        """Test resetting the recurrence on packed objects."""
+        tm = PackedRecurrenceTestModel.objects.create(
+                                            start_date=datetime(2013, 1, 1),
+                                            freq=DAILY,
+                                            bymonth=[1, 2],
+                                            count=5)
+        PackedRecurrenceTestModel.objects.all().bulk_set_recurrence(
+                                            freq=WEEKLY,
+                                            start_date=datetime(2013, 2, 1),
+                                            byweekday=[4],
+                                            count=4)
+        tm = PackedRecurrenceTestModel.objects.get(id=tm.id)
+
+        self.assertEqual(tm.rrule, 'FREQ=WEEKLY;COUNT=4;BYDAY=FR')
+        self.assertIsNone(tm.bymonth)
+        self.assertEqual(tm.end_date, datetime(2013, 2, 22))
+
+
+class ParseRRuleStrTests(TestCase):
+
+    def test_unsupported_part(self):
+        """Test parts that aren't stored in the rule string, like UNTIL, raise
+        a ValueError instead of a KeyError.
+        """
+        with self.assertRaises(ValueError) as cm:
+            parse_rrule_str('FREQ=DAILY;UNTIL=20130101T000000')
+
+        self.assertIn('Unsupported RRULE part "UNTIL"', str(cm.exception))
+
+    def test_weekday_offset(self):
+        """Test weekdays with an offset raise a ValueError instead of being
+        parsed as -1.
+        """
+        with self.assertRaises(ValueError) as cm:
+            parse_rrule_str('FREQ=MONTHLY;BYDAY=1MO')
+
+        self.assertIn('Unsupported weekday "1MO"', str(cm.exception))
+
+        with self.assertRaises(ValueError):
+            parse_rrule_str('FREQ=WEEKLY;WKST=XX')
+
+
+class DayMaskTests(TestCase):
+
+    def test_day_masks(self):
+        """Test the masks include the values implied by the start date."""
+        tm = DayMaskRecurrenceTestModel.objects.create(
+                                            start_date=datetime(2013, 1, 31),
+                                            freq=MONTHLY,
+                                            count=5)
+        weekly = DayMaskRecurrenceTestModel.objects.create(
+                                            start_date=datetime(2013, 1, 31),
+                                            freq=WEEKLY,
+                                            bymonthday=[1, -1],
+                                            byweekday=[0, 4],
+                                            count=5)
+
+        self.assertEqual(tm.weekday_mask, 0)
+        self.assertEqual(tm.month_day_mask, 1 << 30)
+        self.assertEqual(weekly.weekday_mask, 0b10001)
+        self.assertEqual(weekly.month_day_mask, 1)
+        self.assertEqual(weekly.neg_month_day_mask, 1)
+
+    def test_could_occur_on(self):
+        """Test the objects that can't occur on a day are excluded."""
+        start_date = datetime(2013, 1, 1)
+        create = DayMaskRecurrenceTestModel.objects.create
+        daily = create(start_date=start_date, freq=DAILY, count=100)
+        mondays = create(start_date=start_date, freq=WEEKLY, byweekday=[0],
+                         count=20)
+        last_day = create(start_date=start_date, freq=MONTHLY,
+                          bymonthday=[-1], count=12)
+        create(start_date=start_date, freq=YEARLY, count=5)
+        single = create(start_date=datetime(2013, 1, 28, 15))
+        # Ended before the day
+        create(start_date=start_date, freq=DAILY, count=5)
+        # Jan 28th 2013 was a Monday
+        day = datetime(2013, 1, 28)
+
+        self.assertEqual(
+            set(DayMaskRecurrenceTestModel.objects.could_occur_on(day)),
+            set([daily, mondays, single])
+        )
+
+        # Jan 31st 2013 was a Thursday
+        self.assertEqual(
+            set(DayMaskRecurrenceTestModel.objects.could_occur_on(
+                                                    datetime(2013, 1, 31))),
+            set([daily, last_day])
+        )
+
+
+class SQLExpansionTests(TestCase):
+
+    def setUp(self):
+        create = RecurrenceTestModel.objects.create
+        self.every_other_day = create(start_date=datetime(2013, 1, 1, 9),
+                                      freq=DAILY, interval=2, count=10)
+        self.weekly = create(start_date=datetime(2012, 12, 5, 10),
+                             freq=WEEKLY, end_date=datetime(2013, 3, 1))
+        self.hourly = create(start_date=datetime(2013, 1, 3, 22, 30),
+                             freq=HOURLY, interval=3, count=4)
+        self.single = create(start_date=datetime(2013, 1, 4, 12))
+        # Expanded with rrule
+        self.monthly = create(start_date=datetime(2013, 1, 5), freq=MONTHLY,
+                              count=3)
+        self.weekdays = create(start_date=datetime(2013, 1, 1), freq=DAILY,
+                               byweekday=[0, 1, 2, 3, 4], count=5)
+        self.start = datetime(2013, 1, 2)
+        self.end = datetime(2013, 1, 9, 23, 59)
+
+    def test_occurrences_sql(self):
+        """Test the simple rules are expanded in the database."""
+        sql, params = RecurrenceTestModel.objects.occurrences_sql(
+                                                            start=self.start,
+                                                            end=self.end)
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        occurrences = sorted((object_id, parse_datetime(start))
+                             for object_id, start in cursor.fetchall())
+        expected = sorted((obj.id, dt)
+                          for obj in (self.every_other_day, self.weekly,
+                                      self.hourly, self.single)
+                          for dt in obj.get_dates(after=self.start,
+                                                  before=self.end))
+
+        self.assertEqual(len(occurrences), 11)
+        self.assertEqual(occurrences, expected)
+
+    def test_occurrences_sql_interval(self):
+        """Test a NULL interval is expanded like an interval of 1 and an
+        interval of 0 is left to rrule.
+        """
+        create = RecurrenceTestModel.objects.create
+        null_interval = create(start_date=datetime(2013, 1, 3), freq=DAILY,
+                               interval=None, count=5)
+        zero_interval = create(start_date=datetime(2013, 1, 3), freq=DAILY,
+                               interval=0)
+        sql, params = RecurrenceTestModel.objects.filter(
+                            id__in=[null_interval.id, zero_interval.id]
+                        ).occurrences_sql(start=self.start, end=self.end)
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        occurrences = sorted(parse_datetime(start)
+                             for object_id, start in cursor.fetchall())
+
+        self.assertEqual(len(occurrences), 5)
+        self.assertEqual(occurrences, null_interval.get_dates())
+        self.assertFalse(RecurrenceTestModel.objects.filter(
+                                                get_expandable_q()).filter(
+                                                id=zero_interval.id).exists())
+
+    def test_count_occurrences_by_day(self):
+        """Test counting the occurrences per day including the rules that
+        can't be expanded in the database.
+        """
+        counts = RecurrenceTestModel.objects.count_occurrences_by_day(
+                                                            start=self.start,
+                                                            end=self.end)
+        expected = {}
+
+        for obj in RecurrenceTestModel.objects.all():
+            for dt in obj.get_dates(after=self.start, before=self.end):
+                expected[dt.date()] = expected.get(dt.date(), 0) + 1
+
+        self.assertEqual(counts, sorted(expected.items()))
+        self.assertEqual(counts[0], (date(2013, 1, 2), 2))